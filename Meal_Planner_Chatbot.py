@@ -5,15 +5,17 @@ Version 2.0.0 - Direct Chat Interface (No Dialogflow)
 """
 
 import datetime
+import functools
+import hashlib
 import os
-import json
+import secrets
 import re
 import logging
+from io import BytesIO
 
-from flask import Flask, request, jsonify, send_file, render_template, send_from_directory
-from flask_compress import Compress
+from flask import Flask, request, jsonify, send_from_directory, redirect, abort, Response
 from flask_cors import CORS
-import requests
+from werkzeug.utils import secure_filename
 
 from reportlab.lib.pagesizes import letter
 from reportlab.lib.units import inch
@@ -21,24 +23,73 @@ from reportlab.lib.styles import ParagraphStyle
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image
 from reportlab.lib.enums import TA_CENTER, TA_JUSTIFY
 from reportlab.lib import colors
+from reportlab import rl_config
+from PIL import Image as PILImage
+
+from storage import get_storage
+from log_pipeline import redact
+from assets import asset_url, send_asset, render_cached
+from response_compression import compress_response
+from rate_limit import check_request as check_rate_limit, check_class as check_rate_limit_class, client_identity
+from prompt_builder import build_prompt
+from model_router import get_router
+from offline_engine import (generate_offline, is_simple_request, render_meal_plan, render_grocery_list, render_recipe,
+                            OFFLINE_FAST_PATH)
+from meal_solver import solve_for, InfeasiblePlan
+from nutrition import annotate_recipe
+from fast_path import INTENT_KEYWORDS, DIETS, WELCOME, respond as respond_fast
+from shared_cache import get_cache
+from exporters import DOC_TITLES
+from document import Item, Step, parse as parse_document
+import catalog
+import exporters
+import jobs
+import log_pipeline
+import memory
+import metrics
+import follow_ups
+import profiling
 
 # Configuration
 APP_VERSION = "2.0.0-Direct-Chat"
-OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+CONTENT_CACHE_TTL = int(os.getenv('CONTENT_CACHE_TTL', 3600))
+MAX_PLAN_DAYS = int(os.getenv('MAX_PLAN_DAYS', 30))  # longer requests get a plan of this many days
+PDF_LAYOUT_VERSION = 3  # part of the PDF cache key; bump when the layout changes
+PDF_IMAGE_DPI = int(os.getenv('PDF_IMAGE_DPI', 150))  # resolution images are embedded at
+# Alexa answers within ~8s: its generations go to the fast tier, and a spoken recipe needs no more than
+# the title, ingredients and first steps, so its output is cut before nutrition and tips
+ALEXA_TIER = 'fast'
+ALEXA_RECIPE_MAX_TOKENS = int(os.getenv('ALEXA_RECIPE_MAX_TOKENS', 450))
+GENERATION_UNAVAILABLE = "Content generation is temporarily unavailable. Please try again in a minute."
+JOB_QUEUED = "That's a big one! I'm working on it and will post it here when it's ready. ⏳"
+RESPONSE_HEADLINES = {
+    'recipe': "Here's your recipe! 🍳",
+    'meal_plan': "Here's your {days}-day meal plan! 📅",
+    'grocery_list': "Here's your grocery list! 🛒",
+}
 
 # Logging setup
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
+log_pipeline.configure()
 logger = logging.getLogger(__name__)
 
 # Flask app setup
 app = Flask(__name__, 
             static_folder='templates/static',
             static_url_path='/static')
-Compress(app)
 CORS(app)
+# First hook, so over-limit clients are turned away before any other work
+app.before_request(check_rate_limit)
+# after_request hooks run in reverse order: registered before compression so a profile includes it
+app.before_request(profiling.start_request)
+app.after_request(profiling.finish_request)
+app.teardown_request(profiling.end_request)
+app.before_request(memory.start_request)
+app.teardown_request(memory.end_request)
+app.after_request(compress_response)
+app.jinja_env.globals['asset_url'] = asset_url
+
+# Binary PDF streams: ReportLab's default ASCII85 encoding makes a second, larger copy of every image
+rl_config.useA85 = 0
 
 # Brand colors (Green/Fresh theme)
 BRAND_COLOR = colors.HexColor('#fe980a')  # Main
@@ -101,41 +152,228 @@ affiliate_links = {
 }
 
 
-def load_local_image(file_path):
-    """Load image from local file."""
-    if os.path.exists(file_path):
-        try:
-            with open(file_path, 'rb') as f:
-                return f.read()
-        except Exception as e:
-            logger.error(f"Error loading image {file_path}: {e}")
-    else:
+def _cache_key(namespace, *parts):
+    digest = hashlib.blake2b('\x00'.join(str(p) for p in parts).encode('utf-8'), digest_size=16).hexdigest()
+    return f"{namespace}:{digest}"
+
+
+@functools.lru_cache(maxsize=16)
+def _prepared_image(file_path, mtime_ns, pixels):
+    # JPEGs go into the PDF as they are; anything else is scaled down once per process
+    with PILImage.open(file_path) as image:
+        if image.format == 'JPEG':
+            return file_path
+        image.thumbnail(pixels)
+        out = BytesIO()
+        image.save(out, 'PNG')
+    return out.getvalue()
+
+
+def pdf_image(file_path, width, height):
+    """
+    Image flowable for a static image, or None if the file is missing.
+
+    Decoding the full-size logo on every render (plus its copies in the cache,
+    in BytesIO and ReportLab's ASCII85 stream) was most of a PDF's peak memory;
+    see memory.py --check.
+    """
+    try:
+        mtime_ns = os.stat(file_path).st_mtime_ns
+    except OSError:
         logger.warning(f"Image not found: {file_path}")
-    return None
+        return None
+    pixels = (round(width / inch * PDF_IMAGE_DPI), round(height / inch * PDF_IMAGE_DPI))
+    try:
+        source = _prepared_image(file_path, mtime_ns, pixels)
+    except Exception as e:
+        logger.error(f"Error loading image {file_path}: {e}")
+        return None
+    img = Image(BytesIO(source) if isinstance(source, bytes) else source, width=width, height=height)
+    img.hAlign = 'CENTER'
+    return img
 
 
 def call_openai(prompt):
-    """Call OpenAI API."""
-    logger.info(f"Calling OpenAI with prompt: {prompt[:100]}...")
+    """Generate a completion for a Prompt from prompt_builder via the model router."""
+    key = _cache_key('text', prompt.kind, prompt.version, prompt.tier, prompt.max_tokens, prompt.system, prompt.user)
+    cached = get_cache().get(key)
+    if cached is not None:
+        logger.info(f"Served {prompt!r} from the shared cache")
+        metrics.inc('content_cache_total', kind=prompt.kind, result='hit')
+        return cached.decode('utf-8')
+    metrics.inc('content_cache_total', kind=prompt.kind, result='miss')
+
+    logger.info(f"Calling model with {prompt!r}")
     try:
-        headers = {'Authorization': f'Bearer {OPENAI_API_KEY}'}
-        data = {
-            'model': 'gpt-4',
-            'messages': [
-                {'role': 'system', 'content': 'You are a professional nutritionist and chef specializing in healthy, delicious meals.'},
-                {'role': 'user', 'content': prompt}
-            ],
-            'max_tokens': 2000
-        }
-        response = requests.post('https://api.openai.com/v1/chat/completions', headers=headers, json=data)
-        response.raise_for_status()
-        
-        result = response.json()['choices'][0]['message']['content'].strip()
-        logger.info(f"OpenAI response received: {len(result)} characters")
+        result = get_router().complete(prompt)
+        logger.info(f"Model response received: {len(result)} characters")
+        if result:
+            get_cache().set(key, result.encode('utf-8'), ttl=CONTENT_CACHE_TTL)
         return result
     except Exception as e:
-        logger.error(f"OpenAI API error: {e}")
-        return f"Error generating content: {str(e)}"
+        logger.error(f"Model API error: {e}")
+        return None
+
+
+def generate_content(kind, message, params, fast_path=True, tier=None, max_tokens=None):
+    """
+    Generate content for kind, using the offline engine for simple requests and outages.
+
+    tier and max_tokens override the model tier and output budget (see build_prompt).
+    """
+    if fast_path and OFFLINE_FAST_PATH and is_simple_request(message, params):
+        content = generate_offline(kind, message, params)
+        if content:
+            logger.info(f"Served {kind} from offline engine (simple request)")
+            return content
+
+    content = call_openai(build_prompt(kind, message, params, tier=tier, max_tokens=max_tokens))
+    if content is None:
+        logger.warning(f"Model unavailable, falling back to offline engine for {kind}")
+        content = generate_offline(kind, message, params)
+    return content
+
+
+def generate_meal_plan(message, params, fast_path=True, tier=None):
+    """
+    Choose the meals with the constraint solver and let the model write only the prose.
+
+    The solver loosens constraints it cannot meet and the rendered plan says
+    which; only when even that fails is the whole plan left to the model.
+    tier overrides the model tier of both. Returns (content, solved MealPlan or None).
+    """
+    try:
+        plan = solve_for(params)
+    except Exception as e:
+        # InfeasiblePlan, or the solver failing outright: either way the model writes the plan
+        if not isinstance(e, InfeasiblePlan):
+            logger.exception("Meal plan solver failed")
+        logger.warning(f"Meal plan solver: {e}; asking the model for the whole plan")
+        # The dataset rotation would not meet the constraints either, so skip the fast path
+        return generate_content('meal_plan', message, params, fast_path=False, tier=tier), None
+
+    notes = None
+    if not (fast_path and OFFLINE_FAST_PATH and is_simple_request(message, params)):
+        notes = call_openai(build_prompt('meal_plan_notes', message, dict(params, plan=plan.summary()), tier=tier))
+    return render_meal_plan(plan.days, params, portions=plan.portions, notes=notes, relaxed=plan.relaxed), plan
+
+
+def generate_artifact(message, params, fast_path=True):
+    """
+    Generate the content a chat request asks for.
+
+    Returns (content, doc_type, name, headline, solved MealPlan or None);
+    content is None when generation is unavailable. fast_path=False has the
+    model write even simple requests (see catalog.refresh).
+    """
+    timestamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    kind = params['type']
+    if kind == 'recipe':
+        # Generate recipe - just use the user's original message
+        content = generate_content('recipe', message, params, fast_path)
+        if content is not None:
+            content = annotate_recipe(content, params['servings'])
+        return content, kind, f"recipe-{timestamp}", RESPONSE_HEADLINES[kind], None
+    if kind == 'meal_plan':
+        days = params['days'] or 7
+        content, plan = generate_meal_plan(message, dict(params, days=days), fast_path)
+        return (content, kind, f"meal-plan-{days}days-{timestamp}",
+                RESPONSE_HEADLINES[kind].format(days=days), plan)
+    content = generate_content('grocery_list', message, params, fast_path)
+    return content, kind, f"grocery-list-{timestamp}", RESPONSE_HEADLINES[kind], None
+
+
+def artifact_response(content, doc_type, name, headline):
+    """Store content for its exports and build the chat response linking to them."""
+    # The random part keeps concurrent requests apart and download names unguessable
+    stem = f"{name}-{secrets.token_hex(4)}"
+    document = parse_document(content, doc_type)
+    response = {
+        'response': headline,
+        'content': document.preview(),
+        'pdf_url': None,
+    }
+    try:
+        exporters.save_source(stem, content, document)
+    except Exception as e:
+        logger.error(f"Could not store content for {stem}: {e}")
+        return response
+    # The PDF itself is rendered on its first download (see download_pdf)
+    response['exports'] = exporters.export_urls(stem, doc_type)
+    response['pdf_url'] = response['exports']['pdf']
+    return response
+
+
+def ensure_pdf(filename):
+    """Render a PDF from its stored content record unless it is already in storage."""
+    cache = get_cache()
+    marker = f"pdf-stored:{filename}"
+    if cache.get(marker) is not None or get_storage().exists(filename):
+        cache.set(marker, b'1', ttl=CONTENT_CACHE_TTL)
+        return True
+    source = exporters.load_source(os.path.splitext(filename)[0])
+    if source is None or not create_branded_pdf(source['content'], filename, doc_type=source['doc_type'],
+                                                document=source['document']):
+        return False
+    metrics.inc('pdf_lazy_renders_total', doc_type=source['doc_type'])
+    cache.set(marker, b'1', ttl=CONTENT_CACHE_TTL)
+    return True
+
+
+def build_follow_up(artifact, days, params):
+    """Produce a follow-up to a served meal plan (see follow_ups.resolve) as a chat response."""
+    timestamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    if artifact == 'grocery_list':
+        # Exactly what the plan needs, straight from its recipes
+        content = render_grocery_list(days, params)
+        return artifact_response(content, 'grocery_list', f"grocery-list-{len(days)}days-{timestamp}",
+                                 RESPONSE_HEADLINES['grocery_list'])
+
+    _, day, meal = artifact.split(':')
+    # The plan's own recipe from the dataset, with computed nutrition; no model call
+    content = render_recipe(days[int(day) - 1][meal], params.get('servings') or 4)
+    return artifact_response(content, 'recipe', f"recipe-day{day}-{meal}-{timestamp}",
+                             RESPONSE_HEADLINES['recipe'])
+
+
+follow_ups.configure(build_follow_up)
+
+
+def run_chat_job(job):
+    """
+    A queued chat request (see jobs.py), checkpointed after the model text,
+    the content record and the PDF, so a retry resumes where the last attempt
+    stopped.
+    """
+    message, params, session = job.payload['message'], job.payload['params'], job.payload['session']
+
+    def generate():
+        content, doc_type, name, headline, plan = generate_artifact(message, params)
+        if content is None:
+            raise RuntimeError(GENERATION_UNAVAILABLE)
+        if plan is not None:
+            # Follow-ups ("grocery list", "day 2 dinner") refer to this plan
+            follow_ups.remember_plan(session, plan.days, dict(params, days=len(plan.days)))
+        return {'content': content, 'doc_type': doc_type, 'name': name, 'headline': headline}
+
+    def store():
+        response = artifact_response(**generated)
+        if response['pdf_url'] is None:
+            raise RuntimeError("could not store the content record")
+        return response
+
+    def render_pdf():
+        if not ensure_pdf(response['pdf_url'].rsplit('/', 1)[1]):
+            raise RuntimeError("PDF rendering failed")
+        return True
+
+    generated = job.stage('generate', generate, progress=0.7)
+    response = job.stage('store', store, progress=0.8)
+    job.stage('pdf', render_pdf, progress=1.0)
+    return response
+
+
+jobs.register('chat', run_chat_job)
 
 
 def clean_text_for_pdf(text):
@@ -161,22 +399,21 @@ def extract_parameters(message):
         'cuisine': None,
         'dietary': None,
         'servings': 4,
-        'budget': 'moderate'
+        'budget': 'moderate',
+        'calories': None
     }
     
     # Detect intent
-    if any(word in message_lower for word in ['recipe', 'cook', 'make', 'prepare', 'how to make', 'how do i make']):
-        params['type'] = 'recipe'
-    elif any(word in message_lower for word in ['meal plan', 'weekly plan', 'day plan', 'meal schedule']):
-        params['type'] = 'meal_plan'
-    elif any(word in message_lower for word in ['grocery', 'shopping', 'shopping list', 'ingredients list']):
-        params['type'] = 'grocery_list'
+    for kind, words in INTENT_KEYWORDS.items():
+        if any(word in message_lower for word in words):
+            params['type'] = kind
+            break
     
     # Extract number of days
     import re
     day_match = re.search(r'(\d+)\s*day', message_lower)
     if day_match:
-        params['days'] = int(day_match.group(1))
+        params['days'] = min(int(day_match.group(1)), MAX_PLAN_DAYS)
     
     # Extract cuisine
     cuisines = ['italian', 'mexican', 'chinese', 'japanese', 'indian', 'thai', 'mediterranean', 
@@ -187,9 +424,7 @@ def extract_parameters(message):
             break
     
     # Extract dietary preferences (including kosher and halal)
-    diets = ['vegan', 'vegetarian', 'keto', 'paleo', 'gluten-free', 'dairy-free', 'low-carb', 
-             'high-protein', 'kosher', 'halal', 'pescatarian', 'whole30']
-    for diet in diets:
+    for diet in DIETS:
         if diet in message_lower or diet.replace('-', ' ') in message_lower:
             params['dietary'] = diet
             break
@@ -199,15 +434,37 @@ def extract_parameters(message):
     if serving_match:
         params['servings'] = int(serving_match.group(1))
     
+    # Extract daily calorie target
+    calorie_match = re.search(r'(\d{3,4})\s*-?\s*(?:kcal|cal\b|calorie)', message_lower)
+    if calorie_match:
+        params['calories'] = int(calorie_match.group(1))
+    
+    # Extract budget level
+    if any(word in message_lower for word in ['premium', 'gourmet', 'splurge', 'luxury', 'no budget']):
+        params['budget'] = 'high'
+    elif any(word in message_lower for word in ['cheap', 'budget', 'affordable', 'inexpensive', 'low cost', 'low-cost', 'frugal']):
+        params['budget'] = 'low'
+    
     return params
 
 
-def create_branded_pdf(content, filename, doc_type="recipe"):
-    """Create branded PDF with logo, banners, and affiliate links."""
+def create_branded_pdf(content, filename, doc_type="recipe", document=None):
+    """Create branded PDF with logo, banners, and affiliate links (from document when already parsed)."""
     try:
-        pdf_dir = "/tmp/meal-pdfs"
-        os.makedirs(pdf_dir, exist_ok=True)
-        pdf_path = os.path.join(pdf_dir, filename)
+        storage = get_storage()
+        pdf_path = storage.scratch_path(filename)
+
+        # Same content renders to the same PDF, so any worker's earlier render can be reused
+        cache_key = _cache_key('pdf', APP_VERSION, PDF_LAYOUT_VERSION, doc_type, content)
+        cached = get_cache().get(cache_key)
+        if cached is not None:
+            with open(pdf_path, 'wb') as f:
+                f.write(cached)
+            storage.save_file(filename, pdf_path)
+            metrics.inc('pdf_cache_total', result='hit')
+            logger.info(f"PDF created from cache: {filename}")
+            return filename
+        metrics.inc('pdf_cache_total', result='miss')
         
         doc = SimpleDocTemplate(pdf_path, pagesize=letter, topMargin=0.5*inch, bottomMargin=0.5*inch)
         story = []
@@ -249,11 +506,8 @@ def create_branded_pdf(content, filename, doc_type="recipe"):
         )
         
         # Logo
-        logo_data = load_local_image(LOGO_PATH)
-        if logo_data:
-            from io import BytesIO
-            logo_img = Image(BytesIO(logo_data), width=1.5*inch, height=1.5*inch)
-            logo_img.hAlign = 'CENTER'
+        logo_img = pdf_image(LOGO_PATH, 1.5*inch, 1.5*inch)
+        if logo_img:
             story.append(logo_img)
             story.append(Spacer(1, 0.2 * inch))
         
@@ -261,21 +515,13 @@ def create_branded_pdf(content, filename, doc_type="recipe"):
         story.append(Paragraph("Healthy Eating Guru", title_style))
         
         # Subtitle
-        doc_titles = {
-            "recipe": "Delicious & Nutritious Recipe",
-            "meal_plan": "Your Personalized Meal Plan",
-            "grocery_list": "Smart Shopping List"
-        }
-        story.append(Paragraph(doc_titles.get(doc_type, "Healthy Recipe"), subtitle_style))
+        story.append(Paragraph(DOC_TITLES.get(doc_type, "Healthy Recipe"), subtitle_style))
         story.append(Spacer(1, 0.3 * inch))  # Increased from 0.3 inch for better spacing
         
         # First banner
         banner = BANNER_ADS[0]
-        img_data = load_local_image(banner['path'])
-        if img_data:
-            from io import BytesIO
-            img = Image(BytesIO(img_data), width=6*inch, height=1.5*inch)
-            img.hAlign = 'CENTER'
+        img = pdf_image(banner['path'], 6*inch, 1.5*inch)
+        if img:
             story.append(img)
             story.append(Spacer(1, 0.1 * inch))
             link_para = Paragraph(f'<a href="{banner["link"]}">{banner["alt"]}</a>', 
@@ -284,35 +530,34 @@ def create_branded_pdf(content, filename, doc_type="recipe"):
             story.append(Spacer(1, 0.3 * inch))
         
         # Content
-        sections = content.split('\n\n')
+        if document is None:
+            document = parse_document(content, doc_type)
+        if document.title:
+            story.append(Paragraph(clean_text_for_pdf(document.title), section_title_style))
+            story.append(Spacer(1, 0.08 * inch))
         banner_idx = 1
         
-        for section in sections:
-            if not section.strip():
-                continue
+        for section in document.sections:
+            if section.heading is not None:
+                story.append(Paragraph(clean_text_for_pdf(section.heading), section_title_style))
+                story.append(Spacer(1, 0.08 * inch))
             
-            lines = section.split('\n')
-            for line in lines:
-                if not line.strip():
-                    continue
-                
-                line_clean = clean_text_for_pdf(line)
-                
-                if line.strip().endswith(':') or line.strip().startswith('###'):
-                    story.append(Paragraph(line_clean, section_title_style))
+            for node in section.nodes:
+                if isinstance(node, Step):
+                    text = f"{node.number}. {node.text}"
+                elif isinstance(node, Item):
+                    text = f"• {node.text}"
                 else:
-                    story.append(Paragraph(line_clean, normal_style))
+                    text = node.text
+                story.append(Paragraph(clean_text_for_pdf(text), normal_style))
                 story.append(Spacer(1, 0.08 * inch))
             
             # Add banner every few sections
             if banner_idx < len(BANNER_ADS) and len(story) > 30:
                 story.append(Spacer(1, 0.3 * inch))
                 banner = BANNER_ADS[banner_idx]
-                img_data = load_local_image(banner['path'])
-                if img_data:
-                    from io import BytesIO
-                    img = Image(BytesIO(img_data), width=6*inch, height=1.5*inch)
-                    img.hAlign = 'CENTER'
+                img = pdf_image(banner['path'], 6*inch, 1.5*inch)
+                if img:
                     story.append(img)
                     story.append(Spacer(1, 0.05 * inch))
                     link_para = Paragraph(f'<a href="{banner["link"]}">{banner["alt"]}</a>', 
@@ -340,8 +585,11 @@ def create_branded_pdf(content, filename, doc_type="recipe"):
             story.append(Spacer(1, 0.08 * inch))
         
         doc.build(story)
-        logger.info(f"PDF created: {pdf_path}")
-        return pdf_path
+        with open(pdf_path, 'rb') as f:
+            get_cache().set(cache_key, f.read())
+        storage.save_file(filename, pdf_path)
+        logger.info(f"PDF created: {filename}")
+        return filename
     except Exception as e:
         logger.error(f"Error creating PDF: {e}")
         logger.exception(e)
@@ -351,134 +599,78 @@ def create_branded_pdf(content, filename, doc_type="recipe"):
 @app.route('/')
 def index():
     """Main chat interface."""
-    return render_template('index.html', version=APP_VERSION)
+    return render_cached('index.html', version=APP_VERSION)
 
 
 @app.route('/chat', methods=['POST'])
 def chat():
     """Handle chat messages."""
+    # Greetings, empty messages and easy questions are answered before any parsing
+    fast = respond_fast()
+    if fast is not None:
+        return fast
+
     try:
         data = request.get_json()
         message = data.get('message', '')
         
-        logger.info(f"Chat: {message}")
+        logger.info(f"Chat: {redact(message)}")
         
         # Extract parameters
         params = extract_parameters(message)
         logger.info(f"Parameters: {params}")
         
-        # Determine what to generate
-        if params['type'] == 'recipe':
-            # Generate recipe - just use the user's original message
-            prompt = f"Create a detailed, professional recipe based on this request: '{message}'\n\n"
-            
-            if params['cuisine']:
-                prompt += f"Cuisine style: {params['cuisine']}\n"
-            if params['dietary']:
-                prompt += f"Dietary requirement: {params['dietary']} (follow all {params['dietary']} rules strictly)\n"
-            prompt += f"Servings: {params['servings']}\n\n"
-            prompt += """Format:
-**Recipe Name:**
-
-**Ingredients:**
-(List with measurements)
-
-**Instructions:**
-(Step-by-step numbered)
-
-**Nutrition Information:**
-(Per serving)
-
-**Chef's Tips:**
-(Pro tips)"""
-            
-            content = call_openai(prompt)
-            
-            # Create PDF
-            timestamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
-            filename = f"recipe-{timestamp}.pdf"
-            pdf_path = create_branded_pdf(content, filename, doc_type="recipe")
-            
-            response = {
-                'response': "Here's your recipe! 🍳",
-                'content': content[:500] + "..." if len(content) > 500 else content,
-                'pdf_url': f'/download/{filename}' if pdf_path else None
-            }
-            
-        elif params['type'] == 'meal_plan':
-            # Generate meal plan
-            days = params['days'] or 7
-            
-            prompt = f"Create a detailed {days}-day meal plan.\n\n"
-            if params['cuisine']:
-                prompt += f"Cuisine preference: {params['cuisine']}\n"
-            if params['dietary']:
-                prompt += f"Dietary preference: {params['dietary']}\n"
-            prompt += f"Budget: {params['budget']}\n\n"
-            prompt += f"""Format each day clearly:
-
-### Day X
-**Breakfast:**
-**Lunch:**
-**Dinner:**
-
-Include nutritional highlights and prep tips."""
-            
-            content = call_openai(prompt)
-            
-            # Create PDF
-            timestamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
-            filename = f"meal-plan-{days}days-{timestamp}.pdf"
-            pdf_path = create_branded_pdf(content, filename, doc_type="meal_plan")
-            
-            response = {
-                'response': f"Here's your {days}-day meal plan! 📅",
-                'content': content[:500] + "..." if len(content) > 500 else content,
-                'pdf_url': f'/download/{filename}' if pdf_path else None
-            }
-            
-        elif params['type'] == 'grocery_list':
-            # Generate grocery list
-            prompt = f"Generate a complete grocery shopping list.\n\n"
-            if params['dietary']:
-                prompt += f"Dietary preference: {params['dietary']}\n"
-            prompt += f"Servings: {params['servings']} people\n"
-            prompt += f"Budget: {params['budget']}\n\n"
-            prompt += """Format by category:
-
-**Fresh Produce:**
-**Proteins:**
-**Dairy:**
-**Pantry Staples:**
-**Spices & Seasonings:**
-
-Include quantities and budget tips."""
-            
-            content = call_openai(prompt)
-            
-            # Create PDF
-            timestamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
-            filename = f"grocery-list-{timestamp}.pdf"
-            pdf_path = create_branded_pdf(content, filename, doc_type="grocery_list")
-            
-            response = {
-                'response': "Here's your grocery list! 🛒",
-                'content': content[:500] + "..." if len(content) > 500 else content,
-                'pdf_url': f'/download/{filename}' if pdf_path else None
-            }
-            
-        else:
+        # Follow-ups to a meal plan ("grocery list", "day 2 dinner") refer to that plan
+        session = follow_ups.session_id()
+        plan = follow_ups.plan_for(session)
+        artifact = follow_ups.resolve(plan, message, params) if plan else None
+        if artifact:
+            response = follow_ups.build(plan, artifact)
+            if response is None:
+                return jsonify({'error': GENERATION_UNAVAILABLE}), 503
+            return jsonify(response)
+
+        # Popular simple requests are served from the precomputed catalog
+        if is_simple_request(message, params):
+            catalog.record_request(params)
+            entry = catalog.lookup(params)
+            if entry:
+                response = {
+                    'response': RESPONSE_HEADLINES[params['type']].format(days=entry['params'].get('days')),
+                    'content': parse_document(entry['content'], params['type']).preview(),
+                    'pdf_url': f"/download/{entry['pdf_key']}" if entry['pdf_key'] else None
+                }
+                if entry['pdf_key']:
+                    response['exports'] = exporters.export_urls(os.path.splitext(entry['pdf_key'])[0], params['type'])
+                if entry['plan']:
+                    follow_ups.remember_plan(session, entry['plan'], dict(params, days=len(entry['plan'])))
+                return jsonify(response)
+        
+        if params['type'] not in RESPONSE_HEADLINES:
             # General response
-            response = {
-                'response': """Welcome to Healthy Eating Guru! 🥗
-
-I can help you with:
-• **Recipes** - "Recipe with chicken and vegetables"
-• **Meal Plans** - "Create a 7-day vegan meal plan"
-• **Grocery Lists** - "Generate grocery list for 4 people"
-
-What would you like today?"""
-            }
+            return jsonify({'response': WELCOME})
+
+        # Only requests that generate count against the (smaller) generate budget
+        limited = check_rate_limit_class('generate')
+        if limited is not None:
+            return limited
+
+        # Long plans run on a job worker; the client polls the job URL
+        if jobs.should_queue(params, data):
+            idempotency_key = request.headers.get('Idempotency-Key')
+            # Keys are scoped to the session, or to the client when there is none
+            scope = session or ':'.join(client_identity()[:2])
+            job_id = jobs.enqueue('chat', {'message': message, 'params': params, 'session': session},
+                                  f"{scope}:{idempotency_key}" if idempotency_key else None)
+            return jsonify({'response': JOB_QUEUED, 'job_id': job_id, 'job_url': f"/jobs/{job_id}"}), 202
+
+        content, doc_type, name, headline, plan = generate_artifact(message, params)
+        if content is None:
+            return jsonify({'error': GENERATION_UNAVAILABLE}), 503
+        response = artifact_response(content, doc_type, name, headline)
+        if plan is not None:
+            # Follow-ups ("grocery list", "day 2 dinner") refer to this plan
+            follow_ups.remember_plan(session, plan.days, dict(params, days=len(plan.days)))
         
         return jsonify(response)
         
@@ -490,10 +682,6 @@ What would you like today?"""
 from flask import request, jsonify
 import time
 
-def call_openai_alexa(prompt: str) -> str:
-    # Keep this simple: match your existing signature
-    return call_openai(prompt)
-
 @app.route('/alexa', methods=['POST'])
 def alexa():
     """
@@ -508,7 +696,7 @@ def alexa():
         if not message:
             return jsonify({"response": "Tell me what you want, like: recipe for grilled chicken."}), 400
 
-        logger.info(f"[ALEXA] Chat: {message}")
+        logger.info(f"[ALEXA] Chat: {redact(message)}")
 
         params = extract_parameters(message)
         logger.info(f"[ALEXA] Parameters: {params}")
@@ -516,50 +704,27 @@ def alexa():
         # Force "fast" behavior
         start = time.time()
 
+        # Content in chat's format from the fast tier, summarized for voice from its document
         if params['type'] == 'recipe':
-            prompt = f"""
-You are a voice assistant. Create a QUICK, speakable recipe for: "{message}"
-
-Rules:
-- Keep it short.
-- No markdown.
-- Ingredients: max 8 items.
-- Steps: max 6 short steps.
-- Include: total time + servings.
-- End by asking: "Want the full detailed version in the app?"
-"""
-            content = call_openai_alexa(prompt)  # separate OpenAI helper for Alexa
-            speech = content.strip()
+            content = generate_content('recipe', message, params, tier=ALEXA_TIER, max_tokens=ALEXA_RECIPE_MAX_TOKENS)
+            speech = parse_document(content, 'recipe').speech() if content else None
 
         elif params['type'] == 'meal_plan':
             days = params['days'] or 7
-            prompt = f"""
-You are a voice assistant. Create a QUICK {days}-day meal plan for: "{message}"
-
-Rules:
-- Keep it short.
-- For each day, give Breakfast/Lunch/Dinner with very short titles.
-- No long explanations.
-- End by asking: "Want the full detailed plan in the app?"
-"""
-            speech = call_openai_alexa(prompt).strip()
+            content, _ = generate_meal_plan(message, dict(params, days=days), tier=ALEXA_TIER)
+            speech = parse_document(content, 'meal_plan').speech() if content else None
 
         elif params['type'] == 'grocery_list':
-            prompt = f"""
-You are a voice assistant. Create a QUICK grocery list for: "{message}"
-
-Rules:
-- Group into: Produce, Proteins, Pantry, Dairy/Alt, Spices.
-- Max 6 items per group.
-- No markdown.
-- End by asking: "Want the full detailed list in the app?"
-"""
-            speech = call_openai_alexa(prompt).strip()
+            content = generate_content('grocery_list', message, params, tier=ALEXA_TIER)
+            speech = parse_document(content, 'grocery_list').speech() if content else None
 
         else:
             speech = ("I can help with recipes, meal plans, or grocery lists. "
                       "Try: recipe for chicken alfredo, or create a 7 day vegan meal plan.")
 
+        if speech is None:
+            speech = "Sorry, I can't put that together right now. Please try again in a minute."
+
         elapsed = time.time() - start
         logger.info(f"[ALEXA] Completed in {elapsed:.2f}s")
 
@@ -577,9 +742,84 @@ Rules:
 
 @app.route('/download/<filename>')
 def download_pdf(filename):
-    """Download PDF file."""
-    pdf_dir = "/tmp/meal-pdfs"
-    return send_file(os.path.join(pdf_dir, filename), as_attachment=True)
+    """Download an export; PDFs are rendered on first download (presigned redirect when in object storage)."""
+    if filename != secure_filename(filename):
+        abort(404)
+    stem, ext = os.path.splitext(filename)
+    fmt = ext[1:]
+    if fmt in exporters.FORMATS:
+        source = exporters.load_source(stem)
+        body = exporters.render(fmt, source, stem) if source else None
+        if body is None:
+            abort(404)
+        return Response(body, content_type=exporters.FORMATS[fmt],
+                        headers={'Content-Disposition': exporters.content_disposition(fmt, filename)})
+    if fmt != 'pdf' or not ensure_pdf(filename):
+        abort(404)
+    storage = get_storage()
+    url = storage.download_url(filename)
+    if url:
+        return redirect(url)
+    return send_from_directory(storage.root, filename, as_attachment=True)
+
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Progress of a queued chat request, and its chat response once done."""
+    status = jobs.status(job_id)
+    if status is None:
+        abort(404)
+    return jsonify(status)
+
+
+@app.route('/catalog/stats')
+def catalog_stats():
+    """Catalog freshness and hit-rate statistics."""
+    return jsonify(catalog.stats())
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus metrics."""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/admin/profiles')
+def list_profiles():
+    """Captured profiles and sampler output (needs X-Profile-Token)."""
+    if not profiling.authorized():
+        abort(404)
+    return jsonify(profiling.list_profiles())
+
+
+@app.route('/admin/profiles/<name>')
+def get_profile(name):
+    """One profile file: .txt / .prof from cProfile, .collapsed stacks from sampling."""
+    if not profiling.authorized() or name != secure_filename(name):
+        abort(404)
+    binary = name.endswith('.prof')
+    return send_from_directory(profiling.PROFILE_DIR, name, as_attachment=binary,
+                               mimetype='application/octet-stream' if binary else 'text/plain')
+
+
+@app.route('/admin/profiles/sampler', methods=['POST'])
+def start_profile_sampler():
+    """Turn on the background stack sampler of every worker for a window of seconds."""
+    if not profiling.authorized():
+        abort(404)
+    seconds = (request.get_json(silent=True) or {}).get('seconds', 300)
+    if not isinstance(seconds, (int, float)):
+        return jsonify({'error': "seconds must be a number"}), 400
+    until = profiling.enable_sampler(seconds)
+    return jsonify({'sampling_until': datetime.datetime.fromtimestamp(until).isoformat(timespec='seconds')})
+
+
+@app.route('/admin/memory')
+def memory_report():
+    """RSS and, with MEMORY_AUDIT=1, traced memory per endpoint of the worker serving this (needs X-Profile-Token)."""
+    if not profiling.authorized():
+        abort(404)
+    return jsonify(memory.report())
 
 
 @app.route('/static/<path:filename>')
@@ -588,6 +828,12 @@ def serve_static(filename):
     return send_from_directory(app.static_folder, filename)
 
 
+@app.route('/static/dist/<path:filename>')
+def serve_asset(filename):
+    """Serve fingerprinted build output (precompressed, immutable)."""
+    return send_asset(filename)
+
+
 def validate_assets():
     """Validate required assets."""
     logger.info("Validating assets...")
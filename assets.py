@@ -0,0 +1,223 @@
+"""
+Static asset pipeline.
+
+Build step (run once per deploy, see railway.json):
+    python assets.py build
+
+For every file under templates/static (except dist/ itself) the build
+- minifies CSS and JS
+- fingerprints the name with a content hash (css/chat.css -> dist/css/chat.1a2b3c4d5e6f.css)
+- precompresses text assets to .gz and .br (brotli when installed) so no
+  compression work happens per request
+- writes dist/manifest.json mapping source names to built files
+
+At runtime asset_url() (a Jinja global) returns the fingerprinted URL, and
+send_asset() serves the best precompressed variant with immutable cache
+headers. Without a build, asset_url() falls back to the plain source file so a
+fresh checkout still works.
+
+Pages rendered through render_cached() are rendered once per process and
+served with an ETag and a short public max-age, so browsers and CDNs revalidate
+instead of refetching.
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import re
+import shutil
+
+from flask import Response, render_template, request, send_from_directory
+
+try:
+    import brotli
+except ImportError:  # .br variants are skipped without it
+    brotli = None
+
+# Optional real minifiers; conservative built-in fallbacks otherwise
+try:
+    import rcssmin
+except ImportError:
+    rcssmin = None
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+logger = logging.getLogger(__name__)
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates', 'static')
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+MANIFEST_PATH = os.path.join(DIST_DIR, 'manifest.json')
+
+COMPRESSIBLE = {'.css', '.js', '.svg', '.json', '.html', '.txt'}
+MIN_COMPRESS_BYTES = 256
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+PAGE_MAX_AGE = int(os.getenv('PAGE_MAX_AGE', 300))
+
+# Preferred first
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def minify_css(text):
+    """Strip comments and whitespace that CSS does not need."""
+    if rcssmin is not None:
+        return rcssmin.cssmin(text)
+    text = re.sub(r'/\*.*?\*/', '', text, flags=re.S)
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'\s*([{};,>])\s*', r'\1', text)
+    text = re.sub(r':\s+', ':', text)
+    return text.replace(';}', '}').strip()
+
+
+def minify_js(text):
+    """
+    Minify JS with rjsmin when installed.
+
+    The fallback is deliberately conservative (indentation, blank lines and
+    whole-line // comments only) so it can never change behavior.
+    """
+    if rjsmin is not None:
+        return rjsmin.jsmin(text)
+    lines = (line.strip() for line in text.splitlines())
+    return '\n'.join(line for line in lines if line and not line.startswith('//')) + '\n'
+
+
+MINIFIERS = {'.css': minify_css, '.js': minify_js}
+
+
+def fingerprint(name, data):
+    root, ext = os.path.splitext(name)
+    return f"{root}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+
+
+def _sources():
+    for dirpath, dirnames, filenames in os.walk(STATIC_DIR):
+        dirnames[:] = [d for d in dirnames if os.path.join(dirpath, d) != DIST_DIR]
+        for filename in sorted(filenames):
+            path = os.path.join(dirpath, filename)
+            yield os.path.relpath(path, STATIC_DIR).replace(os.sep, '/'), path
+
+
+def build():
+    """Build dist/ and its manifest from the static sources; returns the manifest."""
+    shutil.rmtree(DIST_DIR, ignore_errors=True)
+    assets = {}
+    for name, path in _sources():
+        with open(path, 'rb') as f:
+            data = f.read()
+        ext = os.path.splitext(name)[1].lower()
+        if ext in MINIFIERS:
+            data = MINIFIERS[ext](data.decode('utf-8')).encode('utf-8')
+
+        built = 'dist/' + fingerprint(name, data)
+        target = os.path.join(STATIC_DIR, built)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, 'wb') as f:
+            f.write(data)
+
+        encodings = []
+        if ext in COMPRESSIBLE and len(data) >= MIN_COMPRESS_BYTES:
+            variants = {'gzip': gzip.compress(data, compresslevel=9, mtime=0)}
+            if brotli is not None:
+                variants['br'] = brotli.compress(data, quality=11)
+            for encoding, suffix in ENCODINGS:
+                compressed = variants.get(encoding)
+                if compressed and len(compressed) < len(data):
+                    with open(target + suffix, 'wb') as f:
+                        f.write(compressed)
+                    encodings.append(encoding)
+
+        assets[name] = {'path': built, 'size': len(data), 'encodings': encodings}
+        logger.info(f"Built {name} -> {built} ({len(data)} bytes, {', '.join(encodings) or 'uncompressed'})")
+
+    manifest = {'version': hashlib.sha256(json.dumps(assets, sort_keys=True).encode()).hexdigest()[:12],
+                'assets': assets}
+    os.makedirs(DIST_DIR, exist_ok=True)
+    with open(MANIFEST_PATH, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+_manifest = None
+
+
+def get_manifest():
+    """The build manifest ({} entries when assets have not been built)."""
+    global _manifest
+    if _manifest is None:
+        try:
+            with open(MANIFEST_PATH, encoding='utf-8') as f:
+                _manifest = json.load(f)
+        except FileNotFoundError:
+            logger.warning("Static assets not built (python assets.py build); serving sources")
+            _manifest = {'version': 'dev', 'assets': {}}
+        _manifest['by_path'] = {entry['path'][len('dist/'):]: entry for entry in _manifest['assets'].values()}
+    return _manifest
+
+
+def asset_url(name):
+    """URL of a static asset, fingerprinted when built."""
+    entry = get_manifest()['assets'].get(name)
+    return f"/static/{entry['path'] if entry else name}"
+
+
+def send_asset(filename):
+    """Serve a built asset, precompressed when the client accepts it, cached forever."""
+    entry = get_manifest()['by_path'].get(filename)
+    if entry is None:
+        return Response('Not found', status=404, mimetype='text/plain')
+
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    served, encoding = filename, None
+    for candidate, suffix in ENCODINGS:
+        if candidate in entry['encodings'] and request.accept_encodings[candidate]:
+            served, encoding = filename + suffix, candidate
+            break
+
+    response = send_from_directory(DIST_DIR, served, mimetype=mimetype, max_age=IMMUTABLE_MAX_AGE)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+_pages = {}
+
+
+def render_cached(template, **context):
+    """Render a template once per process and serve it with an ETag and a short public max-age."""
+    key = (template, get_manifest()['version'], tuple(sorted(context.items())))
+    page = _pages.get(key)
+    if page is None:
+        body = render_template(template, **context).encode('utf-8')
+        page = _pages[key] = (body, hashlib.sha256(body).hexdigest()[:16])
+
+    body, etag = page
+    response = Response(body, mimetype='text/html')
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = PAGE_MAX_AGE
+    return response.make_conditional(request)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Static asset pipeline")
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('build', help="minify, fingerprint and precompress templates/static into dist/")
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        manifest = build()
+        print(f"Built {len(manifest['assets'])} assets (manifest {manifest['version']})")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
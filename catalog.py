@@ -0,0 +1,442 @@
+"""
+Precomputed catalog of popular requests.
+
+extract_parameters only recognizes 13 cuisines x 12 diets x 3 types (plus
+days and servings), so the requests people actually make cluster into a small
+set of combinations. The catalog keeps content generated the way
+a live request would be (meal plans chosen by the constraint solver, recipes
+with computed nutrition) and a pre-rendered PDF for the most popular ones:
+
+- record_request() counts every catalog-eligible request (a "simple" request
+  whose meaning is fully captured by its parameters)
+- refresh() is the off-peak job: it regenerates the top-N combinations that
+  are missing or stale, stopping before the estimated model spend exceeds the
+  budget, and renders their PDFs into PDF storage
+- lookup() serves a live request straight from the catalog with no model call;
+  meal plan entries carry their solved plan so follow-ups can refer to it
+
+The job needs the web workers' CATALOG_DB, so it runs where they do: under
+gunicorn, the master starts a RefreshScheduler (gunicorn.conf.py) that runs
+`python catalog.py refresh` in a child process every day at CATALOG_REFRESH_AT.
+Each replica keeps its own catalog and refreshes it. A separate cron service
+(railway.json cronSchedule, crontab) would write a different filesystem's
+database unless CATALOG_DB is on a volume both mount. Run by hand with:
+    python catalog.py refresh --top 50 --budget 2.00
+
+Request counts and the hit/miss counters live in the database, so every
+worker sharing CATALOG_DB exports the same host-wide meal_catalog_* numbers.
+The request path only counts in memory: each worker writes its counts in one
+transaction every FLUSH_INTERVAL seconds (and on exit, scrape or refresh), so
+a request never waits on a database write.
+
+Configuration (environment):
+    CATALOG_DB                  SQLite path (default /tmp/meal-catalog.sqlite3)
+    CATALOG_MAX_AGE_HOURS       entries older than this are not served (default 168)
+    CATALOG_REFRESH_AT          daily refresh time, HH:MM UTC (default 03:00, empty = no schedule)
+    CATALOG_REFRESH_TOP         combinations the scheduled refresh keeps (default 50)
+    CATALOG_REFRESH_BUDGET      max estimated $ the scheduled refresh spends (default 2.00)
+    CATALOG_PRICE_INPUT_1K      estimated $ per 1K input tokens (default 0.03)
+    CATALOG_PRICE_OUTPUT_1K     estimated $ per 1K output tokens (default 0.06)
+"""
+
+import argparse
+import atexit
+import datetime
+import json
+import logging
+import os
+import re
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+
+import exporters
+import metrics
+from document import parse as parse_document
+from offline_engine import DEFAULT_GROCERY_DAYS, MEALS, RECIPES, RECIPE_TABLE
+
+logger = logging.getLogger(__name__)
+
+CATALOG_DB = os.getenv('CATALOG_DB', '/tmp/meal-catalog.sqlite3')
+CATALOG_MAX_AGE = float(os.getenv('CATALOG_MAX_AGE_HOURS', 168)) * 3600
+PRICE_INPUT_1K = float(os.getenv('CATALOG_PRICE_INPUT_1K', 0.03))
+PRICE_OUTPUT_1K = float(os.getenv('CATALOG_PRICE_OUTPUT_1K', 0.06))
+REFRESH_AT = os.getenv('CATALOG_REFRESH_AT', '03:00').strip()
+REFRESH_TOP = int(os.getenv('CATALOG_REFRESH_TOP', 50))
+REFRESH_BUDGET = float(os.getenv('CATALOG_REFRESH_BUDGET', 2.0))
+REFRESH_TIMEOUT = 3600      # seconds a scheduled refresh may run before it is killed
+FLUSH_INTERVAL = 30         # seconds between writes of a worker's request and hit counts
+
+# Popularity counts are multiplied by this after each refresh so the ranking
+# follows recent traffic rather than all-time totals
+POPULARITY_DECAY = 0.5
+
+# Parameters each template actually uses; anything else does not change the output
+CATALOG_FIELDS = {
+    'recipe': ('cuisine', 'dietary', 'servings'),
+    'meal_plan': ('cuisine', 'dietary', 'days', 'calories', 'budget', 'servings'),
+    'grocery_list': ('cuisine', 'dietary', 'days', 'servings', 'budget'),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS requests (
+    key TEXT PRIMARY KEY,
+    params TEXT NOT NULL,
+    count REAL NOT NULL DEFAULT 0,
+    last_seen REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    params TEXT NOT NULL,
+    content TEXT NOT NULL,
+    pdf_key TEXT,
+    cost REAL NOT NULL DEFAULT 0,
+    generated_at REAL NOT NULL,
+    plan TEXT
+);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+_local = threading.local()
+
+# Counts not yet written to the database: catalog key -> [params json, count, last seen], counter -> value
+_pending_requests = {}
+_pending_counters = {}
+_pending_lock = threading.Lock()
+_flusher_pid = None
+
+
+def _db():
+    """Per-thread SQLite connection (WAL so workers can read while the job writes)."""
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(CATALOG_DB, timeout=5, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.executescript(SCHEMA)
+        _local.conn = conn
+    return conn
+
+
+def catalog_params(params):
+    """Reduce params to the fields that determine the output, with defaults applied."""
+    kind = params.get('type')
+    if kind not in CATALOG_FIELDS:
+        return None
+    reduced = {'type': kind}
+    for field in CATALOG_FIELDS[kind]:
+        reduced[field] = params.get(field)
+    if kind == 'meal_plan':
+        reduced['days'] = reduced['days'] or 7
+    elif kind == 'grocery_list':
+        reduced['days'] = reduced['days'] or DEFAULT_GROCERY_DAYS
+    return reduced
+
+
+def catalog_key(reduced):
+    return '|'.join(f"{k}={reduced[k]}" for k in sorted(reduced))
+
+
+def _count(name):
+    with _pending_lock:
+        _ensure_flusher()
+        _pending_counters[name] = _pending_counters.get(name, 0) + 1
+
+
+def record_request(params):
+    """Count a catalog-eligible request towards popularity (in memory until the next flush)."""
+    reduced = catalog_params(params)
+    if reduced is None:
+        return
+    key = catalog_key(reduced)
+    with _pending_lock:
+        _ensure_flusher()
+        entry = _pending_requests.get(key)
+        if entry is None:
+            _pending_requests[key] = [json.dumps(reduced), 1, time.time()]
+        else:
+            entry[1] += 1
+            entry[2] = time.time()
+
+
+def flush():
+    """Write the counts gathered since the last flush to the database, in one transaction."""
+    global _pending_requests, _pending_counters
+    with _pending_lock:
+        requests, counters = _pending_requests, _pending_counters
+        _pending_requests, _pending_counters = {}, {}
+    if not requests and not counters:
+        return
+    try:
+        conn = _db()
+        with conn:
+            conn.execute('BEGIN')
+            conn.executemany(
+                "INSERT INTO requests (key, params, count, last_seen) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET count = count + excluded.count, last_seen = excluded.last_seen",
+                [(key, params, count, last_seen) for key, (params, count, last_seen) in requests.items()],
+            )
+            conn.executemany(
+                "INSERT INTO counters (name, value) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                list(counters.items()),
+            )
+    except sqlite3.Error as e:
+        logger.warning(f"Catalog flush failed, {len(requests)} request counts dropped: {e}")
+
+
+def _flush_loop():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        flush()
+
+
+atexit.register(flush)
+
+
+def _ensure_flusher():
+    """Start this process's flush thread (called with _pending_lock held)."""
+    global _flusher_pid
+    if _flusher_pid != os.getpid():
+        _flusher_pid = os.getpid()
+        threading.Thread(target=_flush_loop, name='catalog-flush', daemon=True).start()
+
+
+def lookup(params):
+    """Return a fresh catalog entry for params as a dict, or None."""
+    reduced = catalog_params(params)
+    if reduced is None:
+        return None
+    try:
+        conn = _db()
+        row = conn.execute(
+            "SELECT content, pdf_key, generated_at, plan FROM entries WHERE key = ? AND generated_at > ?",
+            (catalog_key(reduced), time.time() - CATALOG_MAX_AGE),
+        ).fetchone()
+    except sqlite3.Error as e:
+        logger.warning(f"Catalog lookup failed: {e}")
+        return None
+    _count('hits' if row else 'misses')
+    if not row:
+        return None
+    return {'content': row[0], 'pdf_key': row[1], 'generated_at': row[2], 'params': reduced,
+            'plan': _load_plan(row[3])}
+
+
+def _dump_plan(plan):
+    if plan is None:
+        return None
+    return json.dumps({'ids': [[day[meal]['id'] for meal in MEALS] for day in plan.days]})
+
+
+def _load_plan(data):
+    """The days ({meal: recipe}) of a stored plan, or None (also when a recipe left the dataset)."""
+    if not data:
+        return None
+    try:
+        return [{meal: RECIPES[RECIPE_TABLE.index[rid]] for meal, rid in zip(MEALS, ids)}
+                for ids in json.loads(data)['ids']]
+    except (KeyError, ValueError):
+        return None
+
+
+def synthetic_message(reduced):
+    """A request message equivalent to the reduced params (used by the recipe template)."""
+    words = [reduced.get('dietary'), reduced.get('cuisine')]
+    if reduced['type'] == 'recipe':
+        return ' '.join(w for w in words + ['recipe'] if w)
+    if reduced['type'] == 'meal_plan':
+        return ' '.join(w for w in [f"{reduced['days']}-day"] + words + ['meal plan'] if w)
+    return ' '.join(w for w in words + ['grocery list'] if w)
+
+
+def estimate_cost(prompt):
+    """Upper-bound dollar cost of a prompt (assumes max_tokens are all used)."""
+    return (prompt.input_tokens * PRICE_INPUT_1K + prompt.max_tokens * PRICE_OUTPUT_1K) / 1000
+
+
+def pdf_filename(reduced, generated_at):
+    slug = '-'.join(str(reduced[k]) for k in sorted(reduced) if reduced[k] and k != 'type')
+    slug = re.sub(r'[^a-z0-9]+', '-', slug.lower()).strip('-')
+    stamp = datetime.datetime.fromtimestamp(generated_at).strftime('%Y%m%d-%H%M%S')
+    kind = reduced['type'].replace('_', '-')
+    return f"catalog-{kind}-{slug + '-' if slug else ''}{stamp}.pdf"
+
+
+def top_requests(limit):
+    rows = _db().execute(
+        "SELECT key, params, count FROM requests ORDER BY count DESC LIMIT ?", (limit,)
+    ).fetchall()
+    return [(key, json.loads(params), count) for key, params, count in rows]
+
+
+def refresh(top=50, budget=2.0, max_age_hours=24):
+    """Regenerate the top combinations that are missing or older than max_age_hours."""
+    flush()
+    # Imported here so the web app can import this module without a cycle
+    from prompt_builder import build_prompt
+    from Meal_Planner_Chatbot import create_branded_pdf, generate_artifact
+
+    conn = _db()
+    spent = 0.0
+    refreshed = skipped = 0
+    cutoff = time.time() - max_age_hours * 3600
+
+    for key, reduced, count in top_requests(top):
+        row = conn.execute("SELECT generated_at FROM entries WHERE key = ?", (key,)).fetchone()
+        if row and row[0] > cutoff:
+            continue
+
+        message = synthetic_message(reduced)
+        params = dict(reduced, servings=reduced.get('servings') or 4)
+        # The full template's prompt; a solved meal plan only asks the model for its notes, so this is an upper bound
+        cost = estimate_cost(build_prompt(reduced['type'], message, params))
+        if spent + cost > budget:
+            logger.info(f"Catalog budget reached (${spent:.2f} of ${budget:.2f}); {key} skipped")
+            skipped += 1
+            continue
+
+        # Same path as a live request (solver, computed nutrition), but model-written even though the request is simple
+        try:
+            content, _, _, _, plan = generate_artifact(message, params, fast_path=False)
+        except Exception as e:
+            logger.warning(f"Catalog generation failed for {key}: {e}")
+            continue
+        spent += cost
+        if content is None:
+            logger.warning(f"Catalog generation failed for {key}: content generation unavailable")
+            continue
+
+        generated_at = time.time()
+        filename = pdf_filename(reduced, generated_at)
+        # Catalog PDFs are built ahead of time; the record is kept for the other export formats
+        pdf_key = create_branded_pdf(content, filename, doc_type=reduced['type'])
+        exporters.save_source(os.path.splitext(filename)[0], content, parse_document(content, reduced['type']))
+        conn.execute(
+            "INSERT OR REPLACE INTO entries (key, params, content, pdf_key, cost, generated_at, plan) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, json.dumps(reduced), content, pdf_key, cost, generated_at, _dump_plan(plan)),
+        )
+        refreshed += 1
+        logger.info(f"Catalog refreshed {key} (popularity {count:.1f}, ~${cost:.3f})")
+
+    conn.execute("UPDATE requests SET count = count * ?", (POPULARITY_DECAY,))
+    conn.execute("DELETE FROM requests WHERE count < 0.01")
+    logger.info(f"Catalog refresh done: {refreshed} refreshed, {skipped} over budget, ~${spent:.2f} spent")
+    return {'refreshed': refreshed, 'skipped': skipped, 'spent': round(spent, 4)}
+
+
+def stats():
+    """Freshness and hit-rate statistics."""
+    flush()
+    conn = _db()
+    now = time.time()
+    counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+    count, oldest, newest, stale = conn.execute(
+        "SELECT COUNT(*), MIN(generated_at), MAX(generated_at), "
+        "SUM(CASE WHEN generated_at <= ? THEN 1 ELSE 0 END) FROM entries",
+        (now - CATALOG_MAX_AGE,),
+    ).fetchone()
+    hits, misses = counters.get('hits', 0), counters.get('misses', 0)
+    return {
+        'entries': count,
+        'stale_entries': stale or 0,
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / (hits + misses), 4) if hits + misses else 0.0,
+        'oldest_age_seconds': round(now - oldest) if oldest else None,
+        'newest_age_seconds': round(now - newest) if newest else None,
+    }
+
+
+def _collect():
+    s = stats()
+    samples = [
+        ('meal_catalog_entries', {}, s['entries']),
+        ('meal_catalog_stale_entries', {}, s['stale_entries']),
+        ('meal_catalog_lookups_total', {'result': 'hit'}, s['hits']),
+        ('meal_catalog_lookups_total', {'result': 'miss'}, s['misses']),
+        ('meal_catalog_hit_ratio', {}, s['hit_rate']),
+    ]
+    if s['oldest_age_seconds'] is not None:
+        samples.append(('meal_catalog_entry_age_seconds', {'entry': 'oldest'}, s['oldest_age_seconds']))
+        samples.append(('meal_catalog_entry_age_seconds', {'entry': 'newest'}, s['newest_age_seconds']))
+    return samples
+
+
+metrics.register_collector(_collect)
+
+
+def seconds_until(at, now=None):
+    """Seconds from now until the next HH:MM (UTC)."""
+    hour, minute = (int(part) for part in at.split(':'))
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    target = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if target <= now:
+        target += datetime.timedelta(days=1)
+    return (target - now).total_seconds()
+
+
+class RefreshScheduler(threading.Thread):
+    """Master-side thread that runs the catalog refresh daily at CATALOG_REFRESH_AT."""
+
+    def __init__(self, server, at=REFRESH_AT, top=REFRESH_TOP, budget=REFRESH_BUDGET):
+        super().__init__(name='catalog-refresh', daemon=True)
+        self.log = server.log  # the master has gunicorn's logging, not the app's
+        self.at = at
+        self.command = [sys.executable, os.path.abspath(__file__), 'refresh', '--top', str(top), '--budget', str(budget)]
+
+    def run(self):
+        while True:
+            time.sleep(seconds_until(self.at))
+            # A child process: the refresh imports the app, which the master must not load before forking.
+            # Its logs and summary go to the master's stdout.
+            self.log.info("Starting the scheduled catalog refresh")
+            try:
+                returncode = subprocess.run(self.command, timeout=REFRESH_TIMEOUT).returncode
+            except Exception as e:
+                self.log.warning(f"Catalog refresh failed: {e}")
+                continue
+            if returncode:
+                self.log.warning(f"Catalog refresh exited with status {returncode}")
+
+
+def start_scheduler(server):
+    """Start the daily refresh from gunicorn's when_ready, unless CATALOG_REFRESH_AT is empty."""
+    if not REFRESH_AT:
+        return None
+    try:
+        seconds_until(REFRESH_AT)
+    except ValueError:
+        server.log.warning(f"Ignoring malformed CATALOG_REFRESH_AT {REFRESH_AT!r}; no catalog refresh scheduled")
+        return None
+    scheduler = RefreshScheduler(server)
+    scheduler.start()
+    server.log.info(f"Catalog refresh scheduled daily at {REFRESH_AT} UTC (top {REFRESH_TOP}, ${REFRESH_BUDGET:.2f})")
+    return scheduler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Meal planner catalog maintenance")
+    sub = parser.add_subparsers(dest='command', required=True)
+    refresh_cmd = sub.add_parser('refresh', help="regenerate the most popular combinations")
+    refresh_cmd.add_argument('--top', type=int, default=50)
+    refresh_cmd.add_argument('--budget', type=float, default=2.0, help="max estimated model spend in dollars")
+    refresh_cmd.add_argument('--max-age', type=float, default=24, help="regenerate entries older than this (hours)")
+    sub.add_parser('stats', help="print freshness and hit-rate statistics")
+    args = parser.parse_args()
+
+    if args.command == 'refresh':
+        print(json.dumps(refresh(args.top, args.budget, args.max_age)))
+    else:
+        print(json.dumps(stats(), indent=2))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
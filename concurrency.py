@@ -0,0 +1,322 @@
+"""
+Worker sizing, autoscaling and utilization tracking for gunicorn.
+
+Used by gunicorn.conf.py; nothing here is imported by the app itself.
+
+Sizing. Requests spend most of their time waiting on the model API, and one
+worker can only keep one core busy (the GIL), so the server runs one gthread
+worker per core with enough threads to cover the wait:
+
+    threads = 1 / (1 - io_ratio)        (io_ratio 0.9 -> 10 threads)
+
+io_ratio is the share of a request's wall time not spent on CPU. It starts at
+GUNICORN_IO_RATIO and is then measured from live traffic (wall time vs thread
+CPU time per request); workers started later (scale-ups and recycled workers)
+get the thread count for the observed ratio.
+
+Autoscaling. A controller thread in the master samples, every SCALE_INTERVAL
+seconds, the accept queue of the listening sockets (from /proc/net/tcp) and
+the worker utilization (busy thread-seconds over available thread-seconds).
+A queue or utilization above SCALE_UP_UTIL for two samples adds a worker
+(SIGTTIN); a sustained idle period below SCALE_DOWN_UTIL removes one (SIGTTOU),
+always within [GUNICORN_MIN_WORKERS, GUNICORN_MAX_WORKERS].
+
+Utilization. Each worker records its counters in its own slot of a small
+memory-mapped stats file, so any worker can export the whole host's numbers
+on /metrics (concurrency_* series) and `python concurrency.py` prints them.
+
+Configuration (environment):
+    GUNICORN_IO_RATIO       initial I/O-wait share of request time (default 0.9)
+    GUNICORN_MIN_WORKERS    lower scaling bound (default 2)
+    GUNICORN_MAX_WORKERS    upper scaling bound (default 2 x CPUs + 1)
+    GUNICORN_MAX_THREADS    threads per worker cap (default 16)
+    GUNICORN_STATS_PATH     stats file (default /dev/shm/meal-planner-workers)
+"""
+
+import argparse
+import fcntl
+import logging
+import mmap
+import os
+import signal
+import struct
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+CPUS = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1)
+IO_RATIO = float(os.getenv('GUNICORN_IO_RATIO', 0.9))
+MIN_WORKERS = int(os.getenv('GUNICORN_MIN_WORKERS', 2))
+MAX_WORKERS = int(os.getenv('GUNICORN_MAX_WORKERS', 2 * CPUS + 1))
+MAX_THREADS = int(os.getenv('GUNICORN_MAX_THREADS', 16))
+_default_dir = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+STATS_PATH = os.getenv('GUNICORN_STATS_PATH', os.path.join(_default_dir, 'meal-planner-workers'))
+
+SCALE_INTERVAL = 5.0
+SCALE_UP_UTIL = 0.75
+SCALE_DOWN_UTIL = 0.25
+SCALE_UP_SAMPLES = 2
+SCALE_DOWN_SAMPLES = 12     # a minute of idle before giving a worker back
+MIN_OBSERVED_REQUESTS = 50  # requests between io_ratio updates
+
+MAGIC = b'MPWORKR1'
+SLOTS = 64
+# magic, slot count, workers target, threads target, accept queue, io_ratio, utilization, updated
+HEADER = struct.Struct('<8sIIIIddd')
+HEADER_SIZE = 64
+# pid, started, threads, in flight, requests, busy ns (wall), cpu ns
+SLOT = struct.Struct('<IdIIQQQ')
+FILE_SIZE = HEADER_SIZE + SLOTS * SLOT.size
+
+
+def size_for(cpus=CPUS, io_ratio=IO_RATIO):
+    """(workers, threads) for a host with cpus cores and the given I/O-wait ratio."""
+    io_ratio = min(max(io_ratio, 0.0), 0.99)
+    threads = min(max(round(1 / (1 - io_ratio)), 1), MAX_THREADS)
+    workers = min(max(cpus, MIN_WORKERS), MAX_WORKERS)
+    return workers, threads
+
+
+class WorkerStats:
+    """The shared stats file: a header written by the master, one slot per worker."""
+
+    def __init__(self, path=STATS_PATH):
+        self.path = path
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(fd).st_size != FILE_SIZE or os.pread(fd, 8, 0) != MAGIC:
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, FILE_SIZE)
+                os.pwrite(fd, HEADER.pack(MAGIC, SLOTS, 0, 0, 0, IO_RATIO, 0.0, 0.0), 0)
+            self.mm = mmap.mmap(fd, FILE_SIZE)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        self.fd = fd
+        self.pid = os.getpid()
+        self.slot = None
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def close(self):
+        self.mm.close()
+        os.close(self.fd)
+
+    def header(self):
+        _, _, workers, threads, queue, io_ratio, utilization, updated = HEADER.unpack_from(self.mm, 0)
+        return {'workers': workers, 'threads': threads, 'queue': queue, 'io_ratio': io_ratio,
+                'utilization': utilization, 'updated': updated}
+
+    def set_header(self, workers, threads, queue, io_ratio, utilization):
+        HEADER.pack_into(self.mm, 0, MAGIC, SLOTS, workers, threads, queue, io_ratio, utilization, time.time())
+
+    def slots(self):
+        """(index, fields) for every occupied slot."""
+        for i in range(SLOTS):
+            fields = SLOT.unpack_from(self.mm, HEADER_SIZE + i * SLOT.size)
+            if fields[0]:
+                yield i, fields
+
+    # -- worker side --------------------------------------------------------
+
+    def claim(self, pid, threads):
+        """Take a free slot for this worker (or one left by a worker that was killed)."""
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        try:
+            for i in range(SLOTS):
+                owner = SLOT.unpack_from(self.mm, HEADER_SIZE + i * SLOT.size)[0]
+                if owner and owner != pid and _alive(owner):
+                    continue
+                SLOT.pack_into(self.mm, HEADER_SIZE + i * SLOT.size, pid, time.time(), threads, 0, 0, 0, 0)
+                self.slot = i
+                return i
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+        logger.warning(f"No free worker stats slot for pid {pid}")
+        return None
+
+    def release(self, pid):
+        for i, fields in self.slots():
+            if fields[0] == pid:
+                SLOT.pack_into(self.mm, HEADER_SIZE + i * SLOT.size, 0, 0, 0, 0, 0, 0, 0)
+
+    def _update(self, in_flight=0, requests=0, busy_ns=0, cpu_ns=0):
+        # Only this worker writes its slot; the lock serializes its threads
+        if self.slot is None:
+            return
+        offset = HEADER_SIZE + self.slot * SLOT.size
+        with self.lock:
+            pid, started, threads, flight, count, busy, cpu = SLOT.unpack_from(self.mm, offset)
+            SLOT.pack_into(self.mm, offset, pid, started, threads, flight + in_flight,
+                           count + requests, busy + busy_ns, cpu + cpu_ns)
+
+    def request_started(self):
+        self.local.start = (time.monotonic_ns(), time.thread_time_ns())
+        self._update(in_flight=1)
+
+    def request_finished(self):
+        start = getattr(self.local, 'start', None)
+        if start is None:
+            return
+        self.local.start = None
+        self._update(in_flight=-1, requests=1,
+                     busy_ns=time.monotonic_ns() - start[0], cpu_ns=time.thread_time_ns() - start[1])
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+
+def accept_queue(ports):
+    """Connections waiting in the accept queue of listening sockets on ports (Linux only)."""
+    queued = 0
+    for table in ('/proc/net/tcp', '/proc/net/tcp6'):
+        try:
+            with open(table) as f:
+                next(f)
+                for line in f:
+                    fields = line.split()
+                    # For LISTEN sockets (state 0A) rx_queue is the accept backlog
+                    if fields[3] == '0A' and int(fields[1].rsplit(':', 1)[1], 16) in ports:
+                        queued += int(fields[4].split(':')[1], 16)
+        except OSError:
+            pass
+    return queued
+
+
+class Controller(threading.Thread):
+    """Master-side thread that resizes the worker pool from queue depth and utilization."""
+
+    def __init__(self, server, stats, interval=SCALE_INTERVAL):
+        super().__init__(name='concurrency-controller', daemon=True)
+        self.server = server
+        self.log = server.log  # the master has gunicorn's logging, not the app's
+        self.stats = stats
+        self.interval = interval
+        self.ports = {listener.sock.getsockname()[1] for listener in server.LISTENERS
+                      if isinstance(listener.sock.getsockname(), tuple)}
+        self.previous = None
+        self.io_ratio = IO_RATIO
+        self.up = self.down = 0
+
+    def sample(self):
+        """(accept queue, utilization over the last interval), updating the observed io_ratio."""
+        now = time.monotonic_ns()
+        slots = [fields for _, fields in self.stats.slots()]
+        totals = {pid: (threads, requests, busy, cpu) for pid, _, threads, _, requests, busy, cpu in slots}
+        # Busy time is only recorded when a request finishes, so also count the threads busy right now
+        capacity_now = sum(fields[2] for fields in slots)
+        utilization = sum(fields[3] for fields in slots) / capacity_now if capacity_now else 0.0
+        if self.previous is not None:
+            then, before = self.previous
+            capacity = sum(threads for threads, *_ in totals.values()) * (now - then)
+            busy = sum(t[2] - before.get(pid, (0, 0, 0, 0))[2] for pid, t in totals.items())
+            requests = sum(t[1] - before.get(pid, (0, 0, 0, 0))[1] for pid, t in totals.items())
+            cpu = sum(t[3] - before.get(pid, (0, 0, 0, 0))[3] for pid, t in totals.items())
+            if capacity:
+                utilization = min(max(utilization, busy / capacity), 1.0)
+            if requests >= MIN_OBSERVED_REQUESTS and busy > 0:
+                # Smooth so one burst of CPU-heavy PDF renders does not swing the thread count
+                self.io_ratio = 0.8 * self.io_ratio + 0.2 * (1 - cpu / busy)
+        self.previous = (now, totals)
+        return accept_queue(self.ports), utilization
+
+    def step(self):
+        queue, utilization = self.sample()
+        workers = self.server.num_workers
+        threads = size_for(io_ratio=self.io_ratio)[1]
+        if threads != self.server.cfg.threads:
+            # Applies to workers started from now on (scale-ups and max_requests recycling)
+            self.log.info(f"Observed I/O ratio {self.io_ratio:.2f}: {threads} threads for new workers")
+            self.server.cfg.set('threads', threads)
+
+        self.up = self.up + 1 if (queue > 0 or utilization > SCALE_UP_UTIL) else 0
+        self.down = self.down + 1 if (queue == 0 and utilization < SCALE_DOWN_UTIL) else 0
+        if self.up >= SCALE_UP_SAMPLES and workers < MAX_WORKERS:
+            self.log.info(f"Scaling up to {workers + 1} workers (queue {queue}, utilization {utilization:.0%})")
+            os.kill(os.getpid(), signal.SIGTTIN)
+            self.up = 0
+        elif self.down >= SCALE_DOWN_SAMPLES and workers > MIN_WORKERS:
+            self.log.info(f"Scaling down to {workers - 1} workers (utilization {utilization:.0%})")
+            os.kill(os.getpid(), signal.SIGTTOU)
+            self.down = 0
+        self.stats.set_header(self.server.num_workers, self.server.cfg.threads, queue, self.io_ratio, utilization)
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.step()
+            except Exception as e:
+                self.log.warning(f"Concurrency controller step failed: {e}")
+
+
+_stats = None
+
+
+def get_stats():
+    """This process's WorkerStats; a forked worker opens its own instead of using the master's."""
+    global _stats
+    if _stats is not None and _stats.pid != os.getpid():
+        # flock belongs to the open file, which a forked child shares with the master: on the
+        # inherited fd, claim() would not exclude other workers
+        _stats.close()
+        _stats = None
+    if _stats is None:
+        _stats = WorkerStats()
+    return _stats
+
+
+def _collect():
+    stats = get_stats()
+    header = stats.header()
+    samples = [
+        ('concurrency_target_workers', {}, header['workers']),
+        ('concurrency_target_threads', {}, header['threads']),
+        ('concurrency_accept_queue', {}, header['queue']),
+        ('concurrency_io_ratio', {}, round(header['io_ratio'], 4)),
+        ('concurrency_utilization', {}, round(header['utilization'], 4)),
+    ]
+    for _, (pid, started, threads, in_flight, requests, busy, cpu) in stats.slots():
+        labels = {'pid': pid}
+        samples += [
+            ('concurrency_worker_threads', labels, threads),
+            ('concurrency_worker_in_flight', labels, in_flight),
+            ('concurrency_worker_requests_total', labels, requests),
+            ('concurrency_worker_busy_seconds_total', labels, round(busy / 1e9, 3)),
+            ('concurrency_worker_cpu_seconds_total', labels, round(cpu / 1e9, 3)),
+            ('concurrency_worker_uptime_seconds', labels, round(time.time() - started, 1)),
+        ]
+    return samples
+
+
+def register_metrics():
+    """Export the host's worker stats on /metrics (called in each worker after fork)."""
+    import metrics
+    metrics.register_collector(_collect)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show gunicorn sizing and live worker utilization")
+    parser.add_argument('--io-ratio', type=float, default=IO_RATIO, help="I/O-wait share to size for")
+    args = parser.parse_args()
+
+    workers, threads = size_for(io_ratio=args.io_ratio)
+    print(f"{CPUS} CPUs, io_ratio {args.io_ratio:.2f}: {workers} workers x {threads} threads "
+          f"(scaling {MIN_WORKERS}..{MAX_WORKERS})")
+    if os.path.exists(STATS_PATH):
+        for name, labels, value in _collect():
+            print(f"{name}{labels or ''} {value}")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    main()
@@ -0,0 +1,333 @@
+"""
+Typed document model of generated content.
+
+The model and the offline engine both return Markdown-style text. parse()
+turns it into a small tree once per generation, and every output reads the
+tree instead of re-splitting the string:
+
+    Document        doc_type, title, sections
+      Section       heading, kind (intro / ingredients / steps / day / general), day number
+        Text        a line of prose
+        Item        a bullet point
+        Ingredient  a bullet in an ingredients section
+        Step        a numbered instruction
+        Meal        "Breakfast: Name (15 min, 193 kcal)" in a day section
+
+Renderers here: preview() for the chat bubble (cut between lines or words,
+never inside markup), markdown() and speech() for Alexa, which is derived
+from the detailed content instead of a second, voice-only completion. The PDF
+and the other export formats (exporters.py) walk the sections themselves.
+
+All classes use __slots__: documents are built on every generation and
+rebuilt from content records on every export, and a week's plan is a few
+hundred nodes. to_data() / from_data() give a compact JSON form for those
+records.
+"""
+
+import re
+
+from offline_engine import MEALS
+
+SPEECH_INGREDIENTS = 8
+SPEECH_STEPS = 6
+SPEECH_GROUP_ITEMS = 6
+SPEECH_MAX_CHARS = 6000     # Alexa rejects output speech over 8000 characters
+TITLE_SEARCH_LINES = 3      # lines searched for "**Recipe Name:** X" past a model's preamble
+
+SPEECH_CLOSINGS = {
+    'recipe': "Want the full detailed version in the app?",
+    'meal_plan': "Want the full detailed plan in the app?",
+    'grocery_list': "Want the full detailed list in the app?",
+}
+
+HEADING = re.compile(r'^#{1,6}\s*(.+?)\s*#*$')
+BOLD_LINE = re.compile(r'^\*\*([^*]+?):?\*\*:?$')
+TITLE_LABELS = ('recipe name', 'recipe', 'name', 'title')
+TITLE_FIELD = re.compile(rf"^\*\*(?:{'|'.join(TITLE_LABELS)}):?\*\*:?\s*(.+)$", re.IGNORECASE)
+ITEM = re.compile(r'^[-•*]\s+(.+)$')
+STEP = re.compile(r'^(\d+)[.)]\s+(.+)$')
+BOLD = re.compile(r'\*\*(.+?)\*\*')
+DAY = re.compile(r'\bday\s*(\d+)\b', re.IGNORECASE)
+MEAL_NAMES = MEALS + ('snack', 'snacks')
+MEAL_LINE = re.compile(rf"^({'|'.join(MEAL_NAMES)})\s*:\s*(.+)$", re.IGNORECASE)
+MEAL_DETAILS = re.compile(r'^(.*?)\s*\(([^()]*)\)$')
+QUANTITY = re.compile(r'^[\d/.\s-]+(?:(?:cups?|tbsp|tsp|lbs?|oz|g|kg|ml|l|cloves?|cans?|pinch|bunch(?:es)?)\b\.?)?\s*',
+                      re.IGNORECASE)
+
+
+def plain(text):
+    """Inline markup removed."""
+    return BOLD.sub(r'\1', text).replace('**', '')
+
+
+def item_name(text):
+    """A list item without its quantity ("3/4 lb chicken thighs" -> "chicken thighs")."""
+    text = plain(text)
+    return QUANTITY.sub('', text) or text
+
+
+def _section_kind(heading):
+    lowered = heading.lower()
+    if 'ingredient' in lowered:
+        return 'ingredients'
+    if any(word in lowered for word in ('instruction', 'step', 'direction', 'method')):
+        return 'steps'
+    if DAY.search(lowered):
+        return 'day'
+    return 'general'
+
+
+class Node:
+    """A line of a section."""
+
+    __slots__ = ('text',)
+    tag = None
+
+    def __init__(self, text):
+        self.text = text
+
+    def markdown(self):
+        return self.text
+
+    def to_data(self):
+        return [self.tag, self.text]
+
+
+class Text(Node):
+    __slots__ = ()
+    tag = 't'
+
+
+class Item(Node):
+    __slots__ = ()
+    tag = 'i'
+
+    def markdown(self):
+        return f"- {self.text}"
+
+
+class Ingredient(Item):
+    __slots__ = ()
+    tag = 'g'
+
+    @property
+    def name(self):
+        return item_name(self.text)
+
+
+class Step(Node):
+    __slots__ = ('number',)
+    tag = 's'
+
+    def __init__(self, text, number):
+        super().__init__(text)
+        self.number = number
+
+    def markdown(self):
+        return f"{self.number}. {self.text}"
+
+    def to_data(self):
+        return [self.tag, self.text, self.number]
+
+
+class Meal(Node):
+    """A meal of a plan day; text is the original line."""
+
+    __slots__ = ('meal', 'name', 'details')
+    tag = 'm'
+
+    def __init__(self, text, meal, name, details=''):
+        super().__init__(text)
+        self.meal = meal
+        self.name = name
+        self.details = details
+
+    def to_data(self):
+        return [self.tag, self.text, self.meal, self.name, self.details]
+
+
+NODE_TYPES = {cls.tag: cls for cls in (Text, Item, Ingredient, Step, Meal)}
+
+
+class Section:
+    """A heading and the lines under it; the intro section before the first heading has none."""
+
+    __slots__ = ('heading', 'kind', 'day', 'nodes')
+
+    def __init__(self, heading, kind, day=None, nodes=None):
+        self.heading = heading
+        self.kind = kind
+        self.day = day
+        self.nodes = nodes if nodes is not None else []
+
+    def markdown_lines(self):
+        if self.heading is not None:
+            yield f"### {self.heading}" if self.kind == 'day' else f"**{self.heading}:**"
+        for node in self.nodes:
+            yield node.markdown()
+
+    def of_type(self, cls):
+        return [node for node in self.nodes if isinstance(node, cls)]
+
+
+class Document:
+    """Parsed content of one generation."""
+
+    __slots__ = ('doc_type', 'title', 'sections')
+
+    def __init__(self, doc_type, title=None, sections=None):
+        self.doc_type = doc_type
+        self.title = title
+        self.sections = sections if sections is not None else []
+
+    def sections_of(self, kind):
+        return [section for section in self.sections if section.kind == kind]
+
+    def nodes(self, cls=Node):
+        return [node for section in self.sections for node in section.nodes if isinstance(node, cls)]
+
+    def markdown_lines(self):
+        """The content as lines of Markdown, with a blank line between sections."""
+        if self.title:
+            yield f"**{self.title}**"
+        for section in self.sections:
+            if self.title or section is not self.sections[0]:
+                yield ''
+            yield from section.markdown_lines()
+
+    def markdown(self):
+        return '\n'.join(self.markdown_lines()).strip() + '\n'
+
+    def preview(self, limit=500):
+        """Leading part of the content for the chat bubble, cut between lines (or words) only."""
+        lines, used = [], 0
+        for line in self.markdown_lines():
+            if used + len(line) > limit:
+                # Finish on whole words of the line that does not fit, markup removed
+                head = plain(line)[:limit - used]
+                if ' ' in head and len(head) > 20:
+                    lines.append(head.rsplit(' ', 1)[0])
+                return '\n'.join(lines).rstrip() + '...'
+            lines.append(line)
+            used += len(line) + 1
+        return '\n'.join(lines).rstrip()
+
+    def speech(self):
+        """A spoken summary: what a voice assistant reads out instead of the full document."""
+        if self.doc_type == 'meal_plan':
+            parts = self._speak_days()
+        elif self.doc_type == 'grocery_list':
+            parts = self._speak_groups()
+        else:
+            parts = self._speak_recipe()
+        if not parts:
+            parts = [plain(node.text) for node in self.nodes()][:6]
+        text = ' '.join(part for part in parts if part)
+        if len(text) > SPEECH_MAX_CHARS:
+            text = text[:SPEECH_MAX_CHARS].rsplit('. ', 1)[0] + '.'
+        return f"{text} {SPEECH_CLOSINGS.get(self.doc_type, SPEECH_CLOSINGS['recipe'])}".strip()
+
+    def _speak_recipe(self):
+        parts = [_sentence(plain(self.title)) if self.title else '']
+        intro = self.sections_of('intro')
+        if intro and intro[0].of_type(Text):
+            # "Servings: 2 | Total time: 35 minutes | Cuisine: Vietnamese"
+            parts.append(_sentence(plain(intro[0].of_type(Text)[0].text).replace(' | ', ', ')))
+        ingredients = self.nodes(Ingredient)
+        if ingredients:
+            parts.append(f"You'll need {', '.join(i.name for i in ingredients[:SPEECH_INGREDIENTS])}.")
+        steps = self.nodes(Step)[:SPEECH_STEPS]
+        parts += [f"Step {n}: {_sentence(plain(step.text))}" for n, step in enumerate(steps, 1)]
+        return parts if ingredients or steps else []
+
+    def _speak_days(self):
+        parts = []
+        for section in self.sections_of('day'):
+            meals = section.of_type(Meal)
+            if meals:
+                parts.append(f"Day {section.day}: " + '; '.join(f"{m.meal}, {m.name}" for m in meals) + '.')
+        return parts
+
+    def _speak_groups(self):
+        parts = []
+        for section in self.sections:
+            items = section.of_type(Item)
+            if section.heading and items and not any(word in section.heading.lower() for word in ('tip', 'note')):
+                names = [item_name(item.text) for item in items[:SPEECH_GROUP_ITEMS]]
+                parts.append(f"{plain(section.heading)}: {', '.join(names)}.")
+        return parts
+
+    def to_data(self):
+        return [self.doc_type, self.title,
+                [[s.heading, s.kind, s.day, [n.to_data() for n in s.nodes]] for s in self.sections]]
+
+    @classmethod
+    def from_data(cls, data):
+        doc_type, title, sections = data
+        return cls(doc_type, title, [
+            Section(heading, kind, day, [NODE_TYPES[n[0]](*n[1:]) for n in nodes])
+            for heading, kind, day, nodes in sections
+        ])
+
+
+def _sentence(text):
+    return text if text.endswith(('.', '!', '?')) else f"{text}."
+
+
+def parse(content, doc_type):
+    """Build the Document for generated content."""
+    doc = Document(doc_type)
+    section = None
+    title_next = False
+    seen = 0
+    for line in content.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        seen += 1
+        heading = HEADING.match(line) or BOLD_LINE.match(line)
+        if doc.title is None and (seen <= TITLE_SEARCH_LINES or title_next) and not any(
+                sec.kind != 'intro' for sec in doc.sections):
+            # The first line names the document: "**Recipe Name:** X", "**X**" or "# X". A title
+            # field may follow a line or two of preamble ("Here's a delicious recipe for you!")
+            title = TITLE_FIELD.match(line)
+            label = heading.group(1).strip() if heading else None
+            if title or title_next:
+                doc.title = plain(title.group(1) if title else line).strip()
+                continue
+            if label and label.lower() in TITLE_LABELS:
+                title_next = True
+                continue
+            if label and seen == 1 and _section_kind(label) == 'general':
+                doc.title = label
+                continue
+        if heading or (line.endswith(':') and len(line) < 60 and not ITEM.match(line)):
+            text = (heading.group(1) if heading else line).strip().rstrip(':').strip('*').strip()
+            day = DAY.search(text)
+            section = Section(text, _section_kind(text), int(day.group(1)) if day else None)
+            doc.sections.append(section)
+            continue
+        if section is None:
+            section = Section(None, 'intro')
+            doc.sections.append(section)
+        section.nodes.append(_node(line, section))
+    return doc
+
+
+def _node(line, section):
+    item = ITEM.match(line)
+    text = item.group(1) if item else line
+    if section.kind == 'day':
+        meal = MEAL_LINE.match(plain(text))
+        if meal:
+            name, details = meal.group(2).strip(), ''
+            parts = MEAL_DETAILS.match(name)
+            if parts:
+                name, details = parts.groups()
+            return Meal(line, meal.group(1).lower(), name, details)
+    if item:
+        return Ingredient(text) if section.kind == 'ingredients' else Item(text)
+    step = STEP.match(line)
+    if step:
+        return Step(step.group(2), int(step.group(1)))
+    return Text(line)
@@ -0,0 +1,238 @@
+"""
+Export formats for generated content.
+
+Every chat response used to end in a ReportLab build, although most users
+only read the preview in the chat. Now a response stores just the content
+record (the generated text and its document type, a few KB) and links to
+the formats below, each rendered from that record when it is downloaded:
+
+    pdf   the branded PDF, built on the first /download and stored
+    html  a responsive page for reading on a phone
+    md    Markdown
+    txt   plain text without markup, for reading aloud
+    ics   a calendar with one event per meal (meal plans only)
+
+The record carries the parsed Document (document.py) as well as the text,
+so the cheap formats are a walk over the tree: well under a millisecond,
+rendered on every request and never stored.
+
+Calendar events use floating local times (MEAL_TIMES), so a plan shows up at
+breakfast time in whatever time zone the calendar is in. Day 1 is the day
+after the download.
+
+Configuration (environment):
+    EXPORT_SOURCE_TTL   seconds content records are kept in the shared cache (default 3600)
+"""
+
+import datetime
+import html
+import json
+import logging
+import os
+
+import metrics
+from document import BOLD, Document, Item, Meal, Step, plain
+from shared_cache import get_cache
+from storage import get_storage
+
+logger = logging.getLogger(__name__)
+
+EXPORT_SOURCE_TTL = int(os.getenv('EXPORT_SOURCE_TTL', 3600))
+
+# Rendered on request; pdf is handled by the app, which owns the ReportLab layout
+FORMATS = {
+    'html': 'text/html; charset=utf-8',
+    'md': 'text/markdown; charset=utf-8',
+    'txt': 'text/plain; charset=utf-8',
+    'ics': 'text/calendar; charset=utf-8',
+}
+INLINE_FORMATS = ('html', 'md', 'txt')
+
+DOC_TITLES = {
+    'recipe': "Delicious & Nutritious Recipe",
+    'meal_plan': "Your Personalized Meal Plan",
+    'grocery_list': "Smart Shopping List",
+}
+
+# Meal -> (hour, minute, duration in minutes) of its calendar event
+MEAL_TIMES = {
+    'breakfast': (8, 0, 30),
+    'lunch': (12, 30, 45),
+    'snack': (16, 0, 15),
+    'snacks': (16, 0, 15),
+    'dinner': (18, 30, 60),
+}
+
+
+def to_text(doc):
+    """Plain text without markup, for reading aloud or pasting."""
+    lines = [plain(doc.title), ''] if doc.title else []
+    for section in doc.sections:
+        if section.heading is not None:
+            lines += ([''] if lines and lines[-1] else []) + [f"{plain(section.heading)}:"]
+        for node in section.nodes:
+            text = plain(node.text)
+            lines.append(f"Step {node.number}. {text}" if isinstance(node, Step) else text)
+    return '\n'.join(lines).strip() + '\n'
+
+
+HTML_PAGE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>{title} - Healthy Eating Guru</title>
+<style>
+body {{ margin: 0; font: 16px/1.55 -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, sans-serif; color: #333; background: #fafafa; }}
+main {{ max-width: 42rem; margin: 0 auto; padding: 1.25rem; background: #fff; }}
+header p {{ margin: 0; color: #27a130; font-style: italic; }}
+h1 {{ color: #fe980a; font-size: 1.6rem; margin: .25rem 0 1rem; }}
+h2 {{ color: #fe980a; font-size: 1.15rem; margin: 1.5rem 0 .5rem; }}
+ul, ol {{ padding-left: 1.4rem; }}
+li {{ margin: .2rem 0; }}
+p {{ margin: .35rem 0; }}
+a.pdf {{ display: inline-block; margin-top: 1.5rem; padding: .6rem 1rem; border-radius: 8px; background: #27a130; color: #fff; text-decoration: none; }}
+@media print {{ a.pdf {{ display: none; }} body {{ background: #fff; }} }}
+</style>
+</head>
+<body>
+<main>
+<header><p>Healthy Eating Guru &middot; {subtitle}</p></header>
+{body}
+<a class="pdf" href="{pdf_url}">Download PDF</a>
+</main>
+</body>
+</html>
+"""
+
+
+def _inline_html(text):
+    return BOLD.sub(r'<strong>\1</strong>', html.escape(text, quote=False))
+
+
+def to_html(doc, pdf_url):
+    subtitle = DOC_TITLES.get(doc.doc_type, "Healthy Recipe")
+    # Content without a title line gets the document type as its heading
+    title = plain(doc.title) if doc.title else subtitle
+    parts = [f"<h1>{html.escape(title)}</h1>"]
+    for section in doc.sections:
+        if section.heading is not None:
+            parts.append(f"<h2>{_inline_html(section.heading)}</h2>")
+        open_list = None
+        for node in section.nodes:
+            tag = 'ol' if isinstance(node, Step) else 'ul' if isinstance(node, Item) else None
+            if tag != open_list:
+                if open_list:
+                    parts.append(f"</{open_list}>")
+                if tag:
+                    parts.append(f"<{tag}>")
+                open_list = tag
+            parts.append(f"<li>{_inline_html(node.text)}</li>" if tag else f"<p>{_inline_html(node.text)}</p>")
+        if open_list:
+            parts.append(f"</{open_list}>")
+    return HTML_PAGE.format(title=html.escape(title), subtitle=html.escape(subtitle),
+                            body='\n'.join(parts), pdf_url=html.escape(pdf_url))
+
+
+def _ics_escape(text):
+    return text.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+
+def _fold(line):
+    # Content lines are at most 75 octets; continuation lines start with a space
+    data = line.encode('utf-8')
+    if len(data) <= 75:
+        return line
+    folded, chunk = [], b''
+    for char in line:
+        encoded = char.encode('utf-8')
+        if len(chunk) + len(encoded) > (75 if not folded else 74):
+            folded.append(chunk.decode('utf-8'))
+            chunk = b''
+        chunk += encoded
+    folded.append(chunk.decode('utf-8'))
+    return '\r\n '.join(folded)
+
+
+def to_ics(doc, uid, start=None):
+    """iCalendar events for a meal plan, or None when the content has no meals by day."""
+    events = [(section.day, meal) for section in doc.sections_of('day') for meal in section.of_type(Meal)]
+    if not events:
+        return None
+    start = start or datetime.date.today() + datetime.timedelta(days=1)
+    stamp = datetime.datetime.now(datetime.timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    lines = ['BEGIN:VCALENDAR', 'VERSION:2.0', 'PRODID:-//Healthy Eating Guru//Meal Plan//EN',
+             'CALSCALE:GREGORIAN', 'X-WR-CALNAME:Meal Plan']
+    for day, node in events:
+        meal, name, details = node.meal, node.name, node.details
+        hour, minute, duration = MEAL_TIMES[meal]
+        begin = datetime.datetime.combine(start + datetime.timedelta(days=day - 1), datetime.time(hour, minute))
+        end = begin + datetime.timedelta(minutes=duration)
+        lines += [
+            'BEGIN:VEVENT',
+            f"UID:{uid}-day{day}-{meal}@healthyeatingguru",
+            f"DTSTAMP:{stamp}",
+            f"DTSTART:{begin:%Y%m%dT%H%M%S}",
+            f"DTEND:{end:%Y%m%dT%H%M%S}",
+            f"SUMMARY:{_ics_escape(f'{meal.capitalize()}: {name}')}",
+        ]
+        if details:
+            lines.append(f"DESCRIPTION:{_ics_escape(details)}")
+        lines.append('END:VEVENT')
+    lines.append('END:VCALENDAR')
+    return '\r\n'.join(_fold(line) for line in lines) + '\r\n'
+
+
+def formats_for(doc_type):
+    return ['pdf', 'html', 'md', 'txt'] + (['ics'] if doc_type == 'meal_plan' else [])
+
+
+def export_urls(stem, doc_type):
+    """Download URL of every format for a stored content record."""
+    return {fmt: f"/download/{stem}.{fmt}" for fmt in formats_for(doc_type)}
+
+
+def _source_key(stem):
+    return f"{stem}.json"
+
+
+def save_source(stem, content, doc):
+    """Store the content record the exports of stem are rendered from: the text and its parsed Document."""
+    data = json.dumps({'content': content, 'doc_type': doc.doc_type, 'document': doc.to_data()}).encode('utf-8')
+    get_storage().save_bytes(_source_key(stem), data, 'application/json')
+    get_cache().set(f"export-source:{stem}", data, ttl=EXPORT_SOURCE_TTL)
+
+
+def load_source(stem):
+    """The content record of stem ({'content', 'doc_type', 'document'}), or None."""
+    data = get_cache().get(f"export-source:{stem}")
+    if data is None:
+        data = get_storage().load_bytes(_source_key(stem))
+        if data is None:
+            return None
+        get_cache().set(f"export-source:{stem}", data, ttl=EXPORT_SOURCE_TTL)
+    source = json.loads(data)
+    source['document'] = Document.from_data(source['document'])
+    return source
+
+
+def render(fmt, source, stem):
+    """A cheap export of a content record as bytes, or None if the format does not apply."""
+    doc = source['document']
+    if fmt == 'html':
+        body = to_html(doc, f"/download/{stem}.pdf")
+    elif fmt == 'md':
+        body = doc.markdown()
+    elif fmt == 'txt':
+        body = to_text(doc)
+    elif fmt == 'ics' and doc.doc_type == 'meal_plan':
+        body = to_ics(doc, stem)
+    else:
+        body = None
+    metrics.inc('export_renders_total', format=fmt, result='ok' if body is not None else 'not_applicable')
+    return body.encode('utf-8') if body is not None else None
+
+
+def content_disposition(fmt, filename):
+    """Readable formats open in the browser; calendars are downloaded."""
+    return f'{"inline" if fmt in INLINE_FORMATS else "attachment"}; filename="{filename}"'
@@ -0,0 +1,133 @@
+"""
+Fast path for /chat messages that need no generation.
+
+Greetings, empty messages, thanks and a few easy questions ("what can you
+do?", "which diets do you support?") make up a large share of chat traffic.
+respond() answers them before the main pipeline: no parameter extraction, no
+logging of the raw message and no model call. The replies are serialized to
+JSON bytes once at import, and small request bodies that got a canned reply
+are remembered, so a repeated "hi" from the widget skips the JSON parse too.
+
+A message only takes the fast path when it matches one of the phrases below
+as a whole and contains none of the intent keywords, so "hi, recipe for
+pasta" still goes to the pipeline.
+"""
+
+import json
+import re
+
+from flask import Response, request
+
+import metrics
+
+# Keywords that make a message actionable, by request type (used by extract_parameters too)
+INTENT_KEYWORDS = {
+    'recipe': ('recipe', 'cook', 'make', 'prepare', 'how to make', 'how do i make'),
+    'meal_plan': ('meal plan', 'weekly plan', 'day plan', 'meal schedule'),
+    'grocery_list': ('grocery', 'shopping', 'shopping list', 'ingredients list'),
+}
+
+DIETS = ('vegan', 'vegetarian', 'keto', 'paleo', 'gluten-free', 'dairy-free', 'low-carb',
+         'high-protein', 'kosher', 'halal', 'pescatarian', 'whole30')
+
+WELCOME = """Welcome to Healthy Eating Guru! 🥗
+
+I can help you with:
+• **Recipes** - "Recipe with chicken and vegetables"
+• **Meal Plans** - "Create a 7-day vegan meal plan"
+• **Grocery Lists** - "Generate grocery list for 4 people"
+
+What would you like today?"""
+
+REPLIES = {
+    'empty': WELCOME,
+    'greeting': WELCOME,
+    'help': WELCOME + """
+
+Add details to get exactly what you need: number of days, diet, cuisine, servings, a daily calorie target or a budget. For example: "5-day mediterranean meal plan, 1800 calories, on a budget".""",
+    'diets': ("I can plan around these diets: " + ', '.join(DIETS) + ".\n\n"
+              'Just mention one, like "Create a 7-day keto meal plan" or "Halal recipe with chicken".'),
+    'pdf': ("Every recipe, meal plan and grocery list comes with a printable PDF. "
+            "Ask for one and use the download link under the answer."),
+    'thanks': "You're welcome! Want a recipe, a meal plan or a grocery list next?",
+    'goodbye': "Happy cooking! Come back any time you need a recipe or a meal plan. 👋",
+}
+
+# Pre-serialized response bodies
+RESPONSES = {name: json.dumps({'response': text}).encode('utf-8') for name, text in REPLIES.items()}
+
+# Whole messages (after normalize) answered by each reply
+PHRASES = {
+    'greeting': ('hi', 'hello', 'hey', 'hiya', 'howdy', 'yo', 'greetings', 'good morning',
+                 'good afternoon', 'good evening', 'hi there', 'hello there', 'hey there', 'start',
+                 'get started'),
+    'help': ('help', 'menu', 'options', 'what can you do', 'what do you do', 'how does this work',
+             'how does it work', 'how do i use this', 'what are you', 'who are you', 'what can i ask'),
+    'thanks': ('thanks', 'thank you', 'thx', 'ty', 'thanks a lot', 'thank you so much', 'great thanks',
+               'awesome thanks', 'perfect thanks', 'cool', 'ok', 'okay', 'great', 'awesome', 'perfect'),
+    'goodbye': ('bye', 'goodbye', 'see you', 'see ya', 'good night', 'later'),
+}
+PHRASE_REPLY = {phrase: name for name, phrases in PHRASES.items() for phrase in phrases}
+
+# Easy questions with a little variation in wording
+PATTERNS = (
+    ('diets', re.compile(r'^(what|which) (diets?|dietary (options|preferences|restrictions))\b.*$')),
+    ('diets', re.compile(r'^(do|can) you (support|handle|do) (special )?diets?$')),
+    ('pdf', re.compile(r'^(can|do|how (can|do)) (i|you) (get|download|save|print)( (a|the|my))? (pdf|printout|file)s?$')),
+)
+
+MAX_FAST_BODY = 512     # larger bodies go straight to the pipeline
+MEMO_SIZE = 4096        # distinct fast-path request bodies remembered
+
+_NOT_ALPHA = re.compile(r"[^a-z0-9' -]+")
+_memo = {}
+
+
+def normalize(message):
+    """Lowercase, drop punctuation and emoji, collapse whitespace."""
+    return ' '.join(_NOT_ALPHA.sub(' ', message.lower()).split()).strip(" '-")
+
+
+def classify(message):
+    """Name of the canned reply for message, or None when it needs the pipeline."""
+    text = normalize(message)
+    if not text:
+        return 'empty'
+    if any(word in text for words in INTENT_KEYWORDS.values() for word in words):
+        return None
+    name = PHRASE_REPLY.get(text)
+    if name:
+        return name
+    for name, pattern in PATTERNS:
+        if pattern.match(text):
+            return name
+    return None
+
+
+def _classify_body(body):
+    try:
+        data = json.loads(body) if body else None
+    except ValueError:
+        return None
+    message = data.get('message') if isinstance(data, dict) else None
+    if message is not None and not isinstance(message, str):
+        return None
+    return classify(message or '')
+
+
+def respond():
+    """A prebuilt response for the current /chat request, or None to run the pipeline."""
+    length = request.content_length
+    if length is None or length > MAX_FAST_BODY:
+        return None
+    body = request.get_data(cache=True)
+    name = _memo.get(body)
+    if name is None:
+        name = _classify_body(body)
+        if name is None:
+            return None
+        # Only bodies answered here: other messages are user text, and would crowd out real hits
+        if len(_memo) < MEMO_SIZE:
+            _memo[body] = name
+    metrics.inc('chat_fast_path_total', kind=name)
+    return Response(RESPONSES[name], mimetype='application/json')
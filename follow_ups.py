@@ -0,0 +1,95 @@
+"""
+Follow-ups to a meal plan.
+
+After a meal plan the next message is almost always "grocery list" or "recipe
+for day 2 dinner". When a plan is served, remember_plan() keeps its recipes
+for the chat session, and resolve() recognizes a follow-up to it, so "recipe
+for day 5 breakfast" gets that day's recipe instead of an unrelated one and
+the grocery list covers exactly the plan's meals. build() produces the answer
+from the plan's own recipes in the dataset, with no model call, so there is
+nothing worth computing ahead of time.
+
+Plans are kept in the shared cache, so any worker answers the follow-up. They
+are only kept for clients that send an explicit X-Session-Id: a session
+derived from IP and User-Agent would hand one client's plan to another
+behind the same NAT.
+
+Configuration (environment):
+    FOLLOW_UP_TTL           seconds a served plan is kept for follow-ups (default 1800)
+"""
+
+import json
+import logging
+import os
+import re
+
+from flask import request
+
+from offline_engine import MEALS, RECIPES, RECIPE_TABLE
+from shared_cache import get_cache
+
+logger = logging.getLogger(__name__)
+
+FOLLOW_UP_TTL = int(os.getenv('FOLLOW_UP_TTL', 1800))
+
+SESSION_ID = re.compile(r'^[A-Za-z0-9-]{8,64}$')
+MEAL_PATTERN = '|'.join(MEALS)
+DAY_MEAL = re.compile(rf'\bday\s*(\d+)\W+(?:for\s+)?({MEAL_PATTERN})\b'
+                      rf'|\b({MEAL_PATTERN})\W+(?:on\s+|for\s+|of\s+)?day\s*(\d+)\b')
+
+_builder = None
+
+
+def configure(builder):
+    """Set builder(artifact, days, params) -> chat response dict (or None), which produces follow-ups."""
+    global _builder
+    _builder = builder
+
+
+def session_id():
+    """The chat session of the current request (X-Session-Id), or None if the client sent none."""
+    sid = request.headers.get('X-Session-Id', '')
+    return sid if SESSION_ID.match(sid) else None
+
+
+def remember_plan(session, days, params):
+    """Keep the recipes of a served plan so follow-ups can refer to its days."""
+    if session is None:
+        return
+    plan = {'ids': [[day[meal]['id'] for meal in MEALS] for day in days], 'params': params}
+    get_cache().set(f"plan:{session}", json.dumps(plan).encode('utf-8'), ttl=FOLLOW_UP_TTL)
+
+
+def plan_for(session):
+    """(days, params) of the session's last plan, or None."""
+    if session is None:
+        return None
+    data = get_cache().get(f"plan:{session}")
+    if data is None:
+        return None
+    plan = json.loads(data)
+    try:
+        days = [{meal: RECIPES[RECIPE_TABLE.index[rid]] for meal, rid in zip(MEALS, ids)} for ids in plan['ids']]
+    except KeyError:
+        return None     # a recipe that has left the dataset since the plan was served
+    return days, plan['params']
+
+
+def resolve(plan, message, params):
+    """The follow-up artifact a message asks of plan ('grocery_list' or 'recipe:<day>:<meal>'), or None."""
+    days, plan_params = plan
+    match = DAY_MEAL.search(message.lower())
+    if match and params['type'] in ('recipe', None):
+        day = int(match.group(1) or match.group(4))
+        if 1 <= day <= len(days):
+            return f"recipe:{day}:{match.group(2) or match.group(3)}"
+    if (params['type'] == 'grocery_list' and params['days'] in (None, len(days))
+            and params['servings'] == plan_params.get('servings')):
+        return 'grocery_list'
+    return None
+
+
+def build(plan, artifact):
+    """The chat response for a follow-up artifact of plan (None if it could not be produced)."""
+    days, params = plan
+    return _builder(artifact, days, params)
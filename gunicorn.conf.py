@@ -0,0 +1,56 @@
+"""
+Gunicorn configuration: gunicorn -c gunicorn.conf.py Meal_Planner_Chatbot:app
+
+Workers and threads are sized from the CPU count and I/O-wait ratio and then
+autoscaled by concurrency.Controller; see concurrency.py. Workers are recycled
+after about GUNICORN_MAX_REQUESTS requests (with jitter so they do not all
+restart together), and earlier when their resident set exceeds
+WORKER_RSS_LIMIT_MB (see memory.py). The master also runs the daily catalog
+refresh (see catalog.py).
+"""
+
+import os
+
+import catalog
+import concurrency
+import memory
+import model_router
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+worker_class = 'gthread'
+workers, threads = concurrency.size_for()
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+graceful_timeout = 30
+keepalive = 5
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = max_requests // 10
+loglevel = os.getenv('LOG_LEVEL', 'info').lower()
+
+
+def when_ready(server):
+    stats = concurrency.get_stats()
+    stats.set_header(workers, threads, 0, concurrency.IO_RATIO, 0.0)
+    server.log.info(f"{concurrency.CPUS} CPUs: starting {workers} workers x {threads} threads, "
+                    f"scaling {concurrency.MIN_WORKERS}..{concurrency.MAX_WORKERS}")
+    concurrency.Controller(server, stats).start()
+    catalog.start_scheduler(server)
+
+
+def post_fork(server, worker):
+    # get_stats() opens the file again in the worker (the master's fd would share its flock); claim our slot
+    concurrency.get_stats().claim(worker.pid, worker.cfg.threads)
+    concurrency.register_metrics()
+    model_router.set_request_threads(worker.cfg.threads)
+
+
+def pre_request(worker, req):
+    concurrency.get_stats().request_started()
+
+
+def post_request(worker, req, environ, resp):
+    concurrency.get_stats().request_finished()
+    memory.recycle_if_over_budget(worker)
+
+
+def child_exit(server, worker):
+    concurrency.get_stats().release(worker.pid)
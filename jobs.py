@@ -0,0 +1,607 @@
+"""
+Durable background jobs for long generations.
+
+A 30-day meal plan or a batch request can outlast gunicorn's request
+timeout, and when a web worker is recycled or killed mid-request the work is
+lost. chat() now hands such requests to a job queue and answers 202 at once
+with a job URL. Separate worker processes run the jobs: `python jobs.py
+worker`, the Procfile's worker process. Web latency no longer depends on
+job length.
+
+Jobs survive crashes and retries:
+- stages: a handler runs its work as named stages (job.stage('generate',
+  fn)). Each finished stage's result is checkpointed in the broker, so a
+  retried job skips the stages it already finished. For chat those are the
+  model text, the content record and the PDF.
+- leases: a worker claims a job for JOB_LEASE_SECONDS and renews the lease
+  while the job runs. If the worker dies, the lease runs out and another
+  worker resumes the job from its last checkpoint. Writes from a worker
+  that lost its lease are refused (LeaseLost), so a stalled worker cannot
+  overwrite the new owner's progress.
+- retries: a failed attempt is retried with exponential backoff, up to
+  JOB_MAX_ATTEMPTS attempts in all. Enqueueing is idempotent too when the
+  client sends an Idempotency-Key header: the same key returns the same
+  job.
+- progress: the current stage and a 0..1 fraction, readable at GET
+  /jobs/<id>.
+
+Brokers:
+- SQLiteBroker (default) is a local stand-in. Web and worker processes
+  share one database file, so they must run on the same machine or volume.
+- RedisBroker (JOB_BROKER_URL=redis://...) works with Redis or anything
+  that speaks its protocol, so web and workers can run on different
+  hosts. It needs the redis package.
+
+When no worker has sent a heartbeat in the last JOB_WORKER_TIMEOUT seconds
+(for example in local development with only the web process), requests run
+inline as before.
+
+Deploying on Railway: railway.json starts only the web process, and each
+Railway service has its own filesystem, so the SQLite broker cannot be
+shared. To run jobs off the web workers:
+1. add a Redis service to the project
+2. add a second service from this repository with its config file path set
+   to railway.worker.json (start command `python jobs.py worker`)
+3. set JOB_BROKER_URL=${{Redis.REDIS_URL}} on both the web and the worker
+   service
+Until then every request runs inline in the web process. A worker started
+on Railway without JOB_BROKER_URL logs a warning.
+
+Configuration (environment):
+    JOBS_ENABLED            1 (default) or 0 to always run inline
+    JOB_BROKER_URL          redis://... to use the Redis broker (default: SQLite)
+    JOB_DB                  SQLite broker path (default /tmp/meal-jobs.sqlite3)
+    JOB_INLINE_MAX_DAYS     meal plans longer than this are queued (default 7)
+    JOB_LEASE_SECONDS       lease length, renewed while a job runs (default 60)
+    JOB_MAX_ATTEMPTS        attempts before a job fails for good (default 3)
+    JOB_WORKER_THREADS      jobs one worker process runs at once (default 2)
+    JOB_RETENTION_HOURS     finished jobs are deleted after this (default 24)
+    WORKER_RSS_LIMIT_MB     a worker over this finishes its jobs and exits (see memory.py)
+"""
+
+import argparse
+import importlib
+import json
+import logging
+import os
+import secrets
+import signal
+import socket
+import sqlite3
+import sys
+import threading
+import time
+
+import memory
+import metrics
+
+try:
+    import redis
+except ImportError:  # the Redis broker needs the redis package
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+JOBS_ENABLED = os.getenv('JOBS_ENABLED', '1') == '1'
+JOB_BROKER_URL = os.getenv('JOB_BROKER_URL')
+JOB_DB = os.getenv('JOB_DB', '/tmp/meal-jobs.sqlite3')
+JOB_INLINE_MAX_DAYS = int(os.getenv('JOB_INLINE_MAX_DAYS', 7))
+JOB_LEASE_SECONDS = int(os.getenv('JOB_LEASE_SECONDS', 60))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 3))
+JOB_WORKER_THREADS = int(os.getenv('JOB_WORKER_THREADS', 2))
+JOB_RETENTION = float(os.getenv('JOB_RETENTION_HOURS', 24)) * 3600
+JOB_WORKER_TIMEOUT = 30     # seconds without a heartbeat before a worker counts as gone
+POLL_INTERVAL = 1.0         # idle worker threads check for work this often
+RETRY_BASE_DELAY = 5        # seconds; doubled per attempt
+STOP_GRACE = 25             # seconds a stopping worker waits for running jobs
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    stage TEXT,
+    progress REAL NOT NULL DEFAULT 0,
+    state TEXT NOT NULL DEFAULT '{}',
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    idempotency_key TEXT UNIQUE,
+    run_after REAL NOT NULL,
+    lease_owner TEXT,
+    lease_until REAL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, run_after);
+CREATE TABLE IF NOT EXISTS workers (
+    id TEXT PRIMARY KEY,
+    last_seen REAL NOT NULL
+);
+"""
+
+HANDLERS = {}
+
+
+class LeaseLost(Exception):
+    """Raised when a worker writes to a job whose lease another worker now holds."""
+
+
+def retry_delay(attempts):
+    return RETRY_BASE_DELAY * 2 ** max(attempts - 1, 0)
+
+
+def public(record):
+    """The fields of a job record a client may see."""
+    view = {key: record[key] for key in ('id', 'kind', 'status', 'stage', 'progress', 'attempts')}
+    if record['status'] == 'done':
+        view['result'] = record['result']
+    if record.get('error') and record['status'] in ('queued', 'failed'):
+        view['error'] = record['error']
+    return view
+
+
+class SQLiteBroker:
+    """Jobs in a local SQLite database (WAL, one connection per thread)."""
+
+    def __init__(self, path=JOB_DB):
+        self.path = path
+        self.local = threading.local()
+
+    def _db(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(SCHEMA)
+            self.local.conn = conn
+        return conn
+
+    def enqueue(self, kind, payload, idempotency_key=None):
+        now = time.time()
+        job_id = secrets.token_hex(16)
+        try:
+            self._db().execute(
+                "INSERT INTO jobs (id, kind, payload, status, idempotency_key, run_after, created_at, updated_at) "
+                "VALUES (?, ?, ?, 'queued', ?, ?, ?, ?)",
+                (job_id, kind, json.dumps(payload), idempotency_key, now, now, now),
+            )
+        except sqlite3.IntegrityError:
+            row = self._db().execute("SELECT id FROM jobs WHERE idempotency_key = ?", (idempotency_key,)).fetchone()
+            return row['id']
+        return job_id
+
+    def claim(self, worker_id):
+        """Lease the next runnable job (queued and due, or running with an expired lease)."""
+        conn = self._db()
+        while True:
+            now = time.time()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = conn.execute(
+                    "SELECT id, attempts FROM jobs WHERE (status = 'queued' AND run_after <= ?) "
+                    "OR (status = 'running' AND lease_until < ?) ORDER BY run_after LIMIT 1",
+                    (now, now),
+                ).fetchone()
+                if row is not None and row['attempts'] >= JOB_MAX_ATTEMPTS:
+                    # Its last worker died holding it
+                    conn.execute("UPDATE jobs SET status = 'failed', lease_owner = NULL, updated_at = ?, "
+                                 "error = 'worker lost during last attempt' WHERE id = ?", (now, row['id']))
+                    conn.execute('COMMIT')
+                    continue
+                if row is not None:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'running', lease_owner = ?, lease_until = ?, "
+                        "attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                        (worker_id, now + JOB_LEASE_SECONDS, now, row['id']),
+                    )
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            return self._record(row['id']) if row is not None else None
+
+    def _owned_update(self, job_id, worker_id, assignments, values):
+        cursor = self._db().execute(
+            f"UPDATE jobs SET {assignments}, updated_at = ? WHERE id = ? AND lease_owner = ? AND status = 'running'",
+            (*values, time.time(), job_id, worker_id),
+        )
+        if cursor.rowcount == 0:
+            raise LeaseLost(job_id)
+
+    def renew(self, job_id, worker_id):
+        self._owned_update(job_id, worker_id, "lease_until = ?", (time.time() + JOB_LEASE_SECONDS,))
+
+    def checkpoint(self, job_id, worker_id, stage, state, progress):
+        self._owned_update(job_id, worker_id, "stage = ?, state = ?, progress = ?, lease_until = ?",
+                           (stage, json.dumps(state), progress, time.time() + JOB_LEASE_SECONDS))
+
+    def complete(self, job_id, worker_id, result):
+        self._owned_update(job_id, worker_id, "status = 'done', result = ?, progress = 1, lease_owner = NULL",
+                           (json.dumps(result),))
+
+    def fail(self, job_id, worker_id, error, attempts):
+        if attempts < JOB_MAX_ATTEMPTS:
+            self._owned_update(job_id, worker_id, "status = 'queued', error = ?, run_after = ?, lease_owner = NULL",
+                               (error, time.time() + retry_delay(attempts)))
+            return 'retried'
+        self._owned_update(job_id, worker_id, "status = 'failed', error = ?, lease_owner = NULL", (error,))
+        return 'failed'
+
+    def _record(self, job_id):
+        row = self._db().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        record = dict(row)
+        record['payload'] = json.loads(record['payload'])
+        record['state'] = json.loads(record['state'])
+        record['result'] = json.loads(record['result']) if record['result'] else None
+        return record
+
+    def get(self, job_id):
+        return self._record(job_id)
+
+    def heartbeat(self, worker_id):
+        self._db().execute("INSERT OR REPLACE INTO workers (id, last_seen) VALUES (?, ?)", (worker_id, time.time()))
+
+    def workers_alive(self):
+        cutoff = time.time() - JOB_WORKER_TIMEOUT
+        return self._db().execute("SELECT COUNT(*) FROM workers WHERE last_seen > ?", (cutoff,)).fetchone()[0]
+
+    def counts(self):
+        rows = self._db().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+    def purge(self, older_than):
+        cutoff = time.time() - older_than
+        conn = self._db()
+        conn.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?", (cutoff,))
+        conn.execute("DELETE FROM workers WHERE last_seen < ?", (cutoff,))
+
+
+# Update job fields only while worker_id still holds the lease: KEYS[1] job hash, ARGV[1] worker, then field/value pairs
+_OWNED_HSET = """
+if redis.call('HGET', KEYS[1], 'lease_owner') == ARGV[1] and redis.call('HGET', KEYS[1], 'status') == 'running' then
+    redis.call('HSET', KEYS[1], unpack(ARGV, 2))
+    return 1
+end
+return 0
+"""
+
+
+class RedisBroker:
+    """The same jobs in Redis: a hash per job, a ready set and a lease set scored by time."""
+
+    READY = 'jobs:ready'
+    LEASES = 'jobs:leases'
+    WORKERS = 'jobs:workers'
+
+    def __init__(self, url):
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.owned_hset = self.client.register_script(_OWNED_HSET)
+
+    @staticmethod
+    def _key(job_id):
+        return f"job:{job_id}"
+
+    def enqueue(self, kind, payload, idempotency_key=None):
+        job_id = secrets.token_hex(16)
+        if idempotency_key:
+            idem = f"jobs:idempotency:{idempotency_key}"
+            if not self.client.set(idem, job_id, nx=True, ex=int(JOB_RETENTION)):
+                return self.client.get(idem)
+        now = time.time()
+        pipe = self.client.pipeline()
+        pipe.hset(self._key(job_id), mapping={
+            'id': job_id, 'kind': kind, 'payload': json.dumps(payload), 'status': 'queued', 'stage': '',
+            'progress': 0, 'state': '{}', 'result': '', 'error': '', 'attempts': 0, 'lease_owner': '',
+            'created_at': now, 'updated_at': now,
+        })
+        pipe.zadd(self.READY, {job_id: now})
+        pipe.execute()
+        return job_id
+
+    def claim(self, worker_id):
+        now = time.time()
+        # Jobs whose worker stopped renewing go back to the ready set (ZREM decides which worker moves them)
+        for job_id in self.client.zrangebyscore(self.LEASES, '-inf', now, start=0, num=10):
+            if self.client.zrem(self.LEASES, job_id):
+                self.client.hset(self._key(job_id), mapping={'status': 'queued', 'lease_owner': ''})
+                self.client.zadd(self.READY, {job_id: now})
+        for job_id in self.client.zrangebyscore(self.READY, '-inf', now, start=0, num=5):
+            if not self.client.zrem(self.READY, job_id):
+                continue    # another worker took it
+            key = self._key(job_id)
+            if int(self.client.hget(key, 'attempts') or 0) >= JOB_MAX_ATTEMPTS:
+                self.client.hset(key, mapping={'status': 'failed', 'error': 'worker lost during last attempt',
+                                               'updated_at': now})
+                self.client.expire(key, int(JOB_RETENTION))
+                continue
+            pipe = self.client.pipeline()
+            pipe.hset(key, mapping={'status': 'running', 'lease_owner': worker_id, 'updated_at': now})
+            pipe.hincrby(key, 'attempts', 1)
+            pipe.zadd(self.LEASES, {job_id: now + JOB_LEASE_SECONDS})
+            pipe.execute()
+            return self._record(job_id)
+        return None
+
+    def _owned_update(self, job_id, worker_id, fields):
+        fields = dict(fields, updated_at=time.time())
+        args = [worker_id] + [str(item) for pair in fields.items() for item in pair]
+        if not self.owned_hset(keys=[self._key(job_id)], args=args):
+            raise LeaseLost(job_id)
+
+    def renew(self, job_id, worker_id):
+        self._owned_update(job_id, worker_id, {})
+        self.client.zadd(self.LEASES, {job_id: time.time() + JOB_LEASE_SECONDS})
+
+    def checkpoint(self, job_id, worker_id, stage, state, progress):
+        self._owned_update(job_id, worker_id, {'stage': stage, 'state': json.dumps(state), 'progress': progress})
+        self.client.zadd(self.LEASES, {job_id: time.time() + JOB_LEASE_SECONDS})
+
+    def complete(self, job_id, worker_id, result):
+        self._owned_update(job_id, worker_id, {'status': 'done', 'result': json.dumps(result), 'progress': 1,
+                                               'lease_owner': ''})
+        self.client.zrem(self.LEASES, job_id)
+        self.client.expire(self._key(job_id), int(JOB_RETENTION))
+
+    def fail(self, job_id, worker_id, error, attempts):
+        retry = attempts < JOB_MAX_ATTEMPTS
+        self._owned_update(job_id, worker_id, {'status': 'queued' if retry else 'failed', 'error': error,
+                                               'lease_owner': ''})
+        self.client.zrem(self.LEASES, job_id)
+        if retry:
+            self.client.zadd(self.READY, {job_id: time.time() + retry_delay(attempts)})
+            return 'retried'
+        self.client.expire(self._key(job_id), int(JOB_RETENTION))
+        return 'failed'
+
+    def _record(self, job_id):
+        data = self.client.hgetall(self._key(job_id))
+        if not data:
+            return None
+        return {
+            'id': data['id'], 'kind': data['kind'], 'payload': json.loads(data['payload']),
+            'status': data['status'], 'stage': data['stage'] or None, 'progress': float(data['progress']),
+            'state': json.loads(data['state']), 'result': json.loads(data['result']) if data['result'] else None,
+            'error': data['error'] or None, 'attempts': int(data['attempts']),
+        }
+
+    def get(self, job_id):
+        return self._record(job_id)
+
+    def heartbeat(self, worker_id):
+        self.client.zadd(self.WORKERS, {worker_id: time.time()})
+
+    def workers_alive(self):
+        return self.client.zcount(self.WORKERS, time.time() - JOB_WORKER_TIMEOUT, '+inf')
+
+    def counts(self):
+        return {'queued': self.client.zcard(self.READY), 'running': self.client.zcard(self.LEASES)}
+
+    def purge(self, older_than):
+        # Finished jobs expire on their own
+        self.client.zremrangebyscore(self.WORKERS, '-inf', time.time() - older_than)
+
+
+_broker = None
+
+
+def get_broker():
+    """Return the configured broker (singleton)."""
+    global _broker
+    if _broker is None:
+        if JOB_BROKER_URL and redis is None:
+            raise RuntimeError("JOB_BROKER_URL is set but the redis package is not installed")
+        _broker = RedisBroker(JOB_BROKER_URL) if JOB_BROKER_URL else SQLiteBroker()
+        logger.info(f"Job broker: {type(_broker).__name__}")
+    return _broker
+
+
+class Job:
+    """A claimed job as its handler sees it."""
+
+    def __init__(self, broker, record, worker_id):
+        self.broker = broker
+        self.worker_id = worker_id
+        self.id = record['id']
+        self.kind = record['kind']
+        self.payload = record['payload']
+        self.state = record['state']
+        self.attempts = record['attempts']
+
+    def stage(self, name, fn, progress):
+        """Run fn once per job: a stage finished by an earlier attempt returns its checkpointed result."""
+        if name in self.state:
+            return self.state[name]
+        result = fn()
+        self.state[name] = result
+        self.broker.checkpoint(self.id, self.worker_id, name, self.state, progress)
+        return result
+
+
+def register(kind, handler):
+    """Set handler(job) -> JSON-serializable result for jobs of kind."""
+    HANDLERS[kind] = handler
+
+
+_alive = {'checked': 0.0, 'count': 0}
+
+
+def workers_available():
+    """Whether any worker process has checked in recently (looked up at most every 5 seconds)."""
+    now = time.time()
+    if now - _alive['checked'] > 5:
+        try:
+            _alive['count'] = get_broker().workers_alive()
+        except Exception as e:
+            logger.warning(f"Job broker unavailable: {e}")
+            _alive['count'] = 0
+        _alive['checked'] = now
+    return _alive['count'] > 0
+
+
+def should_queue(params, data):
+    """Whether a chat request is long enough to run as a job (and a worker is there to run it)."""
+    if not JOBS_ENABLED:
+        return False
+    long_plan = params['type'] == 'meal_plan' and (params['days'] or 7) > JOB_INLINE_MAX_DAYS
+    if not (long_plan or data.get('async') is True):
+        return False
+    if not workers_available():
+        metrics.inc('jobs_inline_total', reason='no_workers')
+        return False
+    return True
+
+
+def enqueue(kind, payload, idempotency_key=None):
+    job_id = get_broker().enqueue(kind, payload, idempotency_key)
+    metrics.inc('jobs_enqueued_total', kind=kind)
+    logger.info(f"Queued {kind} job {job_id}")
+    return job_id
+
+
+def status(job_id):
+    """What GET /jobs/<id> returns, or None for an unknown job."""
+    record = get_broker().get(job_id)
+    return public(record) if record else None
+
+
+def _collect():
+    try:
+        counts = get_broker().counts()
+    except Exception:
+        return []
+    return [('jobs', {'status': status}, count) for status, count in sorted(counts.items())]
+
+
+metrics.register_collector(_collect)
+
+
+class Worker:
+    """Claims and runs jobs on JOB_WORKER_THREADS threads, renewing the leases of running jobs."""
+
+    def __init__(self, broker, threads=JOB_WORKER_THREADS):
+        self.broker = broker
+        self.threads = threads
+        self.id = f"{socket.gethostname()}-{os.getpid()}-{secrets.token_hex(3)}"
+        self.running = {}           # job id -> Job
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.recycled = False
+
+    def execute(self, record):
+        job = Job(self.broker, record, self.id)
+        handler = HANDLERS.get(job.kind)
+        with self.lock:
+            self.running[job.id] = job
+        started = time.monotonic()
+        try:
+            if handler is None:
+                raise RuntimeError(f"no handler for job kind {job.kind!r}")
+            result = handler(job)
+            self.broker.complete(job.id, self.id, result)
+            logger.info(f"Job {job.id} ({job.kind}) done in {time.monotonic() - started:.1f}s, "
+                        f"attempt {job.attempts}")
+        except LeaseLost:
+            logger.warning(f"Job {job.id} lease lost; another worker owns it now")
+        except Exception as e:
+            logger.exception(f"Job {job.id} ({job.kind}) attempt {job.attempts} failed: {e}")
+            try:
+                outcome = self.broker.fail(job.id, self.id, str(e), job.attempts)
+                logger.info(f"Job {job.id} {outcome}")
+            except LeaseLost:
+                pass
+        finally:
+            with self.lock:
+                self.running.pop(job.id, None)
+            rss = memory.over_budget()
+            if rss is not None and not self.stopping.is_set():
+                logger.warning(f"Job worker {self.id} uses {rss / 1e6:.0f} MB, over the "
+                               f"{memory.WORKER_RSS_LIMIT / 1e6:.0f} MB budget; stopping")
+                self.recycled = True
+                self.stopping.set()
+
+    def _loop(self):
+        while not self.stopping.is_set():
+            try:
+                record = self.broker.claim(self.id)
+            except Exception as e:
+                logger.warning(f"Claiming a job failed: {e}")
+                record = None
+            if record is None:
+                self.stopping.wait(POLL_INTERVAL)
+                continue
+            self.execute(record)
+
+    def _maintain(self):
+        # Heartbeat, lease renewal and cleanup, a few times per lease
+        last_purge = 0.0
+        while not self.stopping.wait(min(JOB_LEASE_SECONDS / 3, 10)):
+            try:
+                self.broker.heartbeat(self.id)
+                with self.lock:
+                    running = list(self.running.values())
+                for job in running:
+                    try:
+                        self.broker.renew(job.id, self.id)
+                    except LeaseLost:
+                        logger.warning(f"Job {job.id} lease lost while running")
+                if time.time() - last_purge > 3600:
+                    self.broker.purge(JOB_RETENTION)
+                    last_purge = time.time()
+            except Exception as e:
+                logger.warning(f"Job worker maintenance failed: {e}")
+
+    def run(self):
+        """Run until SIGTERM/SIGINT, then let running jobs finish for up to STOP_GRACE seconds."""
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda *_: self.stopping.set())
+        self.broker.heartbeat(self.id)
+        logger.info(f"Job worker {self.id} started with {self.threads} threads "
+                    f"({type(self.broker).__name__}, handlers: {', '.join(sorted(HANDLERS)) or 'none'})")
+        loops = [threading.Thread(target=self._loop, name=f'job-{n}', daemon=True) for n in range(self.threads)]
+        maintainer = threading.Thread(target=self._maintain, name='job-maintain', daemon=True)
+        for thread in loops + [maintainer]:
+            thread.start()
+        self.stopping.wait()
+        deadline = time.monotonic() + STOP_GRACE
+        for thread in loops:
+            thread.join(timeout=max(deadline - time.monotonic(), 0))
+        # Jobs still running are resumed from their last checkpoint once their leases run out
+        logger.info(f"Job worker {self.id} stopped ({len(self.running)} jobs left to lease expiry)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Background job worker and queue inspection")
+    sub = parser.add_subparsers(dest='command', required=True)
+    worker_cmd = sub.add_parser('worker', help="run jobs until stopped")
+    worker_cmd.add_argument('--threads', type=int, default=JOB_WORKER_THREADS)
+    worker_cmd.add_argument('--app', default='Meal_Planner_Chatbot', help="module that registers the job handlers")
+    status_cmd = sub.add_parser('status', help="print a job, or queue counts")
+    status_cmd.add_argument('job_id', nargs='?')
+    args = parser.parse_args()
+
+    if args.command == 'worker':
+        if not JOB_BROKER_URL and os.getenv('RAILWAY_ENVIRONMENT'):
+            logger.warning("No JOB_BROKER_URL: this worker's SQLite broker is not shared with the web "
+                           "service, so it will never receive jobs (see the jobs.py docstring)")
+        importlib.import_module(args.app)
+        worker = Worker(get_broker(), args.threads)
+        worker.run()
+        if worker.recycled:
+            # A non-zero status, so process managers that restart on failure start a fresh worker
+            sys.exit(1)
+    elif args.job_id:
+        print(json.dumps(get_broker().get(args.job_id), indent=2))
+    else:
+        print(json.dumps(get_broker().counts(), indent=2))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    # Run the importable module, whose HANDLERS the app registers into, rather than this __main__ copy
+    importlib.import_module('jobs').main()
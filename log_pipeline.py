@@ -0,0 +1,328 @@
+"""
+Buffered, non-blocking logging.
+
+configure() replaces logging.basicConfig for the app. The only work left on
+the request thread is a QueueHandler: the message is interpolated and the
+record is put on an in-memory queue. A background writer thread formats the
+records as one JSON object per line and writes them to stdout in batches
+(one write call per LOG_BATCH records, or every LOG_FLUSH_INTERVAL seconds),
+so request threads and workers no longer contend for stdout.
+
+Records are made PII-safe by the writer before anything is output: email
+addresses and free-standing long digit runs (phone and card numbers) are masked and
+messages are cut to LOG_MAX_CHARS. Call sites that log user input should also pass it through
+redact(), which truncates it further.
+
+High-volume INFO logging is sampled per call site: the first LOG_BURST
+records a second from one source line pass, after that only one in
+LOG_SAMPLE_EVERY, carrying a "sampled" field with its weight. Warnings and
+errors are never sampled. If the queue fills up (the writer cannot keep up),
+records are dropped and counted rather than blocking the request.
+
+Per-request overhead before and after:
+    python log_pipeline.py --bench
+
+Configuration (environment):
+    LOG_LEVEL           root level (default INFO)
+    LOG_FORMAT          json (default) or text
+    LOG_MAX_CHARS       longest message kept (default 2000)
+    LOG_BURST           INFO records per call site per second before sampling (default 20)
+    LOG_SAMPLE_EVERY    keep one in this many INFO records beyond the burst (default 10)
+"""
+
+import argparse
+import atexit
+import datetime
+import io
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import re
+import subprocess
+import sys
+import threading
+import time
+
+import metrics
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')
+LOG_MAX_CHARS = int(os.getenv('LOG_MAX_CHARS', 2000))
+LOG_BURST = int(os.getenv('LOG_BURST', 20))
+LOG_SAMPLE_EVERY = int(os.getenv('LOG_SAMPLE_EVERY', 10))
+LOG_BATCH = 256
+LOG_FLUSH_INTERVAL = 0.5
+QUEUE_SIZE = 10_000
+USER_TEXT_CHARS = 120
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+EMAIL = re.compile(r'[\w.+-]+@[\w-]+\.[\w.-]+')
+# Phone and card numbers stand alone: digits glued to letters, dashes, dots, slashes or colons are
+# filenames ("meal-plan-14days-20261019-153012.pdf"), timestamps and IDs, and are kept
+DIGIT_RUN = re.compile(r'(?<![\w.\-/:])\+?\(?\d(?:[\s().-]{0,2}\d){8,18}(?![\w\-/:]|\.\w)')
+
+# Attributes every LogRecord has; anything else came in through extra=
+_RECORD_FIELDS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+def scrub(text, limit=LOG_MAX_CHARS):
+    """Mask emails and long digit runs, and cut text to limit characters."""
+    text = DIGIT_RUN.sub('[number]', EMAIL.sub('[email]', text))
+    if len(text) > limit:
+        text = f"{text[:limit]}... [{len(text) - limit} more chars]"
+    return text
+
+
+def redact(text, limit=USER_TEXT_CHARS):
+    """User-supplied text for a log line: scrubbed and kept short."""
+    return scrub(str(text), limit)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with any extra= fields included."""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': scrub(record.getMessage()),
+            'pid': record.process,
+            'thread': record.threadName,
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class ScrubbingFormatter(logging.Formatter):
+    """The plain text format, scrubbed."""
+
+    def format(self, record):
+        return scrub(super().format(record))
+
+
+class SamplingFilter(logging.Filter):
+    """Sample INFO and below per call site once it exceeds LOG_BURST records a second."""
+
+    def __init__(self, burst=LOG_BURST, every=LOG_SAMPLE_EVERY):
+        super().__init__()
+        self.burst = burst
+        self.every = every
+        self.sites = {}     # (pathname, lineno) -> [second, count]
+
+    def filter(self, record):
+        if record.levelno > logging.INFO:
+            return True
+        second = int(record.created)
+        site = self.sites.get((record.pathname, record.lineno))
+        if site is None or site[0] != second:
+            # Racing threads can reset a counter twice; that only lets an extra record through
+            self.sites[(record.pathname, record.lineno)] = [second, 1]
+            return True
+        site[1] += 1
+        if site[1] <= self.burst:
+            return True
+        if (site[1] - self.burst) % self.every:
+            return False
+        record.sampled = self.every
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records, counted, once QUEUE_SIZE are waiting."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Interpolate now (args may be mutated later); scrubbing and formatting are left to the writer
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        if self.queue.qsize() >= QUEUE_SIZE:
+            self.dropped += 1
+            return
+        self.queue.put(record)
+
+
+class BatchWriter(threading.Thread):
+    """Drain the queue, format records and write them in batches."""
+
+    def __init__(self, log_queue, formatter, stream):
+        super().__init__(name='log-writer', daemon=True)
+        self.queue = log_queue
+        self.formatter = formatter
+        self.stream = stream
+        self.batch = []
+        self.stopping = False
+
+    def flush(self):
+        if self.batch:
+            try:
+                self.stream.write('\n'.join(self.batch) + '\n')
+                self.stream.flush()
+            except (OSError, ValueError):
+                pass
+            self.batch = []
+
+    def run(self):
+        while True:
+            try:
+                record = self.queue.get(timeout=LOG_FLUSH_INTERVAL)
+            except queue.Empty:
+                self.flush()
+                if self.stopping:
+                    return
+                continue
+            try:
+                self.batch.append(self.formatter.format(record))
+            except Exception:
+                self.batch.append(f"unformattable log record from {record.name}:{record.lineno}")
+            if len(self.batch) >= LOG_BATCH:
+                self.flush()
+
+    def stop(self):
+        self.stopping = True
+        self.join(timeout=LOG_FLUSH_INTERVAL * 4)
+        self.flush()
+
+
+_handler = None
+_writer = None
+
+
+def _make_formatter(fmt):
+    return JsonFormatter() if fmt == 'json' else ScrubbingFormatter(TEXT_FORMAT)
+
+
+def configure(level=LOG_LEVEL, fmt=LOG_FORMAT, stream=None, sample=True):
+    """Route the root logger through the queue to a background batch writer."""
+    global _handler, _writer
+    stream = stream or sys.stdout
+    log_queue = queue.SimpleQueue()
+    handler = NonBlockingQueueHandler(log_queue)
+    if sample:
+        handler.addFilter(SamplingFilter())
+
+    root = logging.getLogger()
+    for old in list(root.handlers):
+        root.removeHandler(old)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+    _handler = handler
+    _writer = BatchWriter(log_queue, _make_formatter(fmt), stream)
+    _writer.start()
+    return handler
+
+
+def shutdown():
+    """Flush what is queued; called at exit."""
+    if _writer is not None:
+        _writer.stop()
+
+
+def dropped():
+    return _handler.dropped if _handler else 0
+
+
+metrics.register_collector(lambda: [('log_records_dropped_total', {}, dropped())])
+
+
+def _restart_writer():
+    # A forked child inherits the handler but not the writer thread
+    global _writer
+    if _writer is not None:
+        _writer = BatchWriter(_writer.queue, _writer.formatter, _writer.stream)
+        _writer.start()
+
+
+atexit.register(shutdown)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_writer)
+
+
+def _simulated_request(logger, n):
+    """The log lines of one chat request."""
+    message = f"create a 7 day vegan meal plan for 4 people, mail me at user{n}@example.com"
+    params = {'type': 'meal_plan', 'days': 7, 'cuisine': None, 'dietary': 'vegan', 'servings': 4,
+              'budget': 'moderate', 'calories': None}
+    logger.info(f"Chat: {redact(message)}")
+    logger.info(f"Parameters: {params}")
+    logger.info("Built Prompt(meal_plan/v1, input_tokens=412, max_tokens=1800)")
+    logger.info("Calling model with Prompt(meal_plan/v1, input_tokens=412, max_tokens=1800)")
+    logger.info("Model response received: 5120 characters")
+    logger.info(f"PDF created: meal-plan-7days-{n}.pdf")
+
+
+def _time_requests(logger, requests, threads):
+    def work(offset):
+        for n in range(offset, requests, threads):
+            _simulated_request(logger, n)
+
+    pool = [threading.Thread(target=work, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return (time.perf_counter() - start) / requests
+
+
+def benchmark(requests=20000):
+    """
+    Request-thread logging cost per request: basicConfig's StreamHandler vs the queue pipeline.
+
+    Logs go to a pipe read by another process, as stdout does under gunicorn
+    on Railway.
+    """
+    logger = logging.getLogger('bench')
+    root = logging.getLogger()
+    drain = 'import os, shutil, sys; shutil.copyfileobj(sys.stdin.buffer, open(os.devnull, "wb"))'
+    reader = subprocess.Popen([sys.executable, '-c', drain], stdin=subprocess.PIPE)
+    sink = io.TextIOWrapper(reader.stdin, encoding='utf-8', line_buffering=False)
+    try:
+        for threads in (1, 8):
+            for name in ('StreamHandler', 'queue', 'queue + sampling'):
+                for old in list(root.handlers):
+                    root.removeHandler(old)
+                if name == 'StreamHandler':
+                    handler = logging.StreamHandler(sink)
+                    handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+                    root.addHandler(handler)
+                    root.setLevel(logging.INFO)
+                else:
+                    configure(stream=sink, sample=name == 'queue + sampling')
+                per_request = _time_requests(logger, requests, threads)
+                if name != 'StreamHandler':
+                    shutdown()
+                print(f"{threads} thread(s), {name:16s}: {per_request * 1e6:6.1f} us per request (6 log lines)")
+    finally:
+        for old in list(root.handlers):
+            root.removeHandler(old)
+        sink.close()
+        reader.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Buffered JSON logging pipeline")
+    parser.add_argument('--bench', action='store_true', help="compare per-request logging overhead")
+    args = parser.parse_args()
+    if args.bench:
+        benchmark()
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
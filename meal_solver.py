@@ -0,0 +1,385 @@
+"""
+Constraint-solving meal planner.
+
+Fills a plan of days x (breakfast, lunch, dinner) from the recipe index so
+that every day satisfies these hard constraints:
+
+- diet: only recipes tagged with the requested diet (kosher, halal, keto, ...)
+- calories: daily total within a range (a stated target +/- 10%, or a broad
+  default range)
+- macros: per-diet daily ranges (carbs for keto and low-carb, protein for
+  high-protein)
+- budget: ingredient cost per person per day at or under the budget level's cap
+- variety: a recipe is not repeated within VARIETY_DAYS days (or within as
+  many days as there are candidate recipes for that meal, if fewer)
+
+Any slot can be served as 1 to 2 portions in quarter steps so calorie
+targets above what three single servings provide can still be met.
+
+The search is depth-first over the slots in plan order (greedy with
+backtracking), on an explicit stack rather than by recursion. Before a slot is filled, every candidate is checked in one
+vectorized pass against the day's running totals plus the least and most the
+remaining meals of the day can still add, so dead ends are detected a slot
+early and backtracking stays shallow. Days only interact through variety, so
+a day that cannot be filled after the same few days' recipes is remembered
+and not searched again. A 7-day plan takes about a millisecond
+(python meal_solver.py --bench). A single day is solved first, so targets no
+day can meet fail in a few milliseconds instead of exhausting the search;
+the search also stops after MAX_NODES. solve() raises InfeasiblePlan rather
+than return a plan that breaks a constraint.
+
+solve_for() is what the app calls. When the exact constraints cannot be met
+it relaxes them one at a time (RELAXATIONS: variety, then budget, then the
+calorie tolerance) and returns the closest plan, with plan.relaxed saying
+what was given up. Common diet x calorie combinations must solve without
+relaxing anything:
+
+    python meal_solver.py --check
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+
+from nutrition import NUTRIENTS
+from offline_engine import MEALS, RECIPES, RECIPE_TABLE, find_recipes
+
+logger = logging.getLogger(__name__)
+
+VARIETY_DAYS = int(os.getenv('PLAN_VARIETY_DAYS', 3))
+MAX_NODES = int(os.getenv('PLAN_MAX_NODES', 50000))
+
+PORTIONS = (1.0, 1.25, 1.5, 1.75, 2.0)
+DEFAULT_CALORIES = (1200, 2400)
+CALORIE_TOLERANCE = 0.1
+RELAXED_CALORIE_TOLERANCE = 0.2
+
+# Ingredient cost cap per person per day (USD) for each budget level
+BUDGET_PER_DAY = {'low': 7.0, 'moderate': 12.0, 'high': None}
+BUDGET_LEVELS = ('low', 'moderate', 'high')
+
+# Daily macro ranges (grams per person) implied by a diet, on top of its recipe tags
+DIET_MACROS = {
+    'keto': {'carbs': (None, 50)},
+    'low-carb': {'carbs': (None, 130)},
+    'high-protein': {'protein': (100, None)},
+}
+
+# Constrained quantities: the nutrients followed by cost
+COLUMNS = NUTRIENTS + ('cost',)
+
+
+# Diets and daily calorie targets that must solve as asked, with the default budget (--check)
+CHECK_DIETS = (None, 'vegan', 'vegetarian', 'keto', 'paleo', 'gluten-free', 'dairy-free', 'low-carb',
+               'high-protein', 'kosher', 'halal', 'pescatarian', 'whole30')
+CHECK_CALORIES = (None, 1400, 1600, 1800, 2000, 2200)
+CHECK_DAYS = (7, 14, 30)
+
+
+class InfeasiblePlan(Exception):
+    """Raised when no plan satisfies the constraints."""
+
+
+def _relax_variety(kwargs):
+    if kwargs['variety_days'] <= 1:
+        return None
+    return dict(kwargs, variety_days=1), "recipes may repeat on consecutive days"
+
+
+def _relax_budget(kwargs):
+    level = kwargs['budget']
+    if level not in BUDGET_LEVELS or level == BUDGET_LEVELS[-1]:
+        return None
+    higher = BUDGET_LEVELS[BUDGET_LEVELS.index(level) + 1]
+    return dict(kwargs, budget=higher), f"budget raised from {level} to {higher}"
+
+
+def _relax_calories(kwargs):
+    if not kwargs['calories'] or kwargs['calorie_tolerance'] >= RELAXED_CALORIE_TOLERANCE:
+        return None
+    return (dict(kwargs, calorie_tolerance=RELAXED_CALORIE_TOLERANCE),
+            f"daily calories within {RELAXED_CALORIE_TOLERANCE:.0%} of {kwargs['calories']} "
+            f"instead of {kwargs['calorie_tolerance']:.0%}")
+
+
+# Applied in order, each on top of the previous ones, until a plan is found
+RELAXATIONS = (_relax_variety, _relax_budget, _relax_calories)
+
+
+class Constraints:
+    """Daily lower and upper bounds for each column, plus the variety window."""
+
+    def __init__(self, dietary=None, cuisine=None, calories=None, budget='moderate',
+                 variety_days=VARIETY_DAYS, calorie_tolerance=CALORIE_TOLERANCE):
+        self.dietary = dietary
+        self.cuisine = cuisine
+        self.variety_days = variety_days
+        self.lo = np.full(len(COLUMNS), -np.inf)
+        self.hi = np.full(len(COLUMNS), np.inf)
+
+        if calories:
+            self.set('calories', calories * (1 - calorie_tolerance), calories * (1 + calorie_tolerance))
+        else:
+            self.set('calories', *DEFAULT_CALORIES)
+        for name, (lo, hi) in DIET_MACROS.get(dietary, {}).items():
+            self.set(name, lo, hi)
+        self.set('cost', None, BUDGET_PER_DAY.get(budget))
+
+    def set(self, name, lo=None, hi=None):
+        i = COLUMNS.index(name)
+        if lo is not None:
+            self.lo[i] = lo
+        if hi is not None:
+            self.hi[i] = hi
+
+    def describe(self):
+        parts = []
+        for name, lo, hi in zip(COLUMNS, self.lo, self.hi):
+            if np.isfinite(lo) or np.isfinite(hi):
+                lo = f"{lo:.0f}" if np.isfinite(lo) else ''
+                hi = f"{hi:.0f}" if np.isfinite(hi) else ''
+                parts.append(f"{name} {lo}..{hi}")
+        return ', '.join(parts)
+
+
+class MealOptions:
+    """Candidate (recipe, portion) pairs for one meal with their per-person values."""
+
+    def __init__(self, meal, constraints, seed):
+        pool = find_recipes(meal, constraints.cuisine, constraints.dietary, seed=seed)
+        self.meal = meal
+        self.distinct = len(pool)
+        # In find_recipes order: the preferred cuisine first
+        pairs = [(RECIPE_TABLE.index[r['id']], p) for p in PORTIONS for r in pool]
+        self.recipe = np.array([i for i, _ in pairs], dtype=np.intp)
+        self.portion = np.array([p for _, p in pairs])
+        per_serving = np.column_stack([RECIPE_TABLE.per_serving, RECIPE_TABLE.cost_per_serving])
+        self.values = per_serving[self.recipe] * self.portion[:, None] if pairs else np.zeros((0, len(COLUMNS)))
+
+        # Bounds for pruning; all-infinite bounds would never prune, so empty pools use zeros
+        self.min = self.values.min(axis=0) if pairs else np.zeros(len(COLUMNS))
+        self.max = self.values.max(axis=0) if pairs else np.zeros(len(COLUMNS))
+
+
+class MealPlan:
+    """A solved plan: recipes and portions per slot, with per-day totals."""
+
+    def __init__(self, indices, portions, constraints, nodes, elapsed):
+        self.indices = indices
+        self.portion_array = portions
+        self.days = [{meal: RECIPES[i] for meal, i in zip(MEALS, row)} for row in indices]
+        self.portions = [dict(zip(MEALS, row.tolist())) for row in portions]
+        self.per_day = RECIPE_TABLE.score(indices, portions)[1]
+        self.cost_per_day = RECIPE_TABLE.cost(indices, portions)
+        self.constraints = constraints
+        self.nodes = nodes
+        self.elapsed = elapsed
+        self.relaxed = []  # what solve_for gave up to find this plan
+
+    def summary(self):
+        """Compact text form of the plan, used to ask the model for the prose around it."""
+        lines = []
+        for n, (day, portions, totals) in enumerate(zip(self.days, self.portions, self.per_day), 1):
+            meals = '; '.join(
+                f"{meal} {day[meal]['name']}" + (f" x{portions[meal]:g}" if portions[meal] != 1 else '')
+                for meal in MEALS
+            )
+            lines.append(f"Day {n}: {meals} ({totals[0]:.0f} kcal)")
+        return '\n'.join(lines)
+
+
+def _search(options, constraints, days):
+    """Depth-first search over slots; returns (option index per slot, nodes visited)."""
+    meals = len(options)
+    slots = days * meals
+    # Least and most the meals after slot m can still add to the day
+    rest_min = [sum((o.min for o in options[m + 1:]), np.zeros(len(COLUMNS))) for m in range(meals)]
+    rest_max = [sum((o.max for o in options[m + 1:]), np.zeros(len(COLUMNS))) for m in range(meals)]
+    windows = [max(1, min(constraints.variety_days, o.distinct)) for o in options]
+    lo, hi = constraints.lo, constraints.hi
+
+    chosen = np.zeros((days, meals), dtype=np.intp)  # option index per slot
+    nodes = 0
+    # Whether the days from d on can be filled depends only on the recipes of the last few days
+    # before d, so a (d, recent recipes) state that failed once is not searched again
+    failed = set()
+
+    def recent(day):
+        return (day,) + tuple(
+            tuple(options[m].recipe[chosen[d, m]] for m in range(meals))
+            for d in range(max(0, day - max(windows) + 1), day)
+        )
+
+    def open_slot(slot, day_totals):
+        """[candidates to try, next position, totals with each option, failure state] or None."""
+        day, m = divmod(slot, meals)
+        state = recent(day) if m == 0 else None
+        if state in failed:
+            return None
+        opts = options[m]
+        totals = day_totals + opts.values
+        feasible = (np.all(totals + rest_min[m] <= hi, axis=1)
+                    & np.all(totals + rest_max[m] >= lo, axis=1))
+        # Day each candidate recipe was last used for this meal (-inf if never)
+        last_used = np.full(len(RECIPES), -np.inf)
+        for d in range(day):
+            last_used[opts.recipe[chosen[d, m]]] = d
+        last_used = last_used[opts.recipe]
+        feasible &= last_used <= day - windows[m]
+
+        # Single portions first, then the least recently used recipe, then preference order
+        order = np.lexsort((np.arange(len(opts.recipe)), last_used, opts.portion))
+        return [order[feasible[order]], 0, totals, state]
+
+    # An explicit stack, one frame per filled slot, so plan length is not bounded by the recursion limit
+    stack = [open_slot(0, np.zeros(len(COLUMNS)))]
+    while stack:
+        frame = stack[-1]
+        candidates, position, totals, state = frame
+        if position == len(candidates):
+            stack.pop()
+            if state is not None:
+                failed.add(state)
+            continue
+        frame[1] += 1
+        nodes += 1
+        if nodes > MAX_NODES:
+            raise InfeasiblePlan(f"search limit of {MAX_NODES} nodes reached")
+        slot = len(stack) - 1
+        day, m = divmod(slot, meals)
+        k = candidates[position]
+        chosen[day, m] = k
+        if slot + 1 == slots:
+            return chosen, nodes
+        child = open_slot(slot + 1, np.zeros(len(COLUMNS)) if m == meals - 1 else totals[k])
+        if child is not None:
+            stack.append(child)
+    raise InfeasiblePlan(f"no plan satisfies {constraints.describe()}")
+
+
+def solve(days, dietary=None, cuisine=None, calories=None, budget='moderate',
+          variety_days=VARIETY_DAYS, calorie_tolerance=CALORIE_TOLERANCE):
+    """Return a MealPlan for days meeting every constraint, or raise InfeasiblePlan."""
+    start = time.perf_counter()
+    constraints = Constraints(dietary, cuisine, calories, budget, variety_days, calorie_tolerance)
+    options = [MealOptions(meal, constraints, seed=days) for meal in MEALS]
+    for opts in options:
+        if not opts.distinct:
+            raise InfeasiblePlan(f"no {opts.meal} recipes for diet '{dietary}'")
+
+    # Days only interact through variety, so a target no single day meets fails here, quickly
+    _, nodes = _search(options, constraints, 1)
+    chosen, more = _search(options, constraints, days)
+    nodes += more
+    indices = np.column_stack([options[m].recipe[chosen[:, m]] for m in range(len(MEALS))])
+    portions = np.column_stack([options[m].portion[chosen[:, m]] for m in range(len(MEALS))])
+    plan = MealPlan(indices, portions, constraints, nodes, time.perf_counter() - start)
+    logger.info(f"Solved {days}-day plan ({constraints.describe()}) in "
+                f"{plan.elapsed * 1000:.1f} ms, {nodes} nodes")
+    return plan
+
+
+def solve_for(params):
+    """
+    Solve for extract_parameters output, relaxing constraints (RELAXATIONS) until a plan is found.
+
+    Raises InfeasiblePlan only when even the fully relaxed constraints cannot be met.
+    """
+    kwargs = {
+        'dietary': params.get('dietary'),
+        'cuisine': params.get('cuisine'),
+        'calories': params.get('calories'),
+        'budget': params.get('budget') or 'moderate',
+        'variety_days': VARIETY_DAYS,
+        'calorie_tolerance': CALORIE_TOLERANCE,
+    }
+    days = params.get('days') or 7
+    relaxed = []
+    try:
+        return solve(days, **kwargs)
+    except InfeasiblePlan as e:
+        error = e
+    for relax in RELAXATIONS:
+        step = relax(kwargs)
+        if step is None:
+            continue
+        kwargs, description = step
+        relaxed.append(description)
+        try:
+            plan = solve(days, **kwargs)
+        except InfeasiblePlan:
+            continue
+        plan.relaxed = relaxed
+        logger.info(f"Solved {days}-day plan after relaxing: {'; '.join(relaxed)} ({error})")
+        return plan
+    raise error
+
+
+def benchmark(rounds=200):
+    """Time solving plans for every diet at a few lengths and calorie targets."""
+    diets = [None, 'vegan', 'vegetarian', 'keto', 'paleo', 'gluten-free', 'dairy-free', 'low-carb',
+             'high-protein', 'kosher', 'halal', 'pescatarian', 'whole30']
+    for days in (7, 30):
+        for calories in (None, 2000):
+            times, failures = [], 0
+            for dietary in diets:
+                for _ in range(rounds // len(diets) or 1):
+                    start = time.perf_counter()
+                    try:
+                        solve(days, dietary=dietary, calories=calories)
+                    except InfeasiblePlan:
+                        failures += 1
+                    times.append(time.perf_counter() - start)
+            times.sort()
+            print(f"{days:2d} days, calories={calories}: median {times[len(times) // 2] * 1000:.2f} ms, "
+                  f"max {times[-1] * 1000:.2f} ms, {failures} infeasible of {len(times)}")
+
+
+def check():
+    """Solve every CHECK_DIETS x CHECK_CALORIES x CHECK_DAYS combination exactly; False if any fails."""
+    failures = []
+    for days in CHECK_DAYS:
+        for dietary in CHECK_DIETS:
+            for calories in CHECK_CALORIES:
+                try:
+                    solve(days, dietary=dietary, calories=calories)
+                except InfeasiblePlan as e:
+                    failures.append(f"{days} days, diet={dietary}, calories={calories}: {e}")
+    total = len(CHECK_DAYS) * len(CHECK_DIETS) * len(CHECK_CALORIES)
+    for failure in failures:
+        print(f"INFEASIBLE  {failure}")
+    print(f"{total - len(failures)} of {total} diet x calorie x length combinations solved")
+    return not failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Solve a meal plan from the recipe index")
+    parser.add_argument('--days', type=int, default=7)
+    parser.add_argument('--diet')
+    parser.add_argument('--cuisine')
+    parser.add_argument('--calories', type=int)
+    parser.add_argument('--budget', default='moderate', choices=sorted(BUDGET_PER_DAY))
+    parser.add_argument('--bench', action='store_true', help="time the solver across diets")
+    parser.add_argument('--check', action='store_true', help="fail if a common diet x calorie target is infeasible")
+    args = parser.parse_args()
+
+    if args.bench:
+        benchmark()
+        return
+    if args.check:
+        sys.exit(0 if check() else 1)
+    plan = solve_for({'days': args.days, 'dietary': args.diet, 'cuisine': args.cuisine,
+                      'calories': args.calories, 'budget': args.budget})
+    print(plan.summary())
+    if plan.relaxed:
+        print(f"Relaxed: {'; '.join(plan.relaxed)}")
+    print(f"{plan.nodes} nodes, {plan.elapsed * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    main()
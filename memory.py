@@ -0,0 +1,252 @@
+"""
+Memory audit and a per-worker RSS budget.
+
+Audit
+    With MEMORY_AUDIT=1, each worker runs tracemalloc and records two numbers
+    per endpoint (the URL rule, e.g. /download/<filename>): the peak of
+    traced memory during the request, and the memory still allocated when
+    the request ends. For one in MEMORY_AUDIT_EVERY requests of an endpoint,
+    it also takes snapshots before and after the request and keeps the
+    source lines whose allocations grew the most. That shows where a leak
+    comes from, not just that there is one. GET /admin/memory returns the
+    report of the worker that serves it. Like the profiling routes, it needs
+    PROFILE_TOKEN in X-Profile-Token.
+    tracemalloc has one peak counter per process. With several requests in
+    flight in a worker, an endpoint's peak includes what the other requests
+    allocated meanwhile. Read the peaks as upper bounds, or audit a worker
+    that has one thread. Tracing slows allocation-heavy code by roughly 2x,
+    so audit mode is for diagnosis and is not meant to stay on.
+
+Watchdog
+    max_requests recycles a worker after so many requests, however much
+    memory it uses. The RSS budget recycles a worker when its memory grows.
+    gunicorn's post_request hook calls recycle_if_over_budget(). Once the
+    worker's resident set exceeds WORKER_RSS_LIMIT_MB, the worker stops
+    accepting requests, finishes those in flight and exits, and the master
+    starts a fresh one. That is the same graceful path max_requests takes.
+    Job workers (jobs.py) check the budget after every job and exit the same
+    way.
+
+Peak memory per PDF type, checked against PDF_PEAK_CEILINGS:
+    python memory.py --check
+Banner images that are not deployed (graphics/Banner_ads) are replaced by
+BANNER_FIXTURE, a 6 x 1.5 in JPEG, so the check always measures renders
+with the logo and all three banners. It fails if an image is still missing.
+The Railway build (railway.json) runs it, so a deploy that would render a
+PDF type over its ceiling fails to build.
+
+Configuration (environment):
+    MEMORY_AUDIT            1 to trace allocations per endpoint (default 0)
+    MEMORY_AUDIT_EVERY      take snapshots for one in this many requests per endpoint (default 10)
+    MEMORY_AUDIT_TOP        allocation sites kept per endpoint (default 10)
+    WORKER_RSS_LIMIT_MB     recycle a worker above this resident set size (default 512, 0 = off)
+"""
+
+import argparse
+import logging
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from flask import g, request
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+MEMORY_AUDIT = os.getenv('MEMORY_AUDIT', '0') == '1'
+MEMORY_AUDIT_EVERY = int(os.getenv('MEMORY_AUDIT_EVERY', 10))
+MEMORY_AUDIT_TOP = int(os.getenv('MEMORY_AUDIT_TOP', 10))
+WORKER_RSS_LIMIT = int(os.getenv('WORKER_RSS_LIMIT_MB', 512)) * 1024 * 1024
+
+# Most memory one PDF render may trace, in bytes above what was allocated before it. Measured
+# peaks with the logo and JPEG banners are 0.85-0.9 MB; the full-size logo decode alone used to add 3.4 MB.
+PDF_PEAK_CEILINGS = {
+    'recipe': 1_500_000,
+    'meal_plan': 1_500_000,
+    'meal_plan_30': 2_500_000,
+    'grocery_list': 1_500_000,
+}
+
+BANNER_FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'fixtures', 'banner.jpg')
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+_IGNORED = (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, '<frozen importlib._bootstrap>'))
+
+_endpoints = {}     # rule -> stats dict
+_lock = threading.Lock()
+
+
+def rss_bytes():
+    """Resident set size of this process (the peak instead where /proc is missing)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def over_budget():
+    """The current RSS if it exceeds WORKER_RSS_LIMIT, else None."""
+    if not WORKER_RSS_LIMIT:
+        return None
+    rss = rss_bytes()
+    return rss if rss > WORKER_RSS_LIMIT else None
+
+
+def recycle_if_over_budget(worker):
+    """gunicorn post_request: let a worker over its RSS budget finish in-flight requests and exit."""
+    rss = over_budget()
+    if rss is not None and worker.alive:
+        worker.log.warning(f"Worker {worker.pid} uses {rss / 1e6:.0f} MB, over the "
+                           f"{WORKER_RSS_LIMIT / 1e6:.0f} MB budget; recycling")
+        worker.alive = False
+
+
+def _endpoint():
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+
+def start_request():
+    """before_request: note traced memory (and every MEMORY_AUDIT_EVERY-th time, a snapshot)."""
+    if not tracemalloc.is_tracing():
+        return
+    endpoint = _endpoint()
+    with _lock:
+        stats = _endpoints.setdefault(endpoint, {'requests': 0, 'peak_max': 0, 'peak_total': 0,
+                                                 'retained_total': 0, 'top': []})
+        stats['requests'] += 1
+        snapshot = stats['requests'] % MEMORY_AUDIT_EVERY == 1 or MEMORY_AUDIT_EVERY == 1
+    tracemalloc.reset_peak()
+    g.memory_audit = (endpoint, tracemalloc.get_traced_memory()[0],
+                      tracemalloc.take_snapshot().filter_traces(_IGNORED) if snapshot else None)
+
+
+def end_request(exc=None):
+    """teardown_request: record the request's peak and what it left allocated."""
+    audit = g.pop('memory_audit', None)
+    if audit is None:
+        return
+    endpoint, before, snapshot = audit
+    current, peak = tracemalloc.get_traced_memory()
+    top = None
+    if snapshot is not None:
+        growth = tracemalloc.take_snapshot().filter_traces(_IGNORED).compare_to(snapshot, 'lineno')
+        top = [f"{stat.traceback[0].filename}:{stat.traceback[0].lineno} "
+               f"{stat.size_diff:+d} B ({stat.count_diff:+d} blocks)"
+               for stat in growth[:MEMORY_AUDIT_TOP] if stat.size_diff > 0]
+    with _lock:
+        stats = _endpoints[endpoint]
+        stats['peak_max'] = max(stats['peak_max'], peak - before)
+        stats['peak_total'] += peak - before
+        stats['retained_total'] += current - before
+        if top is not None:
+            stats['top'] = top
+
+
+def report():
+    """What /admin/memory returns for this worker."""
+    traced = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else None
+    with _lock:
+        endpoints = {
+            endpoint: {
+                'requests': stats['requests'],
+                'peak_max_bytes': stats['peak_max'],
+                'peak_mean_bytes': stats['peak_total'] // stats['requests'],
+                'retained_mean_bytes': stats['retained_total'] // stats['requests'],
+                'top_growth': stats['top'],
+            }
+            for endpoint, stats in sorted(_endpoints.items())
+        }
+    return {
+        'pid': os.getpid(),
+        'rss_bytes': rss_bytes(),
+        'rss_limit_bytes': WORKER_RSS_LIMIT,
+        'tracing': traced is not None,
+        'traced_bytes': traced[0] if traced else None,
+        'endpoints': endpoints,
+    }
+
+
+metrics.register_collector(lambda: [('worker_rss_bytes', {'pid': os.getpid()}, rss_bytes())])
+
+if MEMORY_AUDIT and not tracemalloc.is_tracing():
+    tracemalloc.start()
+
+
+def pdf_peaks(repeat=3):
+    """Peak traced memory of rendering each PDF type from offline content, in bytes (the max over repeat renders)."""
+    # Fresh renders every time: no cached PDFs, a throwaway local output directory
+    os.environ.update(SHARED_CACHE='0', PDF_STORAGE_BACKEND='local',
+                      PDF_LOCAL_DIR=tempfile.mkdtemp(prefix='meal-memcheck-'))
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    import Meal_Planner_Chatbot as app
+    from offline_engine import generate_offline
+
+    for banner in app.BANNER_ADS:
+        if not os.path.exists(banner['path']):
+            banner['path'] = BANNER_FIXTURE
+    missing = [path for path in [app.LOGO_PATH] + [b['path'] for b in app.BANNER_ADS] if not os.path.exists(path)]
+    if missing:
+        raise RuntimeError(f"images missing, the peaks would not include them: {', '.join(missing)}")
+
+    params = {'type': None, 'days': None, 'cuisine': None, 'dietary': None, 'servings': 4,
+              'budget': 'moderate', 'calories': None}
+    cases = {
+        'recipe': ('recipe', {}),
+        'meal_plan': ('meal_plan', {'days': 7}),
+        'meal_plan_30': ('meal_plan', {'days': 30}),
+        'grocery_list': ('grocery_list', {'days': 7}),
+    }
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    peaks = {}
+    try:
+        for name, (kind, extra) in cases.items():
+            for n in range(repeat + 1):
+                content = generate_offline(kind, 'chicken', dict(params, type=kind, **extra))
+                # Distinct content per render, so the PDF cache key never matches
+                content += f"\n\nRendered {time.time_ns()}"
+                document = app.parse_document(content, kind)
+                tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+                if not app.create_branded_pdf(content, f"memcheck-{name}-{n}.pdf", doc_type=kind,
+                                              document=document):
+                    raise RuntimeError(f"{name} PDF failed to render")
+                if n:   # the first render also loads fonts and images once per process
+                    peaks[name] = max(peaks.get(name, 0), tracemalloc.get_traced_memory()[1] - before)
+    finally:
+        if started:
+            tracemalloc.stop()
+    return peaks
+
+
+def check():
+    """Render every PDF type and compare its peak with PDF_PEAK_CEILINGS; False if any is over."""
+    ok = True
+    for name, peak in pdf_peaks().items():
+        ceiling = PDF_PEAK_CEILINGS[name]
+        over = peak > ceiling
+        ok = ok and not over
+        print(f"{name:14s} peak {peak / 1e6:5.2f} MB  ceiling {ceiling / 1e6:5.2f} MB  {'OVER' if over else 'ok'}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory audit and worker RSS budget")
+    parser.add_argument('--check', action='store_true', help="fail if a PDF type renders over its peak ceiling")
+    args = parser.parse_args()
+    if args.check:
+        sys.exit(0 if check() else 1)
+    print(f"RSS {rss_bytes() / 1e6:.1f} MB, budget {WORKER_RSS_LIMIT / 1e6:.0f} MB")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
@@ -0,0 +1,59 @@
+"""
+Minimal metrics registry with Prometheus text exposition.
+
+Counters live in the worker process, and /metrics is served by whichever
+worker takes the scrape, so counters carry a pid label: sum them across pids
+(e.g. sum without (pid) (content_cache_total)) for host totals. Subsystems
+whose numbers are shared across workers (for example the catalog, backed by
+SQLite) register a collector instead, which is called at scrape time.
+"""
+
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+_counters = {}
+_collectors = []
+_lock = threading.Lock()
+
+
+def _labels_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def inc(name, value=1, **labels):
+    """Increment a counter."""
+    key = (name, _labels_key(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def get(name, **labels):
+    return _counters.get((name, _labels_key(labels)), 0)
+
+
+def register_collector(collector):
+    """Register a callable returning (name, labels dict, value) samples at scrape time."""
+    _collectors.append(collector)
+
+
+def _format_sample(name, labels, value):
+    if labels:
+        rendered = ','.join(f'{k}="{v}"' for k, v in labels)
+        return f"{name}{{{rendered}}} {value}"
+    return f"{name} {value}"
+
+
+def render():
+    """Render all counters and collector samples in Prometheus text format."""
+    pid = ('pid', os.getpid())
+    with _lock:
+        samples = [(name, tuple(sorted(labels + (pid,))), value) for (name, labels), value in _counters.items()]
+    for collector in _collectors:
+        try:
+            samples += [(name, _labels_key(labels), value) for name, labels, value in collector()]
+        except Exception as e:
+            logger.warning(f"Metrics collector {collector!r} failed: {e}")
+    return '\n'.join(_format_sample(*sample) for sample in sorted(samples)) + '\n'
@@ -0,0 +1,356 @@
+"""
+Multi-provider model router.
+
+Requests are routed by generation type to a tier of backends:
+
+- 'fast' tier: grocery lists and meal plan notes (cheap, low latency models)
+- 'strong' tier: recipes and detailed meal plans
+
+A prompt's own tier, when set, wins over its type's route: Alexa sends every
+generation to the fast tier to answer within its deadline.
+
+Every backend speaks the OpenAI chat completions API, which also covers local
+servers (llama.cpp, vLLM, Ollama, LM Studio). Within a tier, backends are
+ordered by observed latency and error rate. If the primary has not answered
+by its own p95 latency, a hedged request goes to the next backend and
+whichever answers first wins. Hedges are capped at HEDGE_MAX_RATIO of
+requests so a slow provider cannot double our spend. Failover and hedges
+share one REQUEST_TIMEOUT budget per completion, so a request falls back to
+the offline engine instead of outliving the gunicorn worker timeout.
+
+Configuration (environment):
+    MODEL_BACKENDS     JSON list of backends overriding the defaults, e.g.
+                       [{"name": "openai-fast", "url": "https://api.openai.com/v1/chat/completions",
+                         "model": "gpt-4o-mini", "api_key_env": "OPENAI_API_KEY", "tiers": ["fast"]}]
+    LOCAL_MODEL_URL    base URL of a local OpenAI-compatible server; added to every
+                       tier behind the hosted backends (e.g. http://localhost:8080)
+    LOCAL_MODEL_NAME   model name for the local server (default 'local')
+    HEDGE_MAX_RATIO    max share of requests that may be hedged (default 0.1)
+
+/metrics exports each worker's router stats labelled by pid: request and hedge
+counts, and per backend the rolling p95 latency (HEDGE_DEFAULT_DELAY until
+HEDGE_MIN_SAMPLES successes), error rate and remaining cooldown.
+"""
+
+import collections
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import requests
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+OPENAI_CHAT_URL = 'https://api.openai.com/v1/chat/completions'
+
+# Generation type -> tier
+ROUTES = {
+    'recipe': 'strong',
+    'meal_plan': 'strong',
+    'meal_plan_notes': 'fast',
+    'grocery_list': 'fast',
+}
+
+DEFAULT_BACKENDS = [
+    {'name': 'openai-fast', 'url': OPENAI_CHAT_URL, 'model': 'gpt-4o-mini',
+     'api_key_env': 'OPENAI_API_KEY', 'tiers': ['fast']},
+    {'name': 'openai-strong', 'url': OPENAI_CHAT_URL, 'model': 'gpt-4',
+     'api_key_env': 'OPENAI_API_KEY', 'tiers': ['strong']},
+    {'name': 'openai-strong-alt', 'url': OPENAI_CHAT_URL, 'model': 'gpt-4o',
+     'api_key_env': 'OPENAI_API_KEY', 'tiers': ['strong', 'fast']},
+]
+
+HEDGE_MAX_RATIO = float(os.getenv('HEDGE_MAX_RATIO', 0.1))
+HEDGE_MIN_SAMPLES = 20         # below this, use HEDGE_DEFAULT_DELAY instead of p95
+HEDGE_DEFAULT_DELAY = 10.0     # seconds
+REQUEST_TIMEOUT = 90           # per completion, across failover and hedges; below the gunicorn worker timeout
+MIN_ATTEMPT_TIME = 2.0         # seconds left below which no further backend is tried
+REQUEST_THREADS = 8            # request threads per worker; gunicorn's post_fork sets the real count
+FAILURE_COOLDOWN = 30.0        # seconds a failing backend is skipped
+FAILURES_BEFORE_COOLDOWN = 3
+
+
+class ModelError(Exception):
+    """Raised when no backend could produce a completion."""
+
+
+class BackendStats:
+    """Rolling latency and error statistics for one backend."""
+
+    def __init__(self, window=200):
+        self.latencies = collections.deque(maxlen=window)
+        self.outcomes = collections.deque(maxlen=window)  # True = success
+        self.ewma = None
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+        self.lock = threading.Lock()
+
+    def record(self, latency, ok):
+        with self.lock:
+            self.outcomes.append(ok)
+            if ok:
+                self.latencies.append(latency)
+                self.ewma = latency if self.ewma is None else 0.8 * self.ewma + 0.2 * latency
+                self.consecutive_failures = 0
+            else:
+                self.consecutive_failures += 1
+                if self.consecutive_failures >= FAILURES_BEFORE_COOLDOWN:
+                    self.cooldown_until = time.monotonic() + FAILURE_COOLDOWN
+
+    def p95(self):
+        with self.lock:
+            if len(self.latencies) < HEDGE_MIN_SAMPLES:
+                return HEDGE_DEFAULT_DELAY
+            ordered = sorted(self.latencies)
+        return ordered[int(len(ordered) * 0.95) - 1]
+
+    def error_rate(self):
+        with self.lock:
+            if not self.outcomes:
+                return 0.0
+            return self.outcomes.count(False) / len(self.outcomes)
+
+    def available(self):
+        return time.monotonic() >= self.cooldown_until
+
+    def cooldown_remaining(self):
+        return max(self.cooldown_until - time.monotonic(), 0.0)
+
+    def score(self):
+        """Lower is better: expected latency inflated by the error rate."""
+        latency = self.ewma if self.ewma is not None else HEDGE_DEFAULT_DELAY / 2
+        return latency * (1 + 4 * self.error_rate())
+
+    def snapshot(self):
+        return {
+            'requests': len(self.outcomes),
+            'error_rate': round(self.error_rate(), 3),
+            'ewma_latency': round(self.ewma, 3) if self.ewma is not None else None,
+            'p95_latency': round(self.p95(), 3),
+            'available': self.available(),
+            'cooldown_remaining': round(self.cooldown_remaining(), 1),
+        }
+
+
+class Backend:
+    """One OpenAI-compatible chat completions endpoint."""
+
+    def __init__(self, name, url, model, tiers, api_key_env=None, api_key=None,
+                 max_output_tokens=None, timeout=REQUEST_TIMEOUT, fallback=False):
+        self.name = name
+        self.url = url
+        self.model = model
+        self.tiers = tiers
+        self.api_key = api_key or (os.getenv(api_key_env) if api_key_env else None)
+        self.max_output_tokens = max_output_tokens
+        self.timeout = timeout
+        self.fallback = fallback
+        self.stats = BackendStats()
+
+    def complete(self, prompt, timeout=None):
+        """The completion text, within timeout seconds (at most the backend's own timeout)."""
+        timeout = min(self.timeout, timeout) if timeout is not None else self.timeout
+        if timeout <= 0:
+            raise ModelError(f"{self.name}: no time left for the request")
+        max_tokens = prompt.max_tokens
+        if self.max_output_tokens:
+            max_tokens = min(max_tokens, self.max_output_tokens)
+        headers = {'Authorization': f'Bearer {self.api_key}'} if self.api_key else {}
+        data = {
+            'model': self.model,
+            'messages': prompt.messages(),
+            'max_tokens': max_tokens,
+        }
+
+        start = time.monotonic()
+        try:
+            response = requests.post(self.url, headers=headers, json=data, timeout=(min(5, timeout), timeout))
+            response.raise_for_status()
+            result = response.json()['choices'][0]['message']['content'].strip()
+        except Exception:
+            self.stats.record(time.monotonic() - start, False)
+            raise
+        self.stats.record(time.monotonic() - start, True)
+        return result
+
+
+class ModelRouter:
+    """
+    Route prompts to backends by tier, with hedging and failover.
+
+    Calls run on a pool of two threads per request thread: one for each
+    request's primary and one for a hedge. A hedge that loses the race cannot
+    be aborted and holds its thread until it answers or times out, so hedges
+    are only sent while fewer calls than request threads are in flight; a
+    primary never queues behind them.
+    """
+
+    def __init__(self, backends, request_threads=REQUEST_THREADS):
+        self.backends = backends
+        self.request_threads = request_threads
+        self.executor = ThreadPoolExecutor(max_workers=2 * request_threads, thread_name_prefix='model')
+        self.requests = 0
+        self.hedges = 0
+        self.in_flight = 0
+        self.lock = threading.Lock()
+
+    def _submit(self, backend, prompt, deadline):
+        with self.lock:
+            self.in_flight += 1
+        future = self.executor.submit(backend.complete, prompt, deadline - time.monotonic())
+        future.add_done_callback(self._finished)
+        return future
+
+    def _finished(self, future):
+        with self.lock:
+            self.in_flight -= 1
+
+    def candidates(self, tier):
+        """Backends for a tier, best first; fallbacks and cooling-down backends go last."""
+        pool = [b for b in self.backends if tier in b.tiers]
+        return sorted(pool, key=lambda b: (not b.stats.available(), b.fallback, b.stats.score()))
+
+    def _may_hedge(self):
+        with self.lock:
+            return self.hedges < HEDGE_MAX_RATIO * self.requests and self.in_flight < self.request_threads
+
+    def complete(self, prompt):
+        """
+        Return the completion text for prompt, raising ModelError if every backend fails.
+
+        Failover and hedges share one REQUEST_TIMEOUT budget, so the caller gets an
+        answer or a ModelError (and falls back offline) before gunicorn's worker timeout.
+        """
+        deadline = time.monotonic() + REQUEST_TIMEOUT
+        tier = prompt.tier or ROUTES.get(prompt.kind, 'strong')
+        queue = self.candidates(tier)
+        if not queue:
+            raise ModelError(f"No backends configured for tier '{tier}'")
+        with self.lock:
+            self.requests += 1
+
+        pending = {}
+        errors = []
+        hedge_allowed = True
+        backend = queue.pop(0)
+        pending[self._submit(backend, prompt, deadline)] = backend
+
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                errors.append(f"no answer within {REQUEST_TIMEOUT}s")
+                for future in pending:
+                    future.cancel()     # only stops calls still queued; running ones end at the deadline
+                break
+            # Wait for the oldest in-flight backend's p95 before considering a hedge
+            timeout = remaining
+            hedging = hedge_allowed and queue and len(pending) == 1
+            if hedging:
+                timeout = min(next(iter(pending.values())).stats.p95(), remaining)
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+
+            if not done:
+                if not hedging or remaining - timeout < MIN_ATTEMPT_TIME:
+                    continue
+                if self._may_hedge():
+                    hedge = queue.pop(0)
+                    with self.lock:
+                        self.hedges += 1
+                    logger.info(f"Hedging {prompt.kind} to {hedge.name} after {timeout:.1f}s")
+                    pending[self._submit(hedge, prompt, deadline)] = hedge
+                else:
+                    hedge_allowed = False  # over the hedge budget or the pool is busy; wait for the primary
+                continue
+
+            for future in done:
+                backend = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.warning(f"Model backend {backend.name} failed: {e}")
+                    errors.append(f"{backend.name}: {e}")
+                    continue
+                logger.info(f"{prompt.kind} served by {backend.name} ({len(result)} characters)")
+                return result
+
+            # Everything in flight failed: fail over to the next backend if there is time left for it
+            if not pending and queue and deadline - time.monotonic() >= MIN_ATTEMPT_TIME:
+                backend = queue.pop(0)
+                pending[self._submit(backend, prompt, deadline)] = backend
+
+        raise ModelError('; '.join(errors))
+
+    def stats(self):
+        """Request and hedge counts and each backend's rolling stats (exported by _collect)."""
+        return {
+            'requests': self.requests,
+            'hedges': self.hedges,
+            'in_flight': self.in_flight,
+            'backends': {b.name: b.stats.snapshot() for b in self.backends},
+        }
+
+
+def load_backends():
+    """Build backends from MODEL_BACKENDS (or defaults) plus the optional local server."""
+    config = DEFAULT_BACKENDS
+    if os.getenv('MODEL_BACKENDS'):
+        config = json.loads(os.environ['MODEL_BACKENDS'])
+
+    backends = [Backend(**entry) for entry in config]
+
+    local_url = os.getenv('LOCAL_MODEL_URL')
+    if local_url:
+        backends.append(Backend(
+            name='local',
+            url=local_url.rstrip('/') + '/v1/chat/completions',
+            model=os.getenv('LOCAL_MODEL_NAME', 'local'),
+            tiers=sorted(set(ROUTES.values())),
+            fallback=True,
+        ))
+    return backends
+
+
+_router = None
+
+
+def set_request_threads(threads):
+    """Size the router's pool for this many request threads (gunicorn post_fork, before first use)."""
+    global REQUEST_THREADS
+    REQUEST_THREADS = threads
+
+
+def get_router():
+    """Return the process-wide router (created on first use)."""
+    global _router
+    if _router is None:
+        _router = ModelRouter(load_backends(), REQUEST_THREADS)
+        logger.info(f"Model router backends: {[b.name for b in _router.backends]}")
+    return _router
+
+
+def _collect():
+    """Router stats for /metrics, labelled by pid: each worker routes (and keeps stats) on its own."""
+    if _router is None:
+        return []
+    stats, pid = _router.stats(), os.getpid()
+    samples = [('model_router_requests', {'pid': pid}, stats['requests']),
+               ('model_router_hedges', {'pid': pid}, stats['hedges']),
+               ('model_router_in_flight', {'pid': pid}, stats['in_flight'])]
+    for name, backend in stats['backends'].items():
+        labels = {'backend': name, 'pid': pid}
+        samples += [
+            ('model_backend_requests', labels, backend['requests']),
+            ('model_backend_error_rate', labels, backend['error_rate']),
+            ('model_backend_p95_latency_seconds', labels, backend['p95_latency']),
+            ('model_backend_available', labels, int(backend['available'])),
+            ('model_backend_cooldown_seconds', labels, backend['cooldown_remaining']),
+        ]
+    return samples
+
+
+metrics.register_collector(_collect)
@@ -0,0 +1,274 @@
+"""
+Nutrition computation engine.
+
+The nutrient database (data/ingredients.json) is loaded once into a NumPy
+matrix of nutrients per gram, one row per ingredient. Ingredient quantities
+(structured, or parsed from lines like "1 1/2 cups cooked quinoa") are
+converted to grams, so a recipe becomes a row of grams per serving and its
+macros are a single matrix product:
+
+    recipe_grams (recipes x ingredients) @ per_gram (ingredients x nutrients)
+
+Meal plans are arrays of recipe indices (days x meals); per-meal, per-day and
+plan totals are a fancy-index plus a sum, which scores a 30-day plan in a few
+microseconds (python nutrition.py --bench).
+"""
+
+import json
+import logging
+import os
+import re
+import time
+from fractions import Fraction
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+INGREDIENTS_PATH = os.path.join(DATA_DIR, 'ingredients.json')
+
+NUTRIENTS = ('calories', 'protein', 'carbs', 'fat', 'fiber')
+
+# Share of a recipe's ingredient lines that must be recognized before we
+# trust computed numbers over the model's own estimate
+MIN_COVERAGE = 0.7
+
+# Weight units convert directly; volume units go through the ingredient's grams per cup
+WEIGHT_GRAMS = {'g': 1.0, 'kg': 1000.0, 'oz': 28.35, 'lb': 453.6}
+CUP_FRACTION = {'cup': 1.0, 'tbsp': 1 / 16, 'tsp': 1 / 48, 'ml': 1 / 240, 'l': 1000 / 240}
+DEFAULT_GRAMS_PER_CUP = 240.0
+
+UNIT_ALIASES = {
+    'cups': 'cup', 'c': 'cup',
+    'tablespoon': 'tbsp', 'tablespoons': 'tbsp', 'tbs': 'tbsp', 'tbsps': 'tbsp',
+    'teaspoon': 'tsp', 'teaspoons': 'tsp', 'tsps': 'tsp',
+    'ounce': 'oz', 'ounces': 'oz',
+    'pound': 'lb', 'pounds': 'lb', 'lbs': 'lb',
+    'gram': 'g', 'grams': 'g', 'kilogram': 'kg', 'kilograms': 'kg',
+    'milliliter': 'ml', 'milliliters': 'ml', 'liter': 'l', 'liters': 'l',
+    'cloves': 'clove', 'sheets': 'sheet',
+    'large': 'each', 'medium': 'each', 'small': 'each', 'whole': 'each', '': 'each',
+    'can': 'can', 'cans': 'can',
+}
+CAN_GRAMS = 425.0  # a standard 15 oz can
+
+_QUANTITY_RE = re.compile(
+    r'^\s*(?:[-*•]\s*)?(?P<qty>\d+\s+\d+/\d+|\d+/\d+|\d+(?:\.\d+)?)?\s*'
+    r'(?P<unit>[a-zA-Z]+\b)?\.?\s*(?:of\s+)?(?P<rest>.*)$'
+)
+_UNICODE_FRACTIONS = {'½': ' 1/2', '⅓': ' 1/3', '⅔': ' 2/3', '¼': ' 1/4', '¾': ' 3/4'}
+
+
+def parse_quantity(text):
+    """'1 1/2' -> 1.5, '3/4' -> 0.75, '2' -> 2.0."""
+    return float(sum(Fraction(part) for part in text.split()))
+
+
+class NutrientDatabase:
+    """Ingredient nutrient table as a NumPy matrix of nutrients per gram."""
+
+    def __init__(self, ingredients):
+        self.names = sorted(ingredients)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.per_gram = np.array(
+            [ingredients[name]['per_100g'] for name in self.names], dtype=np.float64
+        ) / 100.0
+        self.grams_per = [ingredients[name]['grams_per'] for name in self.names]
+        self.price_per_gram = np.array(
+            [ingredients[name].get('usd_per_100g', 0.0) for name in self.names], dtype=np.float64
+        ) / 100.0
+        # Longest names first so "sweet potato" wins over "potato"
+        self._by_length = sorted(self.names, key=len, reverse=True)
+
+    @classmethod
+    def load(cls, path=INGREDIENTS_PATH):
+        try:
+            with open(path, encoding='utf-8') as f:
+                return cls(json.load(f)['ingredients'])
+        except Exception as e:
+            logger.error(f"Error loading nutrient database {path}: {e}")
+            return cls({})
+
+    def grams(self, item, quantity, unit):
+        """Convert a quantity of an ingredient to grams, or None if the unit is unknown."""
+        i = self.index.get(item)
+        if i is None:
+            return None
+        unit = UNIT_ALIASES.get(unit, unit)
+        per = self.grams_per[i]
+        if unit in WEIGHT_GRAMS:
+            return quantity * WEIGHT_GRAMS[unit]
+        if unit in CUP_FRACTION:
+            return quantity * CUP_FRACTION[unit] * per.get('cup', DEFAULT_GRAMS_PER_CUP)
+        if unit == 'can':
+            return quantity * CAN_GRAMS
+        if unit in per:
+            return quantity * per[unit]
+        return None
+
+    def match(self, text):
+        """Ingredient name mentioned in text (longest match), or None."""
+        text = text.lower()
+        for name in self._by_length:
+            if name in text or (name.endswith('s') and name[:-1] in text):
+                return name
+        return None
+
+    def parse_line(self, line):
+        """Parse a free-text ingredient line into (item, grams), or None."""
+        for char, replacement in _UNICODE_FRACTIONS.items():
+            line = line.replace(char, replacement)
+        m = _QUANTITY_RE.match(line.replace('**', ''))
+        if not m or not m.group('qty'):
+            return None
+        unit = (m.group('unit') or '').lower()
+        rest = m.group('rest')
+        if unit not in UNIT_ALIASES and unit not in WEIGHT_GRAMS and unit not in CUP_FRACTION:
+            # The "unit" was really the first word of the ingredient ("2 eggs")
+            rest = f"{unit} {rest}"
+            unit = ''
+        item = self.match(rest)
+        if item is None:
+            return None
+        grams = self.grams(item, parse_quantity(m.group('qty')), unit)
+        return (item, grams) if grams is not None else None
+
+    def totals(self, grams_by_item):
+        """Nutrient totals for a {item: grams} mapping."""
+        vector = np.zeros(len(self.names))
+        for item, grams in grams_by_item.items():
+            vector[self.index[item]] += grams
+        return vector @ self.per_gram
+
+
+class RecipeTable:
+    """Per-serving nutrients for a fixed list of recipes, computed in one matrix product."""
+
+    def __init__(self, recipes, db):
+        self.ids = [r['id'] for r in recipes]
+        self.index = {recipe_id: i for i, recipe_id in enumerate(self.ids)}
+        grams = np.zeros((len(recipes), len(db.names)))
+        for i, recipe in enumerate(recipes):
+            for ing in recipe['ingredients']:
+                g = db.grams(ing['item'], ing['quantity'], ing['unit'])
+                if g is None:
+                    logger.warning(f"No nutrient data for {ing['item']} ({ing['unit']}) in {recipe['id']}")
+                    continue
+                grams[i, db.index[ing['item']]] += g / recipe['servings']
+        self.grams = grams
+        # Extra all-zero row so index -1 (an empty meal slot) adds nothing
+        self.per_serving = np.vstack([grams @ db.per_gram, np.zeros(len(NUTRIENTS))])
+        self.cost_per_serving = np.append(grams @ db.price_per_gram, 0.0)
+
+    def recipe(self, recipe_id):
+        """Per-serving nutrients of one recipe as a dict."""
+        return as_dict(self.per_serving[self.index[recipe_id]])
+
+    def plan_indices(self, plan):
+        """Convert a plan (list of {meal: recipe or None}) to a days x meals index array."""
+        return np.array(
+            [[self.index[r['id']] if r else -1 for r in day.values()] for day in plan],
+            dtype=np.intp,
+        )
+
+    def score(self, indices, portions=None):
+        """
+        Per-meal (days x meals x nutrients) and per-day (days x nutrients) totals per person.
+
+        portions optionally scales each slot (days x meals), e.g. 1.5 servings of dinner.
+        """
+        per_meal = self.per_serving[indices]
+        if portions is not None:
+            per_meal = per_meal * portions[..., None]
+        return per_meal, per_meal.sum(axis=1)
+
+    def cost(self, indices, portions=None):
+        """Ingredient cost per person for each day (days,)."""
+        per_meal = self.cost_per_serving[indices]
+        if portions is not None:
+            per_meal = per_meal * portions
+        return per_meal.sum(axis=1)
+
+
+def as_dict(vector):
+    return {name: round(float(value), 1) for name, value in zip(NUTRIENTS, vector)}
+
+
+def format_nutrition(values):
+    """One-line summary: '520 kcal | Protein 32 g | Carbs 41 g | Fat 22 g | Fiber 8 g'."""
+    if not isinstance(values, dict):
+        values = as_dict(values)
+    return (f"{values['calories']:.0f} kcal | Protein {values['protein']:.0f} g | "
+            f"Carbs {values['carbs']:.0f} g | Fat {values['fat']:.0f} g | Fiber {values['fiber']:.0f} g")
+
+
+def nutrition_from_lines(lines, servings):
+    """Per-serving nutrients from free-text ingredient lines, or None if too few are recognized."""
+    lines = [line for line in lines if line.strip()]
+    if not lines or not servings:
+        return None
+    grams_by_item = {}
+    matched = 0
+    for line in lines:
+        parsed = DB.parse_line(line)
+        if parsed:
+            item, grams = parsed
+            grams_by_item[item] = grams_by_item.get(item, 0) + grams
+            matched += 1
+    if matched / len(lines) < MIN_COVERAGE:
+        return None
+    return as_dict(DB.totals(grams_by_item) / servings)
+
+
+_SECTION_RE = re.compile(r'^\s*(?:#+\s*)?\*\*(?P<title>[^*]+?):?\*\*:?\s*$')
+
+
+def annotate_recipe(content, servings):
+    """
+    Replace the model-written Nutrition Information section with computed values.
+
+    The content is returned unchanged when the ingredient list cannot be
+    recognized well enough to compute reliable numbers.
+    """
+    lines = content.split('\n')
+    sections = {}
+    current = None
+    for n, line in enumerate(lines):
+        m = _SECTION_RE.match(line)
+        if m:
+            current = m.group('title').strip().lower()
+            sections[current] = [n, n + 1]
+        elif current:
+            sections[current][1] = n + 1
+
+    if 'ingredients' not in sections or 'nutrition information' not in sections:
+        return content
+    start, end = sections['ingredients']
+    values = nutrition_from_lines(lines[start + 1:end], servings)
+    if values is None:
+        return content
+
+    start, end = sections['nutrition information']
+    computed = [f"Per serving (computed): {format_nutrition(values)}", ""]
+    return '\n'.join(lines[:start + 1] + computed + lines[end:])
+
+
+DB = NutrientDatabase.load()
+
+
+def benchmark(days=30, rounds=10000):
+    """Time scoring a plan of days x 3 meals against the bundled recipes."""
+    from offline_engine import RECIPES
+    table = RecipeTable(RECIPES, DB)
+    rng = np.random.default_rng(0)
+    indices = rng.integers(0, len(RECIPES), size=(days, 3))
+    start = time.perf_counter()
+    for _ in range(rounds):
+        table.score(indices)
+    elapsed = (time.perf_counter() - start) / rounds
+    print(f"Scored a {days}-day plan in {elapsed * 1e6:.1f} microseconds")
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,276 @@
+"""
+Offline content engine.
+
+Assembles recipes, meal plans and grocery lists from the bundled recipe
+dataset (data/recipes.json) with no network access. Output follows the same
+layout the model is asked for, so the PDF and chat preview code paths do not
+care where the text came from.
+
+Used in two places:
+- as a degraded mode when every model backend fails
+- as a near-zero-latency answer for simple requests whose meaning is fully
+  captured by extract_parameters ("create a 7-day vegan meal plan")
+
+Selection is deterministic: the same parameters always produce the same plan.
+Dietary filters are strict; cuisine is a preference and is relaxed when the
+dataset has too few matching recipes.
+"""
+
+import json
+import logging
+import os
+import random
+import re
+from collections import OrderedDict
+from fractions import Fraction
+
+import numpy as np
+
+from nutrition import DB as NUTRIENT_DB, RecipeTable, format_nutrition
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+RECIPES_PATH = os.path.join(DATA_DIR, 'recipes.json')
+
+# Serve simple requests from the dataset without calling the model
+OFFLINE_FAST_PATH = os.getenv('OFFLINE_FAST_PATH', '1') == '1'
+
+MEALS = ('breakfast', 'lunch', 'dinner')
+GROCERY_CATEGORIES = ('Fresh Produce', 'Proteins', 'Dairy', 'Pantry Staples', 'Spices & Seasonings')
+DEFAULT_GROCERY_DAYS = 3
+
+# Words that carry no meaning beyond what extract_parameters already captured
+SIMPLE_VOCABULARY = {
+    'a', 'an', 'the', 'me', 'my', 'i', 'we', 'us', 'our', 'for', 'of', 'to', 'and', 'with', 'please', 'can',
+    'you', 'could', 'would', 'want', 'need', 'like', 'give', 'get', 'send', 'show', 'create', 'generate',
+    'make', 'build', 'plan', 'plans', 'meal', 'meals', 'weekly', 'week', 'day', 'days', 'schedule',
+    'grocery', 'groceries', 'shopping', 'list', 'ingredients', 'recipe', 'recipes', 'some', 'healthy',
+    'people', 'person', 'serving', 'servings', 'diet', 'food', 'cuisine', 'style', 'free', 'low', 'high',
+    'carb', 'protein', 'dairy', 'gluten', 'whole30', 'new', 'simple', 'easy', 'quick',
+    'calorie', 'calories', 'kcal', 'cal', 'budget', 'cheap', 'affordable', 'inexpensive', 'cost',
+    'frugal', 'premium', 'gourmet', 'splurge', 'luxury', 'per',
+}
+
+
+def load_recipes(path=RECIPES_PATH):
+    """Load the bundled recipe dataset."""
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)['recipes']
+    except Exception as e:
+        logger.error(f"Error loading recipe dataset {path}: {e}")
+        return []
+
+
+RECIPES = load_recipes()
+RECIPE_TABLE = RecipeTable(RECIPES, NUTRIENT_DB)
+
+
+def is_simple_request(message, params):
+    """True when the message says nothing extract_parameters did not already capture."""
+    if not params.get('type'):
+        return False
+    known = set(SIMPLE_VOCABULARY)
+    for value in (params.get('cuisine'), params.get('dietary')):
+        if value:
+            known.update(re.split(r'[\s-]+', value))
+    words = re.findall(r'[a-z0-9]+', message.lower())
+    return all(word in known or word.isdigit() for word in words)
+
+
+def find_recipes(meal=None, cuisine=None, dietary=None, seed=''):
+    """
+    Recipes matching meal and diet, in a stable order for seed.
+
+    Recipes of the requested cuisine come first, followed by the rest so a
+    long plan still has variety.
+    """
+    pool = [
+        r for r in RECIPES
+        if (meal is None or r['meal'] == meal) and (not dietary or dietary in r['diets'])
+    ]
+    rng = random.Random(f"{meal}|{cuisine}|{dietary}|{seed}")
+    rng.shuffle(pool)
+    if cuisine:
+        pool.sort(key=lambda r: r['cuisine'] != cuisine)
+    return pool
+
+
+def format_quantity(quantity):
+    """Format a quantity as a kitchen-friendly mixed fraction (1.5 -> '1 1/2')."""
+    if quantity >= 10:
+        return str(int(round(quantity)))
+    frac = Fraction(round(quantity * 4), 4) or Fraction(1, 4)
+    whole, rest = divmod(frac, 1)
+    if not rest:
+        return str(int(whole))
+    if not whole:
+        return f"{rest.numerator}/{rest.denominator}"
+    return f"{int(whole)} {rest.numerator}/{rest.denominator}"
+
+
+def format_ingredient(ingredient, scale=1.0):
+    quantity = ingredient['quantity'] * scale
+    amount = format_quantity(quantity)
+    unit = ingredient['unit']
+    if unit in ('clove', 'sheet') and quantity > 1:
+        unit += 's'
+    return f"{amount} {unit} {ingredient['item']}" if unit else f"{amount} {ingredient['item']}"
+
+
+def pick_recipe(message, params):
+    """Best recipe for a free-text request: most words in common with name and ingredients."""
+    pool = find_recipes(cuisine=params.get('cuisine'), dietary=params.get('dietary'))
+    if not pool:
+        return None
+    words = set(re.findall(r'[a-z]+', message.lower())) - SIMPLE_VOCABULARY
+
+    def score(recipe):
+        text = recipe['name'].lower() + ' ' + ' '.join(i['item'] for i in recipe['ingredients'])
+        hits = sum(1 for w in words if w in text or w.rstrip('s') in text)
+        return (hits, recipe['cuisine'] == params.get('cuisine'), recipe['meal'] == 'dinner')
+
+    return max(pool, key=score)
+
+
+def plan_days(days, cuisine=None, dietary=None):
+    """Choose breakfast, lunch and dinner for each day, rotating for variety."""
+    pools = {meal: find_recipes(meal, cuisine, dietary, seed=days) for meal in MEALS}
+    plan = []
+    for day in range(days):
+        plan.append({
+            meal: pools[meal][day % len(pools[meal])] if pools[meal] else None
+            for meal in MEALS
+        })
+    return plan
+
+
+def render_recipe(recipe, servings):
+    scale = servings / recipe['servings']
+    lines = [
+        f"**Recipe Name:** {recipe['name']}",
+        "",
+        f"Servings: {servings} | Total time: {recipe['minutes']} minutes | Cuisine: {recipe['cuisine'].title()}",
+        "",
+        "**Ingredients:**",
+    ]
+    lines += [f"- {format_ingredient(i, scale)}" for i in recipe['ingredients']]
+    lines += ["", "**Instructions:**"]
+    lines += [f"{n}. {step}" for n, step in enumerate(recipe['steps'], 1)]
+    lines += ["", "**Nutrition Information:**", f"Per serving: {format_nutrition(RECIPE_TABLE.recipe(recipe['id']))}"]
+    if recipe['diets']:
+        lines += ["", "**Dietary Notes:**", f"Suitable for: {', '.join(recipe['diets'])}"]
+    lines += ["", "**Chef's Tips:**"]
+    lines += [f"- {tip}" for tip in recipe['tips']]
+    return '\n'.join(lines)
+
+
+def render_meal_plan(plan, params, portions=None, notes=None, relaxed=None):
+    """
+    Render a plan (list of {meal: recipe}) in the model's meal plan layout.
+
+    portions optionally gives servings per person for each slot ({meal: factor}
+    per day, as chosen by meal_solver). notes is model-written prose that
+    replaces the dataset's prep tips. relaxed lists the constraints meal_solver
+    had to loosen to find the plan.
+    """
+    header = f"{len(plan)}-Day Meal Plan"
+    details = [d for d in (params.get('cuisine'), params.get('dietary')) if d]
+    if details:
+        header += f" ({', '.join(details)})"
+    lines = [f"**{header}**", ""]
+    indices = RECIPE_TABLE.plan_indices(plan)
+    factors = np.array([[p[meal] for meal in MEALS] for p in portions]) if portions else None
+    per_meal, per_day = RECIPE_TABLE.score(indices, factors)
+    cost = RECIPE_TABLE.cost(indices, factors)
+    for n, day in enumerate(plan, 1):
+        lines.append(f"### Day {n}")
+        for m, meal in enumerate(MEALS):
+            recipe = day[meal]
+            if recipe:
+                size = f"{factors[n - 1, m]:g} portions, " if factors is not None and factors[n - 1, m] != 1 else ''
+                title = f"{recipe['name']} ({size}{recipe['minutes']} min, {per_meal[n - 1, m, 0]:.0f} kcal)"
+            else:
+                title = "Leftovers"
+            lines.append(f"**{meal.title()}:** {title}")
+        lines.append(f"Daily total per person: {format_nutrition(per_day[n - 1])}")
+        lines.append("")
+
+    servings = params.get('servings') or 4
+    lines.append("### Nutrition Summary")
+    lines.append(f"Average per day: {format_nutrition(per_day.mean(axis=0))}")
+    lines.append(f"Estimated ingredient cost: ${cost.mean():.2f} per person per day "
+                 f"(about ${cost.sum() * servings:.0f} for {servings} people over {len(plan)} days)")
+    if relaxed:
+        lines.append(f"To fit your request with the recipes available: {'; '.join(relaxed)}.")
+    lines.append("")
+
+    if notes:
+        lines.append(notes.strip())
+        return '\n'.join(lines)
+
+    tips = OrderedDict()
+    for day in plan:
+        for recipe in day.values():
+            if recipe and recipe['tips']:
+                tips.setdefault(recipe['tips'][0], None)
+    lines.append("### Prep Tips")
+    lines += [f"- {tip}" for tip in list(tips)[:6]]
+    return '\n'.join(lines)
+
+
+def aggregate_groceries(plan, servings):
+    """Sum ingredient quantities across a plan, grouped by aisle."""
+    totals = OrderedDict((category, OrderedDict()) for category in GROCERY_CATEGORIES)
+    for day in plan:
+        for recipe in day.values():
+            if not recipe:
+                continue
+            scale = servings / recipe['servings']
+            for ing in recipe['ingredients']:
+                aisle = totals.setdefault(ing['aisle'], OrderedDict())
+                key = (ing['item'], ing['unit'])
+                aisle[key] = aisle.get(key, 0) + ing['quantity'] * scale
+    return totals
+
+
+def render_grocery_list(plan, params):
+    servings = params.get('servings') or 4
+    lines = [f"**Grocery List for {len(plan)} Days ({servings} people)**", ""]
+    for category, items in aggregate_groceries(plan, servings).items():
+        if not items:
+            continue
+        lines.append(f"**{category}:**")
+        for (item, unit), quantity in sorted(items.items()):
+            lines.append(f"- {format_ingredient({'item': item, 'unit': unit, 'quantity': quantity})}")
+        lines.append("")
+    lines += [
+        "**Budget Tips:**",
+        "- Buy grains, beans and spices from bulk bins.",
+        "- Choose frozen vegetables and berries when fresh ones are out of season.",
+        "- Cook once, eat twice: double dinner recipes for next-day lunches.",
+    ]
+    return '\n'.join(lines)
+
+
+def generate_offline(kind, message, params):
+    """Generate content for kind from the bundled dataset, or None if nothing matches."""
+    servings = params.get('servings') or 4
+    cuisine, dietary = params.get('cuisine'), params.get('dietary')
+
+    if kind == 'recipe':
+        recipe = pick_recipe(message, params)
+        if not recipe:
+            return None
+        return render_recipe(recipe, servings)
+
+    days = params.get('days') or (7 if kind == 'meal_plan' else DEFAULT_GROCERY_DAYS)
+    plan = plan_days(days, cuisine, dietary)
+    if not plan or not any(all(day.values()) for day in plan):
+        return None
+    if kind == 'meal_plan':
+        return render_meal_plan(plan, params)
+    if kind == 'grocery_list':
+        return render_grocery_list(plan, params)
+    return None
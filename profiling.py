@@ -0,0 +1,394 @@
+"""
+Profiling hooks: single-request profiles and a low-overhead stack sampler.
+
+Everything here is off unless PROFILE_TOKEN is set, and every entry point
+requires that token in the X-Profile-Token header. Without it the admin
+routes answer 404 and X-Profile headers are ignored.
+
+One request
+    Send the token plus X-Profile: cprofile (every Python call, deterministic)
+    or X-Profile: sample (a stack of the request thread every
+    PROFILE_REQUEST_INTERVAL seconds). The response carries X-Profile-Id.
+    Results are fetched from /admin/profiles/<id>.<ext>:
+        .txt        cProfile: the top functions by cumulative time
+        .prof       cProfile: pstats dump (python -m pstats, snakeviz)
+        .collapsed  sample: collapsed stacks (flamegraph.pl, speedscope, inferno)
+    Each worker profiles one request at a time, because cProfile profilers
+    cannot overlap. Other requests get X-Profile-Status: busy.
+
+Sampler
+    A background thread in each worker. While enabled, it samples the stacks
+    of the threads serving requests and of the compression threads every
+    PROFILE_SAMPLE_INTERVAL seconds. Each stack is rooted at the endpoint. The
+    counts go to PROFILE_DIR as collapsed stacks every PROFILE_SAMPLE_FLUSH
+    seconds; concatenate the files of a window and render them as one
+    flamegraph. Samples are wall-clock. Time waiting on the model API shows
+    up as socket frames under call_openai, and ReportLab layout appears
+    under create_branded_pdf.
+    Enable it with PROFILE_SAMPLER=1 (always on), or for a window on every
+    worker with POST /admin/profiles/sampler {"seconds": 300}. The window is
+    capped at PROFILE_SAMPLER_MAX_SECONDS.
+
+Overhead (python profiling.py --bench: median of chat-like requests, i.e.
+offline meal plan, document tree and PDF layout, ~68 ms each):
+    sampler every 10 ms (default)   within noise (<1%); ~20 us per sample, so at
+                                    most ~0.2% of a core however busy the worker is
+    sampler every 1 ms              ~1.5-2%
+    cProfile, one request           ~3x that request's time; only the profiled
+                                    request pays it
+The sampler's cost grows with the number of threads serving requests (one
+stack walk each, at most MAX_DEPTH frames), not with request rate.
+Live cost is visible in profiler_sample_seconds_total (time spent sampling).
+
+Configuration (environment):
+    PROFILE_TOKEN                   enables profiling; required in X-Profile-Token
+    PROFILE_DIR                     where profiles are written (default /tmp/meal-profiles)
+    PROFILE_SAMPLER                 1 to sample continuously (default 0)
+    PROFILE_SAMPLE_INTERVAL         seconds between background samples (default 0.01)
+    PROFILE_SAMPLE_FLUSH            seconds between collapsed-stack files (default 60)
+    PROFILE_SAMPLER_MAX_SECONDS     longest window POST /admin/profiles/sampler starts (default 1800)
+    PROFILE_REQUEST_INTERVAL        seconds between samples of X-Profile: sample (default 0.001)
+    PROFILE_KEEP                    profile files kept before the oldest are deleted (default 200)
+"""
+
+import argparse
+import collections
+import cProfile
+import datetime
+import hmac
+import io
+import itertools
+import logging
+import os
+import pstats
+import secrets
+import sys
+import threading
+import time
+
+from flask import g, request
+
+import metrics
+from shared_cache import get_cache
+
+logger = logging.getLogger(__name__)
+
+PROFILE_TOKEN = os.getenv('PROFILE_TOKEN', '')
+PROFILE_DIR = os.getenv('PROFILE_DIR', '/tmp/meal-profiles')
+PROFILE_SAMPLER = os.getenv('PROFILE_SAMPLER', '0') == '1'
+PROFILE_SAMPLE_INTERVAL = float(os.getenv('PROFILE_SAMPLE_INTERVAL', 0.01))
+PROFILE_SAMPLE_FLUSH = float(os.getenv('PROFILE_SAMPLE_FLUSH', 60))
+PROFILE_SAMPLER_MAX_SECONDS = int(os.getenv('PROFILE_SAMPLER_MAX_SECONDS', 1800))
+PROFILE_REQUEST_INTERVAL = float(os.getenv('PROFILE_REQUEST_INTERVAL', 0.001))
+PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', 200))
+
+MODES = ('cprofile', 'sample')
+MAX_DEPTH = 64          # frames kept per stack (the innermost)
+MAX_STACKS = 20_000     # distinct stacks per flush; the rest are counted as [truncated]
+TOP_FUNCTIONS = 40
+SAMPLER_WINDOW_KEY = 'profiling:sampler-until'
+# Innermost frames of a thread waiting for work, not doing any (an idle executor)
+IDLE_FRAMES = frozenset({'_worker (thread.py)'})
+
+_active = {}            # thread ident -> endpoint, for threads serving a request
+_request_lock = threading.Lock()
+_sampler = None
+_sampler_pid = None
+
+
+def enabled():
+    return bool(PROFILE_TOKEN)
+
+
+def authorized():
+    """True when profiling is on and the request carries the token."""
+    supplied = request.headers.get('X-Profile-Token', '')
+    return enabled() and bool(supplied) and hmac.compare_digest(supplied, PROFILE_TOKEN)
+
+
+def frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)})"
+
+
+def collapse(frame, root):
+    """A thread's current stack as one collapsed-stack line: root;outermost;...;innermost."""
+    names = []
+    while frame is not None and len(names) < MAX_DEPTH:
+        names.append(frame_label(frame.f_code))
+        frame = frame.f_back
+    names.append(root)
+    return ';'.join(reversed(names))
+
+
+class StackSampler(threading.Thread):
+    """Count the collapsed stacks of target threads every interval seconds until stopped."""
+
+    def __init__(self, interval, targets, name='profile-sampler'):
+        super().__init__(name=name, daemon=True)
+        self.interval = interval
+        self.targets = targets          # () -> {thread ident: root label}
+        self.counts = collections.Counter()
+        self.samples = 0
+        self.busy = 0.0                 # seconds spent sampling
+        self.stopping = threading.Event()
+
+    def sample_once(self):
+        start = time.perf_counter()
+        frames = sys._current_frames()
+        for ident, root in self.targets().items():
+            frame = frames.get(ident)
+            if frame is None or frame_label(frame.f_code) in IDLE_FRAMES:
+                continue
+            stack = collapse(frame, root)
+            if stack in self.counts or len(self.counts) < MAX_STACKS:
+                self.counts[stack] += 1
+            else:
+                self.counts['[truncated]'] += 1
+        del frames
+        self.samples += 1
+        self.busy += time.perf_counter() - start
+
+    def run(self):
+        while not self.stopping.wait(self.interval):
+            self.sample_once()
+
+    def stop(self):
+        self.stopping.set()
+        self.join(timeout=1)
+
+    def collapsed(self):
+        return ''.join(f"{stack} {count}\n" for stack, count in sorted(self.counts.items()))
+
+
+class BackgroundSampler(StackSampler):
+    """The per-worker sampler: idle unless enabled, flushing a collapsed-stack file periodically."""
+
+    def __init__(self, interval=PROFILE_SAMPLE_INTERVAL):
+        super().__init__(interval, self._targets, name='profile-background')
+        self.background_threads = {}
+        self.checked = 0.0
+        self.active = False
+        self.flushed = time.monotonic()
+
+    def _targets(self):
+        return {**dict(_active), **self.background_threads}
+
+    def _check(self):
+        # Once a second: is sampling on, and which threads compress responses in the background
+        now = time.time()
+        if now - self.checked < 1:
+            return self.active
+        self.checked = now
+        until = get_cache().get(SAMPLER_WINDOW_KEY)
+        self.active = PROFILE_SAMPLER or (until is not None and float(until) > now)
+        self.background_threads = {t.ident: 'compress' for t in threading.enumerate() if t.name.startswith('compress')}
+        return self.active
+
+    def run(self):
+        while not self.stopping.is_set():
+            if not self._check():
+                self.flush()
+                self.stopping.wait(1)
+                continue
+            self.sample_once()
+            if time.monotonic() - self.flushed >= PROFILE_SAMPLE_FLUSH:
+                self.flush()
+            self.stopping.wait(self.interval)
+
+    def flush(self):
+        self.flushed = time.monotonic()
+        if not self.counts:
+            return
+        samples, busy = self.samples, self.busy
+        stamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+        _write(f"samples-{stamp}-{os.getpid()}.collapsed", self.collapsed())
+        self.counts = collections.Counter()
+        self.samples, self.busy = 0, 0.0
+        metrics.inc('profiler_samples_total', samples)
+        metrics.inc('profiler_sample_seconds_total', busy)
+
+
+def _write(name, text):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, name)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    _prune()
+    return path
+
+
+def _prune():
+    files = sorted((entry.stat().st_mtime, entry.path) for entry in os.scandir(PROFILE_DIR) if entry.is_file())
+    for _, path in files[:max(len(files) - PROFILE_KEEP, 0)]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _ensure_sampler():
+    # Started lazily in each worker: threads do not survive a fork
+    global _sampler, _sampler_pid
+    if _sampler_pid != os.getpid():
+        _sampler_pid = os.getpid()
+        _sampler = BackgroundSampler()
+        _sampler.start()
+
+
+def enable_sampler(seconds):
+    """Turn on the background sampler of every worker for seconds (capped); returns the end time."""
+    until = time.time() + max(0, min(seconds, PROFILE_SAMPLER_MAX_SECONDS))
+    get_cache().set(SAMPLER_WINDOW_KEY, str(until).encode('ascii'), ttl=PROFILE_SAMPLER_MAX_SECONDS)
+    logger.info(f"Background profiling sampler on until {datetime.datetime.fromtimestamp(until):%H:%M:%S}")
+    return until
+
+
+def start_request():
+    """before_request hook: track the thread for the sampler and start a requested profile."""
+    if not enabled():
+        return None
+    _ensure_sampler()
+    _active[threading.get_ident()] = request.endpoint or 'unknown'
+
+    mode = request.headers.get('X-Profile')
+    if mode not in MODES or not authorized():
+        return None
+    if not _request_lock.acquire(blocking=False):
+        g.profile_status = 'busy'
+        return None
+    g.profile_id = f"{datetime.datetime.now():%Y%m%d-%H%M%S}-{request.endpoint}-{secrets.token_hex(3)}"
+    g.profile_mode = mode
+    if mode == 'cprofile':
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+    else:
+        ident = threading.get_ident()
+        endpoint = request.endpoint or 'unknown'
+        g.profiler = StackSampler(PROFILE_REQUEST_INTERVAL, lambda: {ident: endpoint}, name='profile-request')
+        g.profiler.start()
+    return None
+
+
+def finish_request(response):
+    """after_request hook: stop a running profile, write it and tell the client where it is."""
+    profiler = g.pop('profiler', None)
+    if profiler is None:
+        status = g.pop('profile_status', None)
+        if status:
+            response.headers['X-Profile-Status'] = status
+        return response
+    try:
+        if isinstance(profiler, cProfile.Profile):
+            profiler.disable()
+            _write(f"{g.profile_id}.txt", _top_functions(profiler))
+            profiler.dump_stats(os.path.join(PROFILE_DIR, f"{g.profile_id}.prof"))
+        else:
+            profiler.stop()
+            profiler.sample_once()  # requests shorter than one interval still get a stack
+            _write(f"{g.profile_id}.collapsed", profiler.collapsed())
+        response.headers['X-Profile-Id'] = g.profile_id
+        response.headers['X-Profile-Status'] = 'captured'
+        metrics.inc('profiles_captured_total', mode=g.profile_mode)
+        logger.info(f"Captured {g.profile_mode} profile {g.profile_id}")
+    finally:
+        _request_lock.release()
+    return response
+
+
+def end_request(exc=None):
+    """teardown_request hook: the thread no longer serves a request."""
+    _active.pop(threading.get_ident(), None)
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        # after_request did not run (unhandled error); drop the profile
+        if isinstance(profiler, cProfile.Profile):
+            profiler.disable()
+        else:
+            profiler.stop()
+        _request_lock.release()
+
+
+def _top_functions(profiler):
+    out = io.StringIO()
+    stats = pstats.Stats(profiler, stream=out)
+    stats.sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+    return out.getvalue()
+
+
+def list_profiles():
+    """Profile files, newest first."""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    entries = sorted(os.scandir(PROFILE_DIR), key=lambda e: e.stat().st_mtime, reverse=True)
+    return [{'name': e.name, 'bytes': e.stat().st_size,
+             'modified': datetime.datetime.fromtimestamp(e.stat().st_mtime).isoformat(timespec='seconds')}
+            for e in entries if e.is_file()]
+
+
+def _bench_request(n):
+    """One chat-like request: offline content, its document tree and a PDF render."""
+    from Meal_Planner_Chatbot import create_branded_pdf
+    from document import parse
+    from offline_engine import generate_offline
+
+    params = {'type': 'meal_plan', 'days': 7, 'servings': 4, 'dietary': 'vegan', 'cuisine': None,
+              'budget': 'moderate', 'calories': None}
+    # A different line each time, so the PDF cache never short-circuits the layout
+    content = generate_offline('meal_plan', '7 day vegan meal plan', params) + f"\n\nBench request {n}"
+    create_branded_pdf(content, f"profile-bench-{n % 4}.pdf", 'meal_plan', document=parse(content, 'meal_plan'))
+
+
+def benchmark(requests=30):
+    """Median per-request time with no profiling, the sampler at two rates, and cProfile."""
+    import shared_cache
+    shared_cache.SHARED_CACHE = False   # keep bench renders out of the workers' cache
+    os.environ.setdefault('PDF_LOCAL_DIR', '/tmp/profile-bench')
+
+    def profiled(n):
+        profiler = cProfile.Profile()
+        profiler.enable()
+        _bench_request(n)
+        profiler.disable()
+
+    numbers = itertools.count()
+
+    def median(run):
+        times = []
+        for _ in range(requests):
+            n = next(numbers)
+            start = time.perf_counter()
+            run(n)
+            times.append(time.perf_counter() - start)
+        return sorted(times)[len(times) // 2]
+
+    _bench_request(next(numbers))   # warm up imports, fonts and images
+    ident = threading.get_ident()
+    baseline = median(_bench_request)
+    results = [('no profiling', baseline, '')]
+    for interval in (0.01, 0.001):
+        sampler = StackSampler(interval, lambda: {ident: 'bench'})
+        sampler.start()
+        seconds = median(_bench_request)
+        sampler.stop()
+        results.append((f"sampler every {interval * 1000:g} ms", seconds,
+                        f"{sampler.busy / max(sampler.samples, 1) * 1e6:.0f} us per sample"))
+    results.append(('cProfile', median(profiled), ''))
+
+    for name, seconds, note in results:
+        print(f"{name:24s} {seconds * 1000:7.1f} ms per request ({(seconds / baseline - 1) * 100:+5.1f}%)  {note}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profiling hooks")
+    parser.add_argument('--bench', action='store_true', help="measure profiling overhead on chat-like requests")
+    parser.add_argument('--requests', type=int, default=30)
+    args = parser.parse_args()
+    if args.bench:
+        benchmark(args.requests)
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    main()
@@ -0,0 +1,231 @@
+"""
+Prompt builder with versioned templates and token budgeting.
+
+Each generation type has a template made of two parts:
+
+- a static system message (persona + output format). It never changes for a
+  given template version, so every request of that type shares the same
+  prefix and upstream prompt caching can reuse it.
+- a short user message carrying the per-request details. The user's raw text
+  is capped at MAX_USER_MESSAGE_TOKENS so a pasted essay is not sent upstream
+  in full.
+
+max_tokens is sized from the expected output (a 3-day plan needs far less
+than a 30-day plan) instead of a fixed 2000.
+
+Token counts use tiktoken when it is installed and a close local estimate
+otherwise.
+"""
+
+import logging
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+PROMPT_VERSION = os.getenv('PROMPT_VERSION', 'v1')
+MAX_USER_MESSAGE_TOKENS = int(os.getenv('MAX_USER_MESSAGE_TOKENS', 300))
+MODEL_CONTEXT_TOKENS = int(os.getenv('MODEL_CONTEXT_TOKENS', 8192))
+MAX_OUTPUT_TOKENS = int(os.getenv('MAX_OUTPUT_TOKENS', 4096))
+
+SYSTEM_PROMPT = 'You are a professional nutritionist and chef specializing in healthy, delicious meals.'
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding('cl100k_base')
+except Exception:  # tiktoken missing or its encoding files unavailable
+    _encoding = None
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+
+def count_tokens(text):
+    """Count tokens in text (exact with tiktoken, estimated otherwise)."""
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    # Words and punctuation marks, plus ~1/3 extra for sub-word splits
+    pieces = len(_TOKEN_RE.findall(text))
+    return pieces + pieces // 3
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Cut text down to at most max_tokens, preferring a word boundary."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    if _encoding is not None:
+        cut = _encoding.decode(_encoding.encode(text)[:max_tokens])
+    else:
+        # Approximate: keep the same share of characters as of tokens
+        cut = text[:int(len(text) * max_tokens / count_tokens(text))]
+    if ' ' in cut:
+        cut = cut.rsplit(' ', 1)[0]
+    return cut.rstrip() + '...'
+
+
+class Prompt:
+    """A rendered prompt ready to send upstream."""
+
+    def __init__(self, kind, version, system, user, max_tokens, tier=None):
+        self.kind = kind
+        self.version = version
+        self.system = system
+        self.user = user
+        self.max_tokens = max_tokens
+        self.tier = tier    # model_router tier; None routes by kind
+        self.input_tokens = count_tokens(system) + count_tokens(user)
+
+    def messages(self):
+        return [
+            {'role': 'system', 'content': self.system},
+            {'role': 'user', 'content': self.user},
+        ]
+
+    def __repr__(self):
+        tier = f", tier={self.tier}" if self.tier else ''
+        return (f"Prompt({self.kind}/{self.version}, input_tokens={self.input_tokens}, "
+                f"max_tokens={self.max_tokens}{tier})")
+
+
+class PromptTemplate:
+    """
+    A versioned prompt template.
+
+    instructions: static text appended to the system prompt
+    lines: (format string, required param) pairs for the user message; a line
+        is skipped when its required param is empty
+    base_tokens / tokens_per_day: expected output size
+    """
+
+    def __init__(self, kind, version, instructions, lines, base_tokens, tokens_per_day=0):
+        self.kind = kind
+        self.version = version
+        self.system = f"{SYSTEM_PROMPT}\n\n{instructions.strip()}"
+        self.lines = lines
+        self.base_tokens = base_tokens
+        self.tokens_per_day = tokens_per_day
+
+    def output_budget(self, days):
+        return self.base_tokens + self.tokens_per_day * (days or 0)
+
+    def render(self, message, params):
+        fields = dict(params)
+        fields['message'] = truncate_to_tokens(message.strip(), MAX_USER_MESSAGE_TOKENS)
+        user = '\n'.join(
+            fmt.format(**fields) for fmt, required in self.lines
+            if required is None or fields.get(required)
+        )
+
+        prompt = Prompt(self.kind, self.version, self.system, user, 0)
+        room = MODEL_CONTEXT_TOKENS - prompt.input_tokens - 32  # chat format overhead
+        prompt.max_tokens = max(64, min(self.output_budget(fields.get('days')), MAX_OUTPUT_TOKENS, room))
+        return prompt
+
+
+TEMPLATES = {
+    'v1': {
+        'recipe': PromptTemplate(
+            'recipe', 'v1',
+            instructions="""
+Write recipes in this format:
+**Recipe Name:**
+
+**Ingredients:**
+(List with measurements)
+
+**Instructions:**
+(Step-by-step numbered)
+
+**Nutrition Information:**
+(Per serving)
+
+**Chef's Tips:**
+(Pro tips)""",
+            lines=[
+                ("Create a detailed, professional recipe based on this request: '{message}'\n", None),
+                ("Cuisine style: {cuisine}", 'cuisine'),
+                ("Dietary requirement: {dietary} (follow all {dietary} rules strictly)", 'dietary'),
+                ("Servings: {servings}", None),
+            ],
+            base_tokens=900,
+        ),
+        'meal_plan': PromptTemplate(
+            'meal_plan', 'v1',
+            instructions="""
+Write meal plans with each day formatted clearly:
+
+### Day X
+**Breakfast:**
+**Lunch:**
+**Dinner:**
+
+Include nutritional highlights and prep tips.""",
+            lines=[
+                ("Create a detailed {days}-day meal plan.\n", None),
+                ("Cuisine preference: {cuisine}", 'cuisine'),
+                ("Dietary preference: {dietary}", 'dietary'),
+                ("Daily calorie target: {calories} kcal", 'calories'),
+                ("Budget: {budget}", None),
+            ],
+            base_tokens=250,
+            tokens_per_day=180,
+        ),
+        'meal_plan_notes': PromptTemplate(
+            'meal_plan_notes', 'v1',
+            instructions="""
+The meals of this plan are already chosen and meet the user's diet, calorie
+and budget requirements. Do not add, remove or change any meal.
+
+Write only:
+
+### Overview
+(2-3 sentences on how the plan fits the request)
+
+### Prep Tips
+(4-6 short bullet points: batch cooking, leftovers, storage)""",
+            lines=[
+                ("User request: '{message}'\n", None),
+                ("Dietary preference: {dietary}", 'dietary'),
+                ("Servings: {servings}", None),
+                ("Plan:\n{plan}", None),
+            ],
+            base_tokens=350,
+        ),
+        'grocery_list': PromptTemplate(
+            'grocery_list', 'v1',
+            instructions="""
+Write grocery shopping lists formatted by category:
+
+**Fresh Produce:**
+**Proteins:**
+**Dairy:**
+**Pantry Staples:**
+**Spices & Seasonings:**
+
+Include quantities and budget tips.""",
+            lines=[
+                ("Generate a complete grocery shopping list.\n", None),
+                ("Dietary preference: {dietary}", 'dietary'),
+                ("Servings: {servings} people", None),
+                ("Budget: {budget}", None),
+            ],
+            base_tokens=700,
+        ),
+    },
+}
+
+
+def build_prompt(kind, message, params, version=None, tier=None, max_tokens=None):
+    """
+    Render the prompt for a generation type from the user's message and extracted params.
+
+    tier overrides the model_router tier of the kind; max_tokens caps the output budget.
+    """
+    templates = TEMPLATES.get(version or PROMPT_VERSION) or TEMPLATES['v1']
+    prompt = templates[kind].render(message, params)
+    prompt.tier = tier
+    if max_tokens:
+        prompt.max_tokens = min(prompt.max_tokens, max_tokens)
+    logger.info(f"Built {prompt!r}")
+    return prompt
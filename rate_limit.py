@@ -0,0 +1,285 @@
+"""
+Per-client rate limiting with sliding-window counters.
+
+Register check_request as the first before_request hook. It runs after URL
+routing but before the request body is read, so an over-limit client costs a
+dictionary lookup, not a JSON parse, a model call or a PDF render.
+
+Clients are identified by API key (X-API-Key, when it is one of
+RATE_LIMIT_API_KEYS; those get API_KEY_MULTIPLIER times the limits) or
+otherwise by IP address. Each endpoint falls in a limit class with its own
+budget, so a burst of downloads does not eat into chat:
+
+    generate    /chat messages that reach model generation or PDF work
+    alexa       /alexa
+    download    /download/<file>
+    light       the page, stats, every other /chat message and anything else
+                not exempt
+
+Every /chat request counts against light here. Greetings, the welcome
+message, catalog hits and plan follow-ups cost no more than that. chat()
+calls check_class('generate') only once it is about to generate, so only
+those requests count against the smaller generate budget.
+
+Static assets, /metrics and CORS preflights are exempt.
+
+Counting uses the two-window approximation of a sliding window: per client and
+class only the current and previous fixed windows' counts are kept, and the
+rate is previous * (share of the previous window still inside the sliding
+window) + current. That is O(1) time and three integers of memory per client,
+and it does not allow the double bursts of plain fixed windows at window
+edges.
+
+Counters are per process unless RATE_LIMIT_REDIS_URL is set, in which case
+they are shared through Redis (one pipelined round trip per request; if Redis
+is unreachable the local counters are used). With per-process counters a
+client can get up to (workers x limit) across a host.
+
+Configuration (environment):
+    RATE_LIMIT_ENABLED          1 (default) or 0
+    RATE_LIMIT_<CLASS>          "count/seconds", e.g. RATE_LIMIT_GENERATE=20/60
+    RATE_LIMIT_API_KEYS         comma-separated API keys with raised limits
+    RATE_LIMIT_TRUSTED_PROXIES  proxies in front of the app whose X-Forwarded-For
+                                entries are trusted (default 1, Railway's edge)
+    RATE_LIMIT_REDIS_URL        shared counters (optional, needs the redis package)
+"""
+
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import jsonify, request
+
+import metrics
+
+try:
+    import redis
+except ImportError:  # shared counters need the redis package
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', '1') == '1'
+TRUSTED_PROXIES = int(os.getenv('RATE_LIMIT_TRUSTED_PROXIES', 1))
+API_KEYS = frozenset(k.strip() for k in os.getenv('RATE_LIMIT_API_KEYS', '').split(',') if k.strip())
+API_KEY_MULTIPLIER = 10
+REDIS_URL = os.getenv('RATE_LIMIT_REDIS_URL')
+
+# (requests, window seconds) per limit class
+DEFAULT_LIMITS = {
+    'generate': (20, 60),
+    'alexa': (30, 60),
+    'download': (60, 60),
+    'light': (300, 60),
+}
+
+# Endpoint (Flask view name) -> limit class; None is exempt
+ENDPOINT_CLASSES = {
+    'chat': 'light',    # and 'generate' from chat() once it generates (see check_class)
+    'alexa': 'alexa',
+    'download_pdf': 'download',
+    'serve_static': None,
+    'serve_asset': None,
+    'metrics_endpoint': None,
+}
+
+MAX_CLIENTS = 100_000      # local entries kept before the least recently seen are dropped
+SWEEP_EVERY = 10_000       # checks between sweeps of expired local entries
+
+
+def _parse_limit(value, default):
+    try:
+        count, seconds = value.split('/')
+        return int(count), int(seconds)
+    except (AttributeError, ValueError):
+        if value:
+            logger.warning(f"Ignoring malformed rate limit {value!r}, using {default[0]}/{default[1]}")
+        return default
+
+
+LIMITS = {name: _parse_limit(os.getenv(f'RATE_LIMIT_{name.upper()}'), default)
+          for name, default in DEFAULT_LIMITS.items()}
+
+
+def sliding_count(previous, current, elapsed, window):
+    """Requests in the sliding window ending now, estimated from two fixed windows."""
+    return previous * (1 - elapsed / window) + current
+
+
+def retry_after(previous, current, elapsed, window, limit):
+    """Seconds until one more request fits under limit."""
+    if current + 1 > limit:
+        # Wait for the next window, then until this window's count has decayed enough
+        return (window - elapsed) + window * (1 - (limit - 1) / current)
+    return max(window * (1 - (limit - current - 1) / previous) - elapsed, 0) if previous else 0
+
+
+class SlidingWindowLimiter:
+    """In-process counters: key -> [window index, current count, previous count].
+
+    Entries are kept in least recently seen order, so once MAX_CLIENTS is
+    reached each new client evicts the oldest in O(1).
+    """
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.checks = 0
+
+    def hit(self, key, limit, window, now=None):
+        """Count a request; returns (allowed, retry after seconds)."""
+        now = time.time() if now is None else now
+        index, elapsed = divmod(now, window)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                entry = self.entries[key] = [index, 0, 0]
+                if len(self.entries) > MAX_CLIENTS:
+                    self.entries.popitem(last=False)
+            else:
+                self.entries.move_to_end(key)
+            if entry[0] < index - 1:
+                entry[:] = [index, 0, 0]
+            elif entry[0] == index - 1:
+                entry[:] = [index, 0, entry[1]]
+            _, current, previous = entry
+            if sliding_count(previous, current, elapsed, window) + 1 > limit:
+                return False, retry_after(previous, current, elapsed, window, limit)
+            entry[1] += 1
+            self.checks += 1
+            if self.checks % SWEEP_EVERY == 0:
+                self._sweep(now)
+        return True, 0
+
+    def peek(self, key, limit, window, now=None):
+        """Requests still allowed for key right now, without counting one."""
+        now = time.time() if now is None else now
+        index, elapsed = divmod(now, window)
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry is None or entry[0] < index - 1:
+            return limit
+        current, previous = (0, entry[1]) if entry[0] == index - 1 else (entry[1], entry[2])
+        return max(int(limit - sliding_count(previous, current, elapsed, window)), 0)
+
+    def _sweep(self, now):
+        """Drop clients with nothing left in their sliding window."""
+        stale = [key for key, (index, _, _) in self.entries.items()
+                 if index < now // LIMITS[key[0]][1] - 1]
+        for key in stale:
+            del self.entries[key]
+
+
+class RedisLimiter:
+    """The same counters in Redis, shared by every worker and host."""
+
+    def __init__(self, url):
+        self.client = redis.Redis.from_url(url, socket_timeout=0.2, socket_connect_timeout=0.2)
+
+    def hit(self, key, limit, window, now=None):
+        now = time.time() if now is None else now
+        index, elapsed = divmod(now, window)
+        base = 'ratelimit:' + ':'.join(key)
+        pipe = self.client.pipeline(transaction=False)
+        pipe.incr(f"{base}:{index:.0f}")
+        pipe.expire(f"{base}:{index:.0f}", int(window * 2))
+        pipe.get(f"{base}:{index - 1:.0f}")
+        current, _, previous = pipe.execute()
+        previous = int(previous or 0)
+        # INCR already counted this request; rejected requests are taken back out
+        if sliding_count(previous, current - 1, elapsed, window) + 1 > limit:
+            self.client.decr(f"{base}:{index:.0f}")
+            return False, retry_after(previous, current - 1, elapsed, window, limit)
+        return True, 0
+
+    def peek(self, key, limit, window, now=None):
+        now = time.time() if now is None else now
+        index, elapsed = divmod(now, window)
+        base = 'ratelimit:' + ':'.join(key)
+        current, previous = self.client.mget(f"{base}:{index:.0f}", f"{base}:{index - 1:.0f}")
+        return max(int(limit - sliding_count(int(previous or 0), int(current or 0), elapsed, window)), 0)
+
+
+_local = SlidingWindowLimiter()
+_shared = None
+
+
+def _limiter():
+    global _shared
+    if _shared is None:
+        if REDIS_URL and redis is None:
+            logger.warning("RATE_LIMIT_REDIS_URL is set but redis is not installed; using local counters")
+        _shared = RedisLimiter(REDIS_URL) if REDIS_URL and redis is not None else _local
+    return _shared
+
+
+def client_ip():
+    """The client address, taking the entry our trusted proxies appended to X-Forwarded-For."""
+    forwarded = request.headers.get('X-Forwarded-For')
+    if forwarded and TRUSTED_PROXIES:
+        hops = [hop.strip() for hop in forwarded.split(',')]
+        return hops[max(len(hops) - TRUSTED_PROXIES, 0)]
+    return request.remote_addr or 'unknown'
+
+
+def client_identity():
+    """(kind, id, multiplier) for the requesting client."""
+    api_key = request.headers.get('X-API-Key')
+    if api_key and api_key in API_KEYS:
+        return 'key', api_key, API_KEY_MULTIPLIER
+    return 'ip', client_ip(), 1
+
+
+def remaining(limit_class):
+    """Requests the current client can still make in limit_class without being limited."""
+    kind, client, multiplier = client_identity()
+    limit, window = LIMITS[limit_class]
+    key = (limit_class, kind, client)
+    try:
+        return _limiter().peek(key, limit * multiplier, window)
+    except Exception:
+        return _local.peek(key, limit * multiplier, window)
+
+
+def check_request():
+    """before_request hook: reject over-limit clients with 429 and Retry-After."""
+    if not RATE_LIMIT_ENABLED or request.method == 'OPTIONS':
+        return None
+    limit_class = ENDPOINT_CLASSES.get(request.endpoint, 'light')
+    if limit_class is None:
+        return None
+    return check_class(limit_class)
+
+
+def check_class(limit_class):
+    """Count the current request against limit_class; a 429 response if the client is over it, else None."""
+    if not RATE_LIMIT_ENABLED:
+        return None
+    kind, client, multiplier = client_identity()
+    limit, window = LIMITS[limit_class]
+    key = (limit_class, kind, client)
+    try:
+        allowed, wait = _limiter().hit(key, limit * multiplier, window)
+    except Exception as e:
+        logger.warning(f"Shared rate limit counters unavailable ({e}); using local counters")
+        allowed, wait = _local.hit(key, limit * multiplier, window)
+    if allowed:
+        return None
+
+    metrics.inc('rate_limit_rejected_total', limit=limit_class, client=kind)
+    logger.info(f"Rate limited {kind} {client} on {limit_class} ({limit * multiplier}/{window}s)")
+    response = jsonify({'error': "Too many requests. Please slow down and try again shortly."})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(max(1, math.ceil(wait)))
+    return response
+
+
+def _collect():
+    with _local.lock:
+        return [('rate_limit_tracked_clients', {}, len(_local.entries))]
+
+
+metrics.register_collector(_collect)
@@ -0,0 +1,210 @@
+"""
+Response compression with a cache of compressed variants.
+
+Replaces Flask-Compress, which compressed every eligible response from
+scratch on every request. Register compress_response as an after_request hook:
+
+- only text-like media types are compressed; PDFs, images and other
+  already-compressed types, file responses (direct_passthrough), streamed
+  responses and anything that already has a Content-Encoding are left alone
+- the encoding is the best one the client accepts among zstd, br and gzip
+  (zstd and br only when their libraries are installed)
+- compressed bodies are kept in a small LRU keyed by (content hash, encoding),
+  so the same rendered page or JSON answer is compressed once per worker
+- bodies over LARGE_BYTES are compressed on a background thread; the request
+  is served uncompressed and later requests for the same content get the
+  cached variant (bodies too big for the cache are always sent uncompressed)
+
+Configuration (environment):
+    COMPRESS_CACHE_BYTES    LRU budget in bytes (default 16 MB)
+    COMPRESS_LARGE_BYTES    compress bodies larger than this off the request thread (default 256 KB)
+"""
+
+import gzip
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import request
+
+import metrics
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+MIN_BYTES = 500
+LARGE_BYTES = int(os.getenv('COMPRESS_LARGE_BYTES', 256 * 1024))
+CACHE_BYTES = int(os.getenv('COMPRESS_CACHE_BYTES', 16 * 1024 * 1024))
+MAX_ENTRY_BYTES = CACHE_BYTES // 8
+
+COMPRESSIBLE_TYPES = {
+    'application/json', 'application/javascript', 'application/xml',
+    'image/svg+xml', 'text/css', 'text/csv', 'text/html', 'text/javascript',
+    'text/markdown', 'text/plain', 'text/xml', 'text/calendar',
+}
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+ZSTD_LEVEL = 3
+
+
+def _gzip(data):
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def _brotli(data):
+    return brotli.compress(data, quality=BROTLI_QUALITY)
+
+
+_zstd_local = threading.local()
+
+
+def _zstd(data):
+    # ZstdCompressor instances are not thread-safe; keep one per thread
+    compressor = getattr(_zstd_local, 'compressor', None)
+    if compressor is None:
+        compressor = _zstd_local.compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+    return compressor.compress(data)
+
+
+# Preferred first
+CODECS = OrderedDict()
+if zstandard is not None:
+    CODECS['zstd'] = _zstd
+if brotli is not None:
+    CODECS['br'] = _brotli
+CODECS['gzip'] = _gzip
+
+
+class CompressionCache:
+    """Thread-safe LRU of compressed bodies bounded by total size."""
+
+    def __init__(self, max_bytes=CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.pending = set()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self.entries[key] = value
+            self.size += len(value)
+            while self.size > self.max_bytes and self.entries:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def claim(self, key):
+        """Mark key as being compressed; False if another thread already is."""
+        with self.lock:
+            if key in self.pending or key in self.entries:
+                return False
+            self.pending.add(key)
+            return True
+
+    def release(self, key):
+        with self.lock:
+            self.pending.discard(key)
+
+
+_cache = CompressionCache()
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='compress')
+
+
+def choose_encoding(accept_encodings):
+    """Best supported encoding the client accepts, or None."""
+    best, best_quality = None, 0
+    for encoding in CODECS:
+        quality = accept_encodings[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def _compress_in_background(key, encoding, data):
+    try:
+        compressed = CODECS[encoding](data)
+        if len(compressed) < len(data):
+            _cache.put(key, compressed)
+        metrics.inc('http_compression_background_total', encoding=encoding)
+    except Exception as e:
+        logger.warning(f"Background {encoding} compression failed: {e}")
+    finally:
+        _cache.release(key)
+
+
+def compress_response(response):
+    """after_request hook: compress eligible responses, reusing cached variants."""
+    if (response.direct_passthrough
+            or response.is_streamed
+            or response.status_code < 200 or response.status_code in (204, 304)
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_TYPES
+            or 'no-transform' in response.headers.get('Cache-Control', '')):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(request.accept_encodings)
+    data = response.get_data()
+    if encoding is None or len(data) < MIN_BYTES:
+        return response
+
+    key = (hashlib.blake2b(data, digest_size=16).digest(), encoding)
+    compressed = _cache.get(key)
+    if compressed is not None:
+        metrics.inc('http_compression_cache_total', result='hit')
+    elif len(data) > LARGE_BYTES:
+        # Serve this one as-is; the next request for the same content gets the cached variant
+        if len(data) <= MAX_ENTRY_BYTES and _cache.claim(key):
+            _executor.submit(_compress_in_background, key, encoding, data)
+        metrics.inc('http_compression_cache_total', result='deferred')
+        return response
+    else:
+        metrics.inc('http_compression_cache_total', result='miss')
+        compressed = CODECS[encoding](data)
+        if len(compressed) >= len(data):
+            return response
+        if len(data) <= MAX_ENTRY_BYTES:
+            _cache.put(key, compressed)
+
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    tag = response.get_etag()[0]
+    if tag:
+        # Same resource, different bytes: weak, as nginx does, so If-None-Match still matches
+        response.set_etag(tag, weak=True)
+    metrics.inc('http_compression_bytes_total', len(data), stage='in', encoding=encoding)
+    metrics.inc('http_compression_bytes_total', len(compressed), stage='out', encoding=encoding)
+    return response
+
+
+def _collect():
+    with _cache.lock:
+        return [
+            ('http_compression_cache_entries', {}, len(_cache.entries)),
+            ('http_compression_cache_bytes', {}, _cache.size),
+        ]
+
+
+metrics.register_collector(_collect)
@@ -0,0 +1,534 @@
+"""
+Cross-worker shared cache on a memory-mapped file.
+
+All gunicorn workers on a host map the same file (in /dev/shm by default), so
+a value cached by one worker is a hit for every other worker instead of being
+duplicated per process.
+
+File layout:
+
+    header (128 bytes)   magic, geometry, allocation pointer, counters
+    slot table           open-addressing hash table, SLOT.size bytes per slot
+    data region          key bytes followed by value bytes, appended in order
+
+Writes take an exclusive flock and readers a shared one, so a reader never sees
+a half-written entry. flock locks belong to an open file, so every thread opens
+its own descriptor and the flock alone serializes threads as well as
+processes. The value is written before its slot is published, and
+every slot carries a CRC of its value, so an entry torn by a crashed writer
+reads as a miss. When the data region or slot table fills up, expired
+entries and then the least recently used ones are dropped until the cache is
+back under COMPACT_TARGET of its budget, and the survivors are compacted to
+the front of the data region. Access times are updated under the shared lock,
+so the LRU order (and the hit/miss counters) are approximate.
+
+get_cache() returns the process-wide cache: a SharedCache, or a per-process
+LocalCache where fcntl/mmap are unavailable (Windows) or SHARED_CACHE=0.
+
+The file is only initialized when it holds no cache yet. A process whose
+SHARED_CACHE_BYTES gives a different geometry than the file's header must not
+resize a file other workers have mapped (they would die of SIGBUS), so it
+logs an error and uses a LocalCache instead. Give every process on a host the
+same SHARED_CACHE_BYTES, or a different SHARED_CACHE_PATH.
+
+The file lives in /dev/shm, a tmpfs that does not reserve its pages up front:
+a write past what the tmpfs can hold kills the writer with SIGBUS. Docker
+gives containers a 64 MB /dev/shm by default, so SHARED_CACHE_BYTES defaults
+to a quarter of the filesystem holding the cache, at most 32 MB (16 MB of data
+plus about 0.4 MB of slots on a stock container). A file that would not fit in
+the free space is not created; the process logs an error and uses a
+LocalCache. Raise --shm-size (or the tmpfs size) before raising
+SHARED_CACHE_BYTES.
+
+Configuration (environment):
+    SHARED_CACHE            1 (default) to use the shared file, 0 for per-process caches
+    SHARED_CACHE_PATH       backing file (default /dev/shm/meal-planner-cache)
+    SHARED_CACHE_BYTES      data region size in bytes (default a quarter of the
+                            cache's filesystem, at most 32 MB)
+
+Benchmark against per-process dicts:
+    python shared_cache.py --bench
+"""
+
+import argparse
+import errno
+import hashlib
+import logging
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows: get_cache() falls back to LocalCache
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+SHARED_CACHE = os.getenv('SHARED_CACHE', '1') == '1'
+_default_dir = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+SHARED_CACHE_PATH = os.getenv('SHARED_CACHE_PATH', os.path.join(_default_dir, 'meal-planner-cache'))
+MAX_DEFAULT_BYTES = 32 * 1024 * 1024
+SHM_SHARE = 0.25             # share of the cache's filesystem the default may take
+
+
+def _default_size(path):
+    """A quarter of the filesystem holding path, at most MAX_DEFAULT_BYTES."""
+    try:
+        total = shutil.disk_usage(os.path.dirname(path) or '.').total
+    except OSError:
+        return MAX_DEFAULT_BYTES
+    return max(1024 * 1024, min(MAX_DEFAULT_BYTES, int(total * SHM_SHARE)))
+
+
+SHARED_CACHE_BYTES = int(os.getenv('SHARED_CACHE_BYTES') or _default_size(SHARED_CACHE_PATH))
+
+MAGIC = b'MPCACHE1'
+VERSION = 1
+HEADER_SIZE = 128
+HEADER_FIELDS = ('data_end', 'live_bytes', 'count', 'hits', 'misses', 'sets', 'evictions', 'compactions')
+# magic, version, slot count, data size, then the u64 fields above
+HEADER = struct.Struct('<8sIIQ' + 'Q' * len(HEADER_FIELDS))
+_FIELD_OFFSET = {name: 24 + 8 * i for i, name in enumerate(HEADER_FIELDS)}
+_U64 = struct.Struct('<Q')
+
+# key hash, data offset, key length, value length, value crc32, unused, access time (ns), expiry (epoch s)
+SLOT = struct.Struct('<QQIIIIQd')
+EMPTY, TOMBSTONE = 0, 1
+
+BYTES_PER_SLOT = 2048        # slot table sized for entries averaging this size
+MAX_LOAD = 0.7               # slot table load factor that triggers eviction
+COMPACT_TARGET = 0.75        # evict down to this share of the data region / slot load
+MAX_VALUE_SHARE = 0.25       # larger values are not cached
+
+
+class GeometryMismatch(Exception):
+    """The cache file was created with a different geometry than this process's."""
+
+
+def _key_bytes(key):
+    return key.encode('utf-8') if isinstance(key, str) else bytes(key)
+
+
+def _hash(key):
+    # 0 and 1 mark empty and deleted slots
+    return max(2, int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'little'))
+
+
+class SharedCache:
+    """Byte-budgeted LRU cache shared by every process that maps the same file."""
+
+    def __init__(self, path=SHARED_CACHE_PATH, data_size=SHARED_CACHE_BYTES, slots=None):
+        self.path = path
+        self.data_size = data_size
+        self.slots = slots or max(1024, data_size // BYTES_PER_SLOT)
+        self.slot_start = HEADER_SIZE
+        self.data_start = HEADER_SIZE + self.slots * SLOT.size
+        self.file_size = self.data_start + data_size
+        self.max_value = int(data_size * MAX_VALUE_SHARE)
+        self._pid = None
+        self._mm = None
+        self._open_lock = threading.Lock()   # held only while mapping the file
+        # flock is per open file, so each thread locks through its own descriptor
+        self._local = threading.local()
+
+    # -- file and locking --------------------------------------------------
+
+    def _ensure_open(self):
+        """Map the file in this process; a forked worker must not share its parent's mapping or flocks."""
+        if self._pid == os.getpid():
+            return
+        with self._open_lock:
+            if self._pid != os.getpid():
+                self._mm = self._map()
+                self._pid = os.getpid()
+
+    def _map(self):
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            geometry = self._file_geometry(fd)
+            if geometry is None:
+                free = shutil.disk_usage(os.path.dirname(self.path) or '.').free
+                if free < self.file_size:
+                    # tmpfs would accept the truncate and SIGBUS a later write instead
+                    raise OSError(errno.ENOSPC, f"{self.file_size} bytes needed for the shared cache but only "
+                                                f"{free} free; lower SHARED_CACHE_BYTES or enlarge /dev/shm",
+                                  self.path)
+                logger.info(f"Initializing shared cache {self.path} ({self.file_size} bytes, {self.slots} slots)")
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, self.file_size)
+                mm = mmap.mmap(fd, self.file_size)
+                HEADER.pack_into(mm, 0, MAGIC, VERSION, self.slots, self.data_size, *([0] * len(HEADER_FIELDS)))
+                mm.close()
+            elif geometry != (VERSION, self.slots, self.data_size, self.file_size):
+                # Other processes may have it mapped: resizing it under them would SIGBUS them
+                raise GeometryMismatch(f"{self.path} is version {geometry[0]} with {geometry[1]} slots and "
+                                       f"{geometry[2]} data bytes ({geometry[3]} bytes on disk); this process "
+                                       f"expects version {VERSION}, {self.slots} slots and {self.data_size} bytes")
+            return mmap.mmap(fd, self.file_size)
+        finally:
+            # mmap keeps a dup of fd, so closing it alone would not release the flock
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def _file_geometry(self, fd):
+        """(version, slots, data size, file size) from the file's header, or None if it holds no cache."""
+        header = os.pread(fd, HEADER.size, 0)
+        if len(header) < HEADER.size:
+            return None
+        magic, version, slots, data_size = HEADER.unpack(header)[:4]
+        if magic != MAGIC:
+            return None
+        return version, slots, data_size, os.fstat(fd).st_size
+
+    def _thread_fd(self):
+        """This thread's descriptor for flock, opened on first use in each process."""
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            # A descriptor inherited across fork shares the parent's locks
+            local.fd = os.open(self.path, os.O_RDWR)
+            local.pid = os.getpid()
+        return local.fd
+
+    @contextmanager
+    def _locked(self, exclusive):
+        self._ensure_open()
+        fd = self._thread_fd()
+        fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield self._mm
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def _get_field(self, name):
+        return _U64.unpack_from(self._mm, _FIELD_OFFSET[name])[0]
+
+    def _set_field(self, name, value):
+        _U64.pack_into(self._mm, _FIELD_OFFSET[name], value)
+
+    def _add_field(self, name, delta):
+        self._set_field(name, self._get_field(name) + delta)
+
+    # -- slot table -----------------------------------------------------------
+
+    def _slot(self, i):
+        return SLOT.unpack_from(self._mm, self.slot_start + i * SLOT.size)
+
+    def _find(self, h, key):
+        """Index of the live slot holding key, or -1."""
+        mm = self._mm
+        i = h % self.slots
+        for _ in range(self.slots):
+            slot_h, offset, key_len, value_len = SLOT.unpack_from(mm, self.slot_start + i * SLOT.size)[:4]
+            if slot_h == EMPTY:
+                return -1
+            if slot_h == h and key_len == len(key) and offset + key_len + value_len <= self.data_size:
+                start = self.data_start + offset
+                if mm[start:start + key_len] == key:
+                    return i
+            i = (i + 1) % self.slots
+        return -1
+
+    def _insert_slot(self, h, *fields):
+        i = h % self.slots
+        while SLOT.unpack_from(self._mm, self.slot_start + i * SLOT.size)[0] > TOMBSTONE:
+            i = (i + 1) % self.slots
+        SLOT.pack_into(self._mm, self.slot_start + i * SLOT.size, h, *fields)
+
+    def _remove_slot(self, i):
+        _, _, key_len, value_len = self._slot(i)[:4]
+        _U64.pack_into(self._mm, self.slot_start + i * SLOT.size, TOMBSTONE)
+        self._add_field('live_bytes', -(key_len + value_len))
+        self._add_field('count', -1)
+
+    # -- eviction and compaction ------------------------------------------
+
+    def _make_room(self, need):
+        """Drop expired then least recently used entries, and compact the survivors."""
+        now = time.time()
+        live = []
+        for i in range(self.slots):
+            slot = self._slot(i)
+            if slot[0] > TOMBSTONE:
+                live.append(slot)
+        fresh = [s for s in live if not s[7] or s[7] > now]
+        fresh.sort(key=lambda s: s[6])  # oldest access first
+
+        byte_budget = self.data_size * COMPACT_TARGET - need
+        slot_budget = self.slots * MAX_LOAD * COMPACT_TARGET - 1
+        live_bytes = sum(s[2] + s[3] for s in fresh)
+        evicted = len(live) - len(fresh)
+        while fresh and (live_bytes > byte_budget or len(fresh) > slot_budget):
+            oldest = fresh.pop(0)
+            live_bytes -= oldest[2] + oldest[3]
+            evicted += 1
+
+        # Slide survivors to the front of the data region in offset order
+        mm = self._mm
+        mm[self.slot_start:self.data_start] = bytes(self.data_start - self.slot_start)
+        end = 0
+        for h, offset, key_len, value_len, crc, unused, atime, expires in sorted(fresh, key=lambda s: s[1]):
+            size = key_len + value_len
+            if offset != end:
+                mm.move(self.data_start + end, self.data_start + offset, size)
+            self._insert_slot(h, end, key_len, value_len, crc, unused, atime, expires)
+            end += size
+
+        self._set_field('data_end', end)
+        self._set_field('live_bytes', end)
+        self._set_field('count', len(fresh))
+        self._add_field('evictions', evicted)
+        self._add_field('compactions', 1)
+
+    # -- public API ---------------------------------------------------------
+
+    def get(self, key):
+        """Cached bytes for key, or None."""
+        key = _key_bytes(key)
+        h = _hash(key)
+        with self._locked(exclusive=False) as mm:
+            i = self._find(h, key)
+            value = None
+            if i >= 0:
+                _, offset, key_len, value_len, crc, _, _, expires = self._slot(i)
+                if not expires or expires > time.time():
+                    start = self.data_start + offset + key_len
+                    value = mm[start:start + value_len]
+                    if zlib.crc32(value) != crc:
+                        value = None
+                    else:
+                        _U64.pack_into(mm, self.slot_start + i * SLOT.size + 32, time.monotonic_ns())
+            self._add_field('hits' if value is not None else 'misses', 1)
+            return value
+
+    def set(self, key, value, ttl=None):
+        """Store value (bytes) under key; returns False if it is too large to cache."""
+        key = _key_bytes(key)
+        value = bytes(value)
+        need = len(key) + len(value)
+        if need > self.max_value:
+            return False
+        h = _hash(key)
+        expires = time.time() + ttl if ttl else 0.0
+        with self._locked(exclusive=True) as mm:
+            i = self._find(h, key)
+            if i >= 0:
+                self._remove_slot(i)
+            if (self._get_field('data_end') + need > self.data_size
+                    or self._get_field('count') + 1 > self.slots * MAX_LOAD):
+                self._make_room(need)
+
+            offset = self._get_field('data_end')
+            start = self.data_start + offset
+            mm[start:start + len(key)] = key
+            mm[start + len(key):start + need] = value
+            # Publish only after the data is in place
+            self._insert_slot(h, offset, len(key), len(value), zlib.crc32(value), 0, time.monotonic_ns(), expires)
+            self._set_field('data_end', offset + need)
+            self._add_field('live_bytes', need)
+            self._add_field('count', 1)
+            self._add_field('sets', 1)
+        return True
+
+    def delete(self, key):
+        key = _key_bytes(key)
+        with self._locked(exclusive=True):
+            i = self._find(_hash(key), key)
+            if i >= 0:
+                self._remove_slot(i)
+
+    def clear(self):
+        with self._locked(exclusive=True) as mm:
+            mm[self.slot_start:self.data_start] = bytes(self.data_start - self.slot_start)
+            for name in ('data_end', 'live_bytes', 'count'):
+                self._set_field(name, 0)
+
+    def stats(self):
+        with self._locked(exclusive=False):
+            stats = {name: self._get_field(name) for name in HEADER_FIELDS}
+        stats.update(backend='shared', path=self.path, data_size=self.data_size, slots=self.slots)
+        return stats
+
+
+class LocalCache:
+    """Per-process LRU with the same interface, for platforms without fcntl/mmap."""
+
+    def __init__(self, data_size=SHARED_CACHE_BYTES):
+        self.data_size = data_size
+        self.max_value = int(data_size * MAX_VALUE_SHARE)
+        self.entries = OrderedDict()
+        self.size = 0
+        self.counters = dict.fromkeys(('hits', 'misses', 'sets', 'evictions'), 0)
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and (not entry[1] or entry[1] > time.time()):
+                self.entries.move_to_end(key)
+                self.counters['hits'] += 1
+                return entry[0]
+            self.counters['misses'] += 1
+            return None
+
+    def set(self, key, value, ttl=None):
+        value = bytes(value)
+        if len(value) > self.max_value:
+            return False
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old[0])
+            self.entries[key] = (value, time.time() + ttl if ttl else 0.0)
+            self.size += len(value)
+            self.counters['sets'] += 1
+            while self.size > self.data_size:
+                _, (evicted, _) = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.counters['evictions'] += 1
+        return True
+
+    def delete(self, key):
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old[0])
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters, backend='local', count=len(self.entries), live_bytes=self.size)
+
+
+_cache = None
+
+
+def get_cache():
+    """Return the process-wide cache (created on first use)."""
+    global _cache
+    if _cache is None:
+        if SHARED_CACHE and fcntl is not None:
+            _cache = SharedCache()
+            try:
+                _cache._ensure_open()
+            except (GeometryMismatch, OSError) as e:
+                logger.error(f"Shared cache disabled in this process, using a per-process cache: {e}")
+                _cache = LocalCache()
+        else:
+            _cache = LocalCache()
+        logger.info(f"Cache backend: {type(_cache).__name__}")
+    return _cache
+
+
+def _collect():
+    if _cache is None:
+        return []
+    stats = _cache.stats()
+    labels = {'backend': stats['backend']}
+    return [
+        ('shared_cache_entries', labels, stats['count']),
+        ('shared_cache_bytes', labels, stats['live_bytes']),
+        ('shared_cache_evictions_total', labels, stats['evictions']),
+        ('shared_cache_lookups_total', dict(labels, result='hit'), stats['hits']),
+        ('shared_cache_lookups_total', dict(labels, result='miss'), stats['misses']),
+    ]
+
+
+metrics.register_collector(_collect)
+
+
+def _time_ops(cache, keys, values, rounds):
+    start = time.perf_counter()
+    for key, value in zip(keys, values):
+        cache.set(key, value)
+    set_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for key in keys:
+            cache.get(key)
+    get_time = time.perf_counter() - start
+    return set_time / len(keys), get_time / (rounds * len(keys))
+
+
+class _DictCache(dict):
+    """Plain per-process dict, the baseline."""
+
+    def set(self, key, value, ttl=None):
+        self[key] = value
+
+
+def _worker_hit_rate(path, seed, requests, keys, value):
+    """One simulated worker: Zipf-distributed lookups, computing and storing on a miss."""
+    import random
+    cache = SharedCache(path, data_size=64 * 1024 * 1024) if path else LocalCache()
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(keys)]
+    hits = 0
+    for key in rng.choices(range(keys), weights, k=requests):
+        if cache.get(f"item:{key}") is not None:
+            hits += 1
+        else:
+            cache.set(f"item:{key}", value)
+    return hits
+
+
+def benchmark(workers=4):
+    """Compare per-operation latency and cross-worker hit rate with per-process dicts."""
+    import multiprocessing
+    path = os.path.join(tempfile.gettempdir(), f"shared-cache-bench-{os.getpid()}")
+    try:
+        for size in (1024, 64 * 1024):
+            keys = [f"key:{i}" for i in range(500)]
+            values = [os.urandom(size) for _ in keys]
+            for name, cache in (('dict', _DictCache()),
+                                ('LocalCache', LocalCache()),
+                                ('SharedCache', SharedCache(path, data_size=64 * 1024 * 1024))):
+                set_time, get_time = _time_ops(cache, keys, values, rounds=20)
+                print(f"{name:12s} {size // 1024:3d} KB values: set {set_time * 1e6:6.1f} us, "
+                      f"get {get_time * 1e6:6.1f} us")
+
+        # Every worker sees the same popular items; per-process caches each have to compute them
+        requests, keys, value = 5000, 2000, os.urandom(4096)
+        ctx = multiprocessing.get_context('fork')
+        SharedCache(path, data_size=64 * 1024 * 1024).clear()
+        for name, backend_path in (('per-process', None), ('shared', path)):
+            with ctx.Pool(workers) as pool:
+                hits = pool.starmap(_worker_hit_rate,
+                                    [(backend_path, seed, requests, keys, value) for seed in range(workers)])
+            print(f"{workers} workers, {name:11s} cache: hit rate {sum(hits) / (workers * requests):.1%}")
+    finally:
+        os.unlink(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cross-worker shared cache")
+    parser.add_argument('--bench', action='store_true', help="benchmark against per-process dicts")
+    parser.add_argument('--stats', action='store_true', help="print the shared cache's counters")
+    args = parser.parse_args()
+
+    if args.bench:
+        benchmark()
+    elif args.stats:
+        for name, value in get_cache().stats().items():
+            print(f"{name}: {value}")
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    main()
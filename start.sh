@@ -1,4 +1,5 @@
 #!/bin/bash
 
-# Start the Meal Planner Chatbot
+# Build fingerprinted static assets, then start the Meal Planner Chatbot
+python assets.py build
 python Meal_Planner_Chatbot.py
\ No newline at end of file
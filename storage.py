@@ -0,0 +1,292 @@
+"""
+Object storage for generated PDFs and the content they are rendered from.
+
+PDFs used to live only in /tmp/meal-pdfs on whichever replica rendered them,
+so a /download that landed on another replica returned 404. Every render now
+goes through a storage driver:
+
+- LocalStorage: files on the local filesystem (default, single instance)
+- S3Storage: any S3-compatible bucket (AWS S3, MinIO, R2, ...). Uploads are
+  streamed from disk in multipart chunks and downloads are served as
+  presigned redirects, so the app never proxies PDF bytes.
+
+Besides rendered files, both drivers keep small objects (save_bytes /
+load_bytes): the content records exporters.py renders downloads from.
+
+Configuration (environment):
+    PDF_STORAGE_BACKEND   'local' (default) or 's3'
+    PDF_LOCAL_DIR         local driver directory (default /tmp/meal-pdfs)
+    S3_BUCKET             bucket name (required for s3)
+    S3_PREFIX             key prefix (default 'pdfs/')
+    S3_ENDPOINT_URL       custom endpoint, e.g. http://localhost:9000 for MinIO
+    S3_REGION             region name (default us-east-1)
+    S3_URL_EXPIRY         presigned URL lifetime in seconds (default 3600)
+AWS credentials are read by boto3 the usual way (AWS_ACCESS_KEY_ID, ...).
+
+Check the S3 driver (multipart upload, small objects, path-style presigned
+URLs) against S3_ENDPOINT_URL and S3_BUCKET, e.g. a local MinIO:
+    docker run -p 9000:9000 -e MINIO_ROOT_USER=minio -e MINIO_ROOT_PASSWORD=minio123 minio/minio server /data
+    AWS_ACCESS_KEY_ID=minio AWS_SECRET_ACCESS_KEY=minio123 \
+        S3_ENDPOINT_URL=http://localhost:9000 S3_BUCKET=meal-check python storage.py --check
+Without S3_ENDPOINT_URL it runs against moto's in-process S3
+(pip install -r requirements-dev.txt).
+The bucket is created if missing and the check's objects are deleted afterwards.
+"""
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import urllib.request
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOCAL_DIR = "/tmp/meal-pdfs"
+
+# Multipart upload tuning: parts are streamed from disk, never fully buffered
+MULTIPART_THRESHOLD = 8 * 1024 * 1024
+MULTIPART_CHUNKSIZE = 8 * 1024 * 1024
+
+
+class LocalStorage:
+    """Store files in a local directory."""
+
+    def __init__(self, root=DEFAULT_LOCAL_DIR):
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+
+    def scratch_path(self, key):
+        """Path to render into; for local storage this is the final location."""
+        return os.path.join(self.root, key)
+
+    def save_file(self, key, path):
+        """Persist a rendered file under key."""
+        final_path = os.path.join(self.root, key)
+        if os.path.abspath(path) != os.path.abspath(final_path):
+            os.replace(path, final_path)
+        return key
+
+    def save_bytes(self, key, data, content_type=None):
+        """Persist a small object (written to a temporary name first, so readers never see half of it)."""
+        final_path = os.path.join(self.root, key)
+        tmp_path = f"{final_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, final_path)
+        return key
+
+    def load_bytes(self, key):
+        """Contents of a stored object, or None if there is none."""
+        try:
+            with open(os.path.join(self.root, key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def exists(self, key):
+        return os.path.exists(os.path.join(self.root, key))
+
+    def download_url(self, key):
+        """Local files are served by the app itself, so there is no external URL."""
+        return None
+
+
+class S3Storage:
+    """Store files in an S3-compatible bucket."""
+
+    def __init__(self, bucket, prefix="pdfs/", endpoint_url=None, region=None, url_expiry=3600):
+        import boto3
+        from boto3.s3.transfer import TransferConfig
+        from botocore.config import Config
+
+        self.bucket = bucket
+        self.prefix = prefix
+        self.url_expiry = url_expiry
+        self.scratch_dir = tempfile.mkdtemp(prefix="meal-pdfs-")
+
+        # Path-style addressing keeps MinIO and other self-hosted endpoints happy
+        client_config = Config(s3={'addressing_style': 'path'} if endpoint_url else {})
+        self.client = boto3.client(
+            's3',
+            endpoint_url=endpoint_url,
+            region_name=region,
+            config=client_config,
+        )
+        self.transfer_config = TransferConfig(
+            multipart_threshold=MULTIPART_THRESHOLD,
+            multipart_chunksize=MULTIPART_CHUNKSIZE,
+            use_threads=False,
+        )
+
+    def _key(self, key):
+        return f"{self.prefix}{key}"
+
+    def scratch_path(self, key):
+        """Temporary local path to render into before upload."""
+        return os.path.join(self.scratch_dir, key)
+
+    def save_file(self, key, path):
+        """Stream a local file to the bucket, then remove the local copy."""
+        try:
+            with open(path, 'rb') as f:
+                self.client.upload_fileobj(
+                    f, self.bucket, self._key(key),
+                    ExtraArgs={'ContentType': 'application/pdf'},
+                    Config=self.transfer_config,
+                )
+        finally:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        logger.info(f"Uploaded s3://{self.bucket}/{self._key(key)}")
+        return key
+
+    def save_bytes(self, key, data, content_type='application/octet-stream'):
+        """Upload a small object in one request."""
+        self.client.put_object(Bucket=self.bucket, Key=self._key(key), Body=data, ContentType=content_type)
+        return key
+
+    def load_bytes(self, key):
+        """Contents of a stored object, or None if there is none."""
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self._key(key))['Body'].read()
+        except self.client.exceptions.NoSuchKey:
+            return None
+
+    def exists(self, key):
+        from botocore.exceptions import ClientError
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+            return True
+        except ClientError:
+            return False
+
+    def download_url(self, key):
+        """Presigned GET URL that makes the browser download the file."""
+        return self.client.generate_presigned_url(
+            'get_object',
+            Params={
+                'Bucket': self.bucket,
+                'Key': self._key(key),
+                'ResponseContentDisposition': f'attachment; filename="{key}"',
+            },
+            ExpiresIn=self.url_expiry,
+        )
+
+
+_storage = None
+
+
+def get_storage():
+    """Return the configured storage driver (created once per process)."""
+    global _storage
+    if _storage is None:
+        backend = os.getenv('PDF_STORAGE_BACKEND', 'local').lower()
+        if backend == 's3':
+            bucket = os.getenv('S3_BUCKET')
+            if not bucket:
+                raise RuntimeError("PDF_STORAGE_BACKEND=s3 requires S3_BUCKET")
+            _storage = S3Storage(
+                bucket,
+                prefix=os.getenv('S3_PREFIX', 'pdfs/'),
+                endpoint_url=os.getenv('S3_ENDPOINT_URL') or None,
+                region=os.getenv('S3_REGION', 'us-east-1'),
+                url_expiry=int(os.getenv('S3_URL_EXPIRY', 3600)),
+            )
+        else:
+            _storage = LocalStorage(os.getenv('PDF_LOCAL_DIR', DEFAULT_LOCAL_DIR))
+        logger.info(f"PDF storage backend: {type(_storage).__name__}")
+    return _storage
+
+
+CHECK_ENDPOINT = 'http://minio.check:9000'  # stand-in endpoint moto serves, so addressing is path-style
+
+
+def _check_s3(endpoint_url, bucket, live):
+    """Exercise S3Storage against a bucket; fetches presigned URLs over HTTP only when live."""
+    from botocore.exceptions import ClientError
+
+    storage = S3Storage(bucket, prefix=f"check-{os.getpid()}/", endpoint_url=endpoint_url,
+                        region=os.getenv('S3_REGION', 'us-east-1'), url_expiry=60)
+    client = storage.client
+    try:
+        client.head_bucket(Bucket=bucket)
+    except ClientError:
+        client.create_bucket(Bucket=bucket)
+
+    results = []
+
+    def report(name, ok):
+        print(f"{name:26s} {'ok' if ok else 'FAILED'}")
+        results.append(ok)
+
+    # Just over the threshold: two parts, streamed from the scratch file
+    data = os.urandom(MULTIPART_THRESHOLD + MULTIPART_CHUNKSIZE // 2)
+    path = storage.scratch_path('check.pdf')
+    with open(path, 'wb') as f:
+        f.write(data)
+    try:
+        storage.save_file('check.pdf', path)
+        head = client.head_object(Bucket=bucket, Key=storage._key('check.pdf'))
+        # Multipart ETags are "<md5 of part md5s>-<part count>"
+        report('multipart upload', head['ContentLength'] == len(data) and head['ETag'].strip('"').endswith('-2'))
+        report('scratch file removed', not os.path.exists(path))
+        report('load_bytes', storage.load_bytes('check.pdf') == data)
+
+        storage.save_bytes('check.json', b'{"ok": true}', content_type='application/json')
+        report('small object', storage.exists('check.json') and storage.load_bytes('check.json') == b'{"ok": true}')
+        report('missing object', storage.load_bytes('missing.pdf') is None and not storage.exists('missing.pdf'))
+
+        url = storage.download_url('check.pdf')
+        report('path-style presigned URL', url.startswith(f"{endpoint_url.rstrip('/')}/{bucket}/{storage._key('check.pdf')}?")
+               and 'response-content-disposition=attachment' in url)
+        if live:
+            with urllib.request.urlopen(url, timeout=30) as response:
+                report('presigned download', response.read() == data
+                       and response.headers.get('Content-Disposition', '').startswith('attachment'))
+    finally:
+        for key in ('check.pdf', 'check.json'):
+            try:
+                client.delete_object(Bucket=bucket, Key=storage._key(key))
+            except ClientError:
+                pass
+    return all(results)
+
+
+def check():
+    """Run the S3 driver against S3_ENDPOINT_URL / S3_BUCKET, or moto when no endpoint is set; False on failure."""
+    endpoint_url = os.getenv('S3_ENDPOINT_URL')
+    if endpoint_url:
+        bucket = os.getenv('S3_BUCKET')
+        if not bucket:
+            print("S3_ENDPOINT_URL is set but S3_BUCKET is not")
+            return False
+        print(f"S3Storage against {endpoint_url}, bucket {bucket}")
+        return _check_s3(endpoint_url, bucket, live=True)
+    try:
+        from moto import mock_aws
+    except ImportError:
+        print('Set S3_ENDPOINT_URL and S3_BUCKET (e.g. a local MinIO) or install "moto[s3]"')
+        return False
+    for name in ('AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY'):
+        os.environ.setdefault(name, 'check')
+    os.environ['MOTO_S3_CUSTOM_ENDPOINTS'] = CHECK_ENDPOINT
+    print(f"S3Storage against moto at {CHECK_ENDPOINT}")
+    with mock_aws():
+        return _check_s3(CHECK_ENDPOINT, 'meal-pdfs-check', live=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PDF storage drivers")
+    parser.add_argument('--check', action='store_true', help="exercise the S3 driver against MinIO or moto")
+    args = parser.parse_args()
+    if args.check:
+        sys.exit(0 if check() else 1)
+    print(f"Backend: {type(get_storage()).__name__}")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
@@ -111,9 +111,10 @@ add_action('wp_footer', function() {
         </div>
         <button id="meal-chat-close" onclick="toggleMealChat()">×</button>
     </div>
+    <!-- The app is only loaded when the visitor first opens the chat -->
     <iframe 
         id="meal-chat-iframe"
-        src="https://meal-planner-chatbot-production.up.railway.app"
+        data-src="https://meal-planner-chatbot-production.up.railway.app"
         title="Meal Planner Chat">
     </iframe>
 </div>
@@ -121,9 +122,22 @@ add_action('wp_footer', function() {
 <script>
 function toggleMealChat() {
     const container = document.getElementById('meal-chat-container');
-    const button = document.getElementById('meal-chat-button');
+    const iframe = document.getElementById('meal-chat-iframe');
+    if (!iframe.src) {
+        iframe.src = iframe.dataset.src;
+    }
     container.classList.toggle('open');
 }
+
+// Warm up the connection when the visitor shows intent, before the click
+document.getElementById('meal-chat-button').addEventListener('pointerenter', function() {
+    if (document.getElementById('meal-chat-preconnect')) return;
+    const link = document.createElement('link');
+    link.id = 'meal-chat-preconnect';
+    link.rel = 'preconnect';
+    link.href = document.getElementById('meal-chat-iframe').dataset.src;
+    document.head.appendChild(link);
+}, { once: true });
 </script>
 <?php
 }, 999);
\ No newline at end of file
@@ -0,0 +1,161 @@
+const messagesContainer = document.getElementById('messages');
+const userInput = document.getElementById('userInput');
+const sendBtn = document.getElementById('sendBtn');
+
+// Lets the server connect follow-ups ("grocery list", "day 2 dinner") to the plan they refer to
+const sessionId = sessionStorage.getItem('mealPlannerSession') || (() => {
+    const id = (crypto.randomUUID ? crypto.randomUUID() : String(Date.now()) + Math.random().toString(16).slice(2));
+    sessionStorage.setItem('mealPlannerSession', id);
+    return id;
+})();
+
+// Formats offered under an answer besides the PDF (see exporters.py)
+const EXPORT_LINKS = [
+    ['html', '🌐 View page'],
+    ['ics', '📅 Add to calendar'],
+];
+
+function addMessage(text, isUser, pdfUrl = null, exports = null) {
+    const messageDiv = document.createElement('div');
+    messageDiv.className = `message ${isUser ? 'user' : 'bot'}`;
+
+    const avatar = document.createElement('div');
+    avatar.className = 'message-avatar';
+    avatar.textContent = isUser ? '👤' : '🥗';
+
+    const content = document.createElement('div');
+    content.className = 'message-content';
+    content.innerHTML = text.replace(/\n/g, '<br>');
+
+    if (pdfUrl) {
+        const downloadLink = document.createElement('a');
+        downloadLink.href = pdfUrl;
+        downloadLink.className = 'pdf-download';
+        downloadLink.innerHTML = '📄 Download PDF';
+        downloadLink.target = '_blank';
+        content.appendChild(downloadLink);
+    }
+
+    if (exports) {
+        for (const [format, label] of EXPORT_LINKS) {
+            if (!exports[format]) continue;
+            const link = document.createElement('a');
+            link.href = exports[format];
+            link.className = 'pdf-download export-link';
+            link.textContent = label;
+            link.target = '_blank';
+            content.appendChild(link);
+        }
+    }
+
+    messageDiv.appendChild(avatar);
+    messageDiv.appendChild(content);
+    messagesContainer.appendChild(messageDiv);
+
+    messagesContainer.scrollTop = messagesContainer.scrollHeight;
+}
+
+function showTyping() {
+    const typingDiv = document.createElement('div');
+    typingDiv.className = 'message bot';
+    typingDiv.id = 'typing-indicator';
+
+    const avatar = document.createElement('div');
+    avatar.className = 'message-avatar';
+    avatar.textContent = '🥗';
+
+    const content = document.createElement('div');
+    content.className = 'message-content typing';
+    content.innerHTML = '<div class="typing-indicator"><span></span><span></span><span></span></div>';
+
+    typingDiv.appendChild(avatar);
+    typingDiv.appendChild(content);
+    messagesContainer.appendChild(typingDiv);
+
+    messagesContainer.scrollTop = messagesContainer.scrollHeight;
+}
+
+function hideTyping() {
+    const typingIndicator = document.getElementById('typing-indicator');
+    if (typingIndicator) {
+        typingIndicator.remove();
+    }
+}
+
+async function sendMessage() {
+    const message = userInput.value.trim();
+    if (!message) return;
+
+    addMessage(message, true);
+    userInput.value = '';
+    sendBtn.disabled = true;
+
+    showTyping();
+
+    try {
+        const response = await fetch('/chat', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'X-Session-Id': sessionId
+            },
+            body: JSON.stringify({ message })
+        });
+
+        let data = await response.json();
+
+        if (response.status === 202 && data.job_url) {
+            hideTyping();
+            addMessage(data.response, false);
+            showTyping();
+            data = await pollJob(data.job_url);
+        }
+
+        hideTyping();
+
+        if (data.error) {
+            addMessage('Sorry, there was an error: ' + data.error, false);
+        } else {
+            const responseText = data.response + (data.content ? '\n\n' + data.content : '');
+            addMessage(responseText, false, data.pdf_url, data.exports);
+        }
+    } catch (error) {
+        hideTyping();
+        addMessage('Sorry, there was an error connecting to the server.', false);
+        console.error('Error:', error);
+    }
+
+    sendBtn.disabled = false;
+    userInput.focus();
+}
+
+// Long meal plans are queued on the server (202 + job_url); poll until the job is done
+const JOB_POLL_MS = 1500;
+const JOB_MAX_WAIT_MS = 5 * 60 * 1000;
+
+async function pollJob(jobUrl) {
+    const deadline = Date.now() + JOB_MAX_WAIT_MS;
+    while (Date.now() < deadline) {
+        await new Promise(resolve => setTimeout(resolve, JOB_POLL_MS));
+        const response = await fetch(jobUrl);
+        if (!response.ok) throw new Error('job status ' + response.status);
+        const job = await response.json();
+        if (job.status === 'done') return job.result;
+        if (job.status === 'failed') return { error: job.error || 'generation failed' };
+    }
+    return { error: 'this is taking longer than expected. Please try again in a few minutes.' };
+}
+
+function sendQuickAction(text) {
+    userInput.value = text;
+    sendMessage();
+}
+
+function handleKeyPress(event) {
+    if (event.key === 'Enter') {
+        sendMessage();
+    }
+}
+
+// Focus input on load
+userInput.focus();